@@ -0,0 +1,245 @@
+import asyncio
+import os
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from case_parser import make_soup
+from rate_control import HostControl, HostRateControl
+from scraper import AJAX_ACTIONS, ECourtsScraper
+from telemetry import log, span
+
+
+def is_congestion(error: BaseException) -> bool:
+    """Timeouts, connection failures, 5xx and 429 mean the host is overloaded"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500 or error.response.status_code == 429
+    return isinstance(error, (httpx.TimeoutException, httpx.TransportError))
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """
+    Hands a client's requests to the engine's transport. Closing the client
+    closes this wrapper only; the transport and its connections outlive it
+    and are closed with the engine.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+
+class AsyncHTTPEngine:
+    """
+    Process-wide pooled HTTP transport for async scrapers.
+
+    Every AsyncECourtsScraper gets its own httpx.AsyncClient (and therefore
+    its own cookie jar), but all clients share one transport so keep-alive
+    connections are reused across sessions. Requests to each court host
+    share a rate limit and an adaptive concurrency limit (rate_control.py)
+    that backs off when the host times out or errors.
+    """
+
+    def __init__(self, max_connections: int = 100, max_per_host: int = 4, timeout: float = 15,
+                 rate_control: Optional[HostRateControl] = None):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.rate_control = rate_control or HostRateControl(max_concurrency=max_per_host)
+
+    def new_client(self) -> httpx.AsyncClient:
+        return httpx.AsyncClient(transport=SharedTransport(self.transport), timeout=self.timeout, follow_redirects=True)
+
+    def host_control(self, url: str) -> HostControl:
+        return self.rate_control.get(urlsplit(url).netloc)
+
+    def get_stats(self):
+        return self.rate_control.stats()
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+_default_engine: Optional[AsyncHTTPEngine] = None
+
+
+def get_default_engine() -> AsyncHTTPEngine:
+    global _default_engine
+    if _default_engine is None:
+        max_per_host = int(os.getenv('HTTP_MAX_CONNECTIONS_PER_HOST', '4'))
+        _default_engine = AsyncHTTPEngine(
+            max_connections=int(os.getenv('HTTP_MAX_CONNECTIONS', '100')),
+            max_per_host=max_per_host,
+            rate_control=HostRateControl(
+                rate=float(os.getenv('HTTP_RATE_PER_HOST', '4')),
+                burst=float(os.getenv('HTTP_RATE_BURST', '8')),
+                initial_concurrency=min(2, max_per_host),
+                max_concurrency=max_per_host,
+                latency_target=float(os.getenv('HTTP_LATENCY_TARGET', '3'))
+            )
+        )
+    return _default_engine
+
+
+class AsyncECourtsScraper(ECourtsScraper):
+    """
+    Async counterpart of ECourtsScraper on a pooled httpx client.
+
+    Request building and response parsing are inherited from ECourtsScraper;
+    only the transport and the public flow methods are async here.
+    """
+
+    def __init__(self, district_court_url, engine: Optional[AsyncHTTPEngine] = None):
+        super().__init__(district_court_url)
+        self.engine = engine or get_default_engine()
+        self.session = self.engine.new_client()
+        self._reinit_lock = asyncio.Lock()
+
+    async def _fetch_page_content(self, url, headers=None, data=None):
+        """
+        Helper to fetch a page and handle potential errors.
+        Uses POST if data is provided, otherwise GET.
+        """
+        try:
+            async with self.engine.host_control(url).request(is_congestion):
+                if data:
+                    response = await self.session.post(url, data=data, headers=headers)
+                else:
+                    response = await self.session.get(url, headers=headers)
+                response.raise_for_status()
+            return response
+        except httpx.HTTPError as e:
+            log('fetch_failed', level='warning', host=self.host, url=url.split('?', 1)[0], error=str(e))
+            return None
+
+    async def reinitialize(self, generation=None):
+        """Async version of ECourtsScraper.reinitialize."""
+        async with self._reinit_lock:
+            if generation is not None and generation != self.generation:
+                return True
+            log('session_reinitialized', host=self.host, generation=self.generation)
+            self.session.cookies.clear()
+            self.reinit_count += 1
+            return await self.initialize_session()
+
+    async def ajax(self, action: str, headers=None, **fields):
+        """Async version of ECourtsScraper.ajax."""
+        generation = self.generation
+        payload = self._ajax_payload(action, fields)
+        with span(AJAX_ACTIONS[action].stage, self.host) as stage:
+            response = await self._fetch_page_content(self.ajax_url, headers=headers or self.ajax_headers, data=payload)
+            if (response is not None and AJAX_ACTIONS[action].retry_expired
+                    and self._is_expired_response(response) and await self.reinitialize(generation)):
+                stage.set(reinitialized=True)
+                response = await self._fetch_page_content(
+                    self.ajax_url, headers=headers or self.ajax_headers, data=self._ajax_payload(action, fields)
+                )
+            if response is not None and AJAX_ACTIONS[action].retry_expired and self._is_expired_response(response):
+                # Still expired: the session could not be renewed or the court keeps rejecting it
+                stage.set('expired')
+                response = None
+            elif response is None:
+                stage.set('error')
+        return response
+
+    async def initialize_session(self):
+        """Async version of ECourtsScraper.initialize_session."""
+        log('session_initializing', level='debug', host=self.host)
+
+        with span('page_load', self.host) as stage:
+            response = await self._fetch_page_content(self.search_url, headers=self.page_headers)
+            if not response:
+                stage.set('error')
+        if not response:
+            return False
+
+        soup = make_soup(response.text)
+        if not self._extract_dynamic_tokens(soup):
+            return False
+
+        cookie_response = await self.ajax('s3waas_pll_lang_cookie', time=int(time.time()), lang='en')
+        if not cookie_response:
+            log('session_cookie_failed', level='warning', host=self.host)
+            return False
+
+        return self._finish_initialization(soup)
+
+    async def get_captcha_image(self):
+        """Fetches the CAPTCHA image and returns its binary content."""
+        if not self.captcha_url:
+            log('session_not_initialized', level='warning', host=self.host)
+            return None
+
+        with span('captcha_fetch', self.host) as stage:
+            response = await self._fetch_page_content(self.captcha_url)
+            if not response:
+                stage.set('error')
+        if response:
+            return response.content
+        return None
+
+    async def get_case_types(self, court_complex_code):
+        """Async version of ECourtsScraper.get_case_types."""
+        log('case_types_fetching', level='debug', host=self.host, court_complex=court_complex_code)
+        response = await self.ajax('get_case_types', est_code=court_complex_code, service_type='courtComplex', es_ajax_request='1')
+        if not response:
+            log('case_types_failed', level='warning', host=self.host, court_complex=court_complex_code)
+            return {}
+
+        return self._parse_case_types(response)
+
+    async def submit_search(self, case_type_code, case_number, year, captcha_value, court_complex_code):
+        """Async version of ECourtsScraper.submit_search."""
+        log('search_submitting', level='debug', host=self.host, case_type=case_type_code, case_number=case_number, year=year)
+
+        response = await self.ajax('get_cases', **self._search_fields(case_type_code, case_number, year, captcha_value, court_complex_code))
+        return self._parse_search_response(response)
+
+    async def find_case_cino(self, case_type_code, case_number, year, captcha_value, court_complex_code):
+        """Async version of ECourtsScraper.find_case_cino."""
+        result = await self.submit_search(case_type_code, case_number, year, captcha_value, court_complex_code)
+        return result.cino
+
+    async def search_case_by_number(self, case_type_code, case_number, year, captcha_value, court_complex_code):
+        """Async version of ECourtsScraper.search_case_by_number."""
+        cino = await self.find_case_cino(case_type_code, case_number, year, captcha_value, court_complex_code)
+        if not cino:
+            return None
+
+        return await self.get_case_details(cino)
+
+    async def get_case_details(self, cino, headers=None):
+        """Async version of ECourtsScraper.get_case_details."""
+        log('case_details_fetching', level='debug', host=self.host, cino=cino)
+
+        case_details_response = await self.ajax('get_cnr_details', headers=headers, cino=cino, es_ajax_request='1')
+        if not case_details_response:
+            log('case_details_failed', level='warning', host=self.host, cino=cino)
+            return None
+
+        return self._parse_case_details(case_details_response, cino)
+
+    async def get_many_case_details(self, cinos):
+        """
+        Fetches details for several CNRs on this session concurrently; the
+        engine's per-host controls bound how many are in flight.
+        Returns {cino: case details or None}.
+        """
+        results = await asyncio.gather(*(self.get_case_details(cino) for cino in cinos))
+        return dict(zip(cinos, results))
+
+    async def aclose(self):
+        """
+        Closes the scraper's client. Its connections belong to the engine's
+        shared transport, which stays open for the other sessions.
+        """
+        await self.session.aclose()
@@ -0,0 +1,246 @@
+"""
+Bulk case lookups without the web UI.
+
+Reads a CSV or JSONL file of lookups with the columns
+
+    state, district, court_complex, case_type, case_number, year
+
+(court complex and case type may be given by name or by code), or
+
+    state, district, cnr
+
+for cases whose CNR number is already known; those skip the search and
+CAPTCHA and are fetched together per court (a file of only those needs
+no CAPTCHA backend). Lookups are grouped by district court so each court
+is served by one initialized session, runs the districts concurrently and
+streams one JSON line per lookup to the output as soon as it completes.
+
+    python batch_runner.py cases.csv -o results.jsonl --workers 8
+
+The output file is appended to, so an interrupted run keeps what it wrote.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import time
+
+from async_scraper import AsyncECourtsScraper, get_default_engine
+from captcha_batcher import CaptchaBatcher
+from captcha_prefetch import CaptchaPrefetcher
+from captcha_solver import CaptchaSolver
+from capture_store import get_capture_store
+from case_cache import CaseCache
+from scraper import SearchStatus, normalize_cnr
+from search_engine import get_many_details_cached, search_with_retries
+
+LOOKUP_FIELDS = ['state', 'district', 'court_complex', 'case_type', 'case_number', 'year', 'cnr']
+
+
+def load_lookups(path):
+    """Loads lookups from a .csv or .jsonl file as a list of dicts."""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        if path.endswith('.csv'):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [{field: str(row.get(field) or '').strip() for field in LOOKUP_FIELDS} for row in rows]
+
+
+def load_ecourts_data(path='ecourts_data.json'):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def group_by_court(lookups, ecourts_data):
+    """
+    Groups lookups by district court URL. Returns ({court_url: [lookup]},
+    [lookup]) where the second list holds lookups with an unknown
+    state or district.
+    """
+    groups = {}
+    unknown = []
+    for lookup in lookups:
+        districts = ecourts_data.get(lookup['state'], {}).get('districts', {})
+        district = districts.get(lookup['district'])
+        if not district:
+            unknown.append(lookup)
+            continue
+        groups.setdefault(district['court_url'], []).append(lookup)
+    return groups, unknown
+
+
+def resolve_code(value, name_to_code):
+    """Accepts either a display name or a code present in the map."""
+    if value in name_to_code:
+        return name_to_code[value]
+    if value in name_to_code.values():
+        return value
+    return None
+
+
+class JsonlWriter:
+    """Writes one JSON object per line and flushes so results stream out."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.written = 0
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stream.flush()
+        self.written += 1
+
+
+class BatchRunner:
+    def __init__(self, solver, writer, workers=4, captcha_attempts=3, cache=None):
+        # solver may be None when every lookup is a known CNR
+        self.solver = solver
+        self.cache = cache
+        # Sessions waiting on a CAPTCHA at the same time share one solver request
+        self.batcher = CaptchaBatcher(solver, max_batch=max(1, workers))
+        self.writer = writer
+        self.workers = workers
+        self.captcha_attempts = captcha_attempts
+
+    def emit(self, lookup, case_details=None, error=None, status=None, attempts=0, started=None):
+        record = dict(lookup)
+        record['success'] = case_details is not None
+        record['status'] = status
+        record['attempts'] = attempts
+        record['case_details'] = case_details
+        record['error'] = error
+        if started is not None:
+            record['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        self.writer.write(record)
+
+    async def _lookup(self, scraper, prefetcher, lookup, case_type_maps):
+        started = time.monotonic()
+        court_complex_code = resolve_code(lookup['court_complex'], scraper.court_complex_map)
+        if not court_complex_code:
+            self.emit(lookup, error=f"Unknown court complex '{lookup['court_complex']}'", started=started)
+            return
+
+        if court_complex_code not in case_type_maps:
+            case_type_maps[court_complex_code] = await scraper.get_case_types(court_complex_code)
+        case_type_code = resolve_code(lookup['case_type'], case_type_maps[court_complex_code])
+        if not case_type_code:
+            self.emit(lookup, error=f"Unknown case type '{lookup['case_type']}'", started=started)
+            return
+
+        result = await search_with_retries(
+            scraper, prefetcher, case_type_code, lookup['case_number'], lookup['year'], court_complex_code,
+            max_attempts=self.captcha_attempts, solver=self.solver, cache=self.cache
+        )
+        self.emit(lookup, case_details=result.case_details, error=None if result else result.message,
+                  status=result.status, attempts=result.attempts, started=started)
+
+    async def _lookup_cnrs(self, scraper, lookups, chunk_size=20):
+        """Fetches known CNRs directly, `chunk_size` at a time on the court's session."""
+        for start in range(0, len(lookups), chunk_size):
+            chunk = lookups[start:start + chunk_size]
+            started = time.monotonic()
+            valid = [lookup for lookup in chunk if normalize_cnr(lookup['cnr'])]
+            for lookup in chunk:
+                if lookup not in valid:
+                    self.emit(lookup, error=f"Invalid CNR number '{lookup['cnr']}'")
+            if not valid:
+                continue
+            try:
+                details = await get_many_details_cached(
+                    scraper, [normalize_cnr(lookup['cnr']) for lookup in valid], self.cache
+                )
+            except Exception as e:
+                for lookup in valid:
+                    self.emit(lookup, error=f"Error: {e}")
+                continue
+            for lookup in valid:
+                case_details = details[normalize_cnr(lookup['cnr'])]
+                self.emit(lookup, case_details=case_details,
+                          error=None if case_details else "CNR lookup failed",
+                          status=SearchStatus.FOUND if case_details else SearchStatus.NOT_FOUND,
+                          started=started)
+
+    async def _run_court(self, court_url, lookups):
+        scraper = AsyncECourtsScraper(court_url)
+        prefetcher = CaptchaPrefetcher(scraper, self.batcher.solve)
+        try:
+            if not await scraper.initialize_session():
+                for lookup in lookups:
+                    self.emit(lookup, error=f"Failed to initialize session for {court_url}")
+                return
+            await self._lookup_cnrs(scraper, [lookup for lookup in lookups if lookup['cnr']])
+
+            searches = [lookup for lookup in lookups if not lookup['cnr']]
+            if searches:
+                prefetcher.schedule()
+            # Case types are fetched once per court complex and reused
+            case_type_maps = {}
+            for lookup in searches:
+                try:
+                    await self._lookup(scraper, prefetcher, lookup, case_type_maps)
+                except Exception as e:
+                    self.emit(lookup, error=f"Error: {e}")
+        finally:
+            prefetcher.cancel()
+            await scraper.aclose()
+
+    async def run(self, groups):
+        """Runs each court's lookups sequentially, with up to `workers` courts at once."""
+        slots = asyncio.Semaphore(self.workers)
+
+        async def run_court(court_url, lookups):
+            async with slots:
+                print(f"Processing {len(lookups)} lookups for {court_url}")
+                await self._run_court(court_url, lookups)
+
+        await asyncio.gather(*(run_court(url, lookups) for url, lookups in groups.items()))
+
+
+async def run_batch(lookups, output, workers=4, captcha_attempts=3, solver=None, ecourts_data=None, cache=None):
+    writer = JsonlWriter(output)
+    # Only searches need a CAPTCHA solver, so CNR-only runs work without a configured backend
+    if solver is None and any(not lookup['cnr'] for lookup in lookups):
+        solver = CaptchaSolver()
+    runner = BatchRunner(solver, writer, workers, captcha_attempts, cache)
+
+    groups, unknown = group_by_court(lookups, ecourts_data or load_ecourts_data())
+    for lookup in unknown:
+        runner.emit(lookup, error="Invalid state or district")
+
+    await runner.run(groups)
+    return writer.written
+
+
+async def _run_and_close(*args, **kwargs):
+    try:
+        return await run_batch(*args, **kwargs)
+    finally:
+        await get_default_engine().aclose()
+        if get_capture_store():
+            get_capture_store().close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run eCourts case lookups in bulk")
+    parser.add_argument('input', help="CSV or JSONL file of lookups")
+    parser.add_argument('-o', '--output', default='batch_results.jsonl', help="JSONL output file, appended to")
+    parser.add_argument('--workers', type=int, default=4, help="district courts processed concurrently")
+    parser.add_argument('--captcha-attempts', type=int, default=3, help="CAPTCHA attempts per lookup")
+    parser.add_argument('--cache-db', help="SQLite file caching CINOs and case details across runs")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING').upper(), format="%(levelname)s %(name)s: %(message)s")
+
+    lookups = load_lookups(args.input)
+    print(f"Loaded {len(lookups)} lookups from {args.input}")
+
+    with open(args.output, 'a', encoding='utf-8') as output:
+        cache = CaseCache(db_path=args.cache_db) if args.cache_db else None
+        written = asyncio.run(_run_and_close(lookups, output, args.workers, args.captcha_attempts, cache=cache))
+    print(f"Wrote {written} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
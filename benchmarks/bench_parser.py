@@ -0,0 +1,199 @@
+"""
+Offline benchmark for the scraper's parsing paths.
+
+Runs case_parser against the recorded AJAX payloads in benchmarks/corpus:
+
+    case_details_*.html    get_cnr_details HTML  -> parse_case_details
+    search_response*.html  get_cases HTML        -> find_cino
+    case_types_*.html      get_case_types HTML   -> parse_case_types
+
+For each fixture it reports the median wall time, the soup build and
+per-section extractor times, peak traced memory and records/sec. With
+--baseline the medians are compared against a saved run and the script
+exits with status 1 when any fixture is slower than --threshold times
+its baseline.
+
+Timings only compare on the machine that recorded them, so no baseline is
+committed: save one from the unchanged tree first, then compare against it.
+
+    python benchmarks/bench_parser.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_parser.py --baseline benchmarks/baseline.json
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import case_parser  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+
+def count_records(case_details):
+    """One record for the case itself plus one per row of every list section."""
+    return 1 + sum(len(value) for value in case_details.values() if isinstance(value, list))
+
+
+def timed_sections():
+    """
+    Wraps the registered extractors, and the party list extractor as the
+    'parties' section, so each call adds to a per-section total.
+    """
+    totals = {}
+    originals = dict(case_parser.SECTION_EXTRACTORS)
+    extract_parties = case_parser._extract_parties
+
+    def wrap(name, func):
+        def timed(*args):
+            start = time.perf_counter()
+            func(*args)
+            totals[name] = totals.get(name, 0.0) + time.perf_counter() - start
+        return timed
+
+    for name, func in originals.items():
+        case_parser.SECTION_EXTRACTORS[name] = wrap(name, func)
+    case_parser._extract_parties = wrap('parties', extract_parties)
+
+    def restore():
+        case_parser.SECTION_EXTRACTORS.update(originals)
+        case_parser._extract_parties = extract_parties
+    return totals, restore
+
+
+def bench_case_details(html, backend, repeat):
+    totals, restore = timed_sections()
+    build_times, run_times = [], []
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            soup = case_parser.make_soup(html, backend)
+            built = time.perf_counter()
+            result = case_parser.parse_case_details(None, soup=soup)
+            end = time.perf_counter()
+            build_times.append(built - start)
+            run_times.append(end - start)
+    finally:
+        restore()
+
+    records = count_records(result)
+    median = statistics.median(run_times)
+    sections = {name: total / repeat for name, total in totals.items()}
+    sections['soup build'] = statistics.median(build_times)
+    return median, records, sections
+
+
+def bench_simple(func, html, backend, repeat):
+    run_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(html, backend)
+        run_times.append(time.perf_counter() - start)
+    records = len(result) if isinstance(result, dict) else int(result is not None)
+    return statistics.median(run_times), records, {}
+
+
+def peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(corpus_dir, backend, repeat):
+    results = {}
+    for path in sorted(glob.glob(os.path.join(corpus_dir, '*.html'))):
+        name = os.path.basename(path)
+        with open(path, 'r', encoding='utf-8') as f:
+            html = f.read()
+
+        if name.startswith('case_details'):
+            median, records, sections = bench_case_details(html, backend, repeat)
+            peak = peak_memory(case_parser.parse_case_details, html, backend)
+        elif name.startswith('search_response'):
+            median, records, sections = bench_simple(case_parser.find_cino, html, backend, repeat)
+            peak = peak_memory(case_parser.find_cino, html, backend)
+        elif name.startswith('case_types'):
+            median, records, sections = bench_simple(case_parser.parse_case_types, html, backend, repeat)
+            peak = peak_memory(case_parser.parse_case_types, html, backend)
+        else:
+            continue
+
+        results[name] = {
+            'bytes': len(html.encode('utf-8')),
+            'median_ms': median * 1000,
+            'records': records,
+            'records_per_sec': records / median if median else 0,
+            'peak_kib': peak / 1024,
+            'sections_ms': {section: seconds * 1000 for section, seconds in sections.items()}
+        }
+    return results
+
+
+def print_report(results, backend):
+    print(f"Parser backend: {case_parser.get_backend(backend)}")
+    print(f"{'fixture':<30} {'KiB':>8} {'median ms':>10} {'records':>8} {'rec/s':>10} {'peak KiB':>9}")
+    for name, result in results.items():
+        print(f"{name:<30} {result['bytes'] / 1024:>8.1f} {result['median_ms']:>10.3f} {result['records']:>8} "
+              f"{result['records_per_sec']:>10.0f} {result['peak_kib']:>9.0f}")
+        for section, ms in sorted(result['sections_ms'].items(), key=lambda item: -item[1]):
+            print(f"    {section:<26} {ms:>10.3f} ms")
+
+
+def check_regressions(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['median_ms'] / baseline[name]['median_ms']
+        if ratio > threshold:
+            regressions.append(f"{name}: {result['median_ms']:.3f} ms vs baseline {baseline[name]['median_ms']:.3f} ms ({ratio:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the eCourts HTML parsers against the recorded corpus")
+    parser.add_argument('--corpus', default=CORPUS_DIR, help="directory of recorded .html fixtures")
+    parser.add_argument('--backend', default=None, help="auto, lxml or html.parser (default: CASE_PARSER_BACKEND or auto)")
+    parser.add_argument('--repeat', type=int, default=20, help="runs per fixture")
+    parser.add_argument('--baseline', help="JSON from a --save-baseline run on this machine to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="fail when median exceeds baseline by this factor")
+    parser.add_argument('--save-baseline', help="write this run's results as JSON")
+    args = parser.parse_args()
+
+    results = run(args.corpus, args.backend, args.repeat)
+    if not results:
+        print(f"No fixtures found in {args.corpus}")
+        return 1
+    print_report(results, args.backend)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.save_baseline}")
+
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            print(f"\nNo baseline at {args.baseline}; record one from the unchanged tree with --save-baseline")
+            return 1
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = check_regressions(results, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegressions over {args.threshold}x baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions over {args.threshold}x baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Coalesces CAPTCHA solve requests from concurrent sessions into batches.
+
+Each caller awaits `solve(image)`; requests arriving within `max_wait`
+seconds of each other (up to `max_batch`) are sent to
+CaptchaSolver.solve_many as one backend request, run in a worker thread.
+"""
+import asyncio
+from typing import List, Optional, Tuple
+
+from captcha_solver import CaptchaSolution, CaptchaSolver
+from telemetry import log
+
+
+class CaptchaBatcher:
+    def __init__(self, solver: Optional[CaptchaSolver], max_batch: int = 8, max_wait: float = 0.05):
+        """
+        Args:
+            solver: Solver whose solve_many() handles each batch; None leaves
+                every CAPTCHA unsolved (e.g. for runs that never search)
+            max_batch: Largest number of images sent in one batch
+            max_wait: Seconds to wait for more images after the first one arrives
+        """
+        self.solver = solver
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.images = 0
+
+    async def solve(self, image_bytes: bytes) -> CaptchaSolution:
+        """Solve one CAPTCHA as part of the next batch."""
+        if self.solver is None:
+            return CaptchaSolution(None)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((image_bytes, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_now()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+        return await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.max_wait)
+        self._flush_task = None
+        self._flush_now()
+
+    def _flush_now(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+        if self._pending:
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _run(self, batch):
+        self.batches += 1
+        self.images += len(batch)
+        try:
+            # The solver backends are blocking
+            solutions = await asyncio.to_thread(self.solver.solve_many, [image for image, _ in batch])
+        except Exception as e:
+            log('captcha_batch_failed', level='error', images=len(batch), error=str(e))
+            solutions = [CaptchaSolution(None) for _ in batch]
+        for (_, future), solution in zip(batch, solutions):
+            if not future.done():
+                future.set_result(solution)
+
+    def get_stats(self):
+        return {
+            'batches': self.batches,
+            'images': self.images,
+            'avg_batch_size': (self.images / self.batches) if self.batches else 0
+        }
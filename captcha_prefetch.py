@@ -0,0 +1,113 @@
+"""
+Pipelined CAPTCHA prefetching for an AsyncECourtsScraper session.
+
+The siwp CAPTCHA plugin keeps a single live code per `scid`: fetching a new
+image replaces the previous code. A session can therefore hold at most one
+usable CAPTCHA, and the next one may only be fetched once the search that
+consumed the current one has been answered. The prefetcher keeps that one
+slot filled (image fetched and, when a solver is given, already solved) so
+the next search can start immediately, e.g. while the previous case's
+details are still loading.
+"""
+import asyncio
+import time
+import weakref
+from typing import Awaitable, Callable, Optional
+
+from captcha_solver import CaptchaSolution
+from telemetry import log
+
+
+class PrefetchedCaptcha:
+    def __init__(self, image: bytes, solution: Optional[CaptchaSolution], scid: Optional[str]):
+        self.image = image
+        self.solution = solution or CaptchaSolution(None)
+        self.text = self.solution.text
+        self.scid = scid
+        self.fetched_at = time.monotonic()
+
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
+
+class CaptchaPrefetcher:
+    def __init__(self, scraper, solve: Optional[Callable[[bytes], Awaitable[CaptchaSolution]]] = None, max_age: float = 300):
+        """
+        Args:
+            scraper: An initialized AsyncECourtsScraper
+            solve: Async solver callable, usually CaptchaBatcher.solve
+            max_age: Seconds after which a prefetched CAPTCHA is considered expired
+        """
+        # Weak, so a prefetcher kept per scraper does not keep its scraper alive
+        self._scraper = weakref.ref(scraper)
+        self.solve = solve
+        self.max_age = max_age
+        self._task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        # Last CAPTCHA handed out, so a user's answer can be matched to its solver
+        self.last_served: Optional[PrefetchedCaptcha] = None
+
+    @property
+    def scraper(self):
+        return self._scraper()
+
+    def _is_stale(self, entry: Optional[PrefetchedCaptcha]) -> bool:
+        if entry is None:
+            return True
+        # A re-initialized session has a new scid, so codes for the old one are useless
+        return entry.scid != self.scraper.dynamic_tokens.get('scid') or entry.age() > self.max_age
+
+    async def _fetch(self) -> Optional[PrefetchedCaptcha]:
+        scid = self.scraper.dynamic_tokens.get('scid')
+        image = await self.scraper.get_captcha_image()
+        if not image:
+            return None
+        solution = None
+        if self.solve:
+            try:
+                solution = await self.solve(image)
+            except Exception as e:
+                log('captcha_prefetch_solve_failed', level='warning', host=self.scraper.host, error=str(e))
+        return PrefetchedCaptcha(image, solution, scid)
+
+    def schedule(self):
+        """
+        Starts fetching the next CAPTCHA in the background. Only call this
+        once no search is waiting on the current code, since the fetch
+        invalidates it. Does nothing if a fresh CAPTCHA is already pending.
+        """
+        if self._task is not None:
+            if not self._task.done():
+                return
+            if not self._task.cancelled() and self._task.exception() is None and not self._is_stale(self._task.result()):
+                return
+        self._task = asyncio.ensure_future(self._fetch())
+
+    async def take(self) -> Optional[PrefetchedCaptcha]:
+        """
+        Returns the prefetched CAPTCHA, waiting for it if the fetch is still
+        running, or fetches one now if nothing usable was prefetched. The
+        slot is empty afterwards until schedule() is called again.
+        """
+        task, self._task = self._task, None
+        entry = None
+        if task is not None:
+            try:
+                entry = await task
+            except Exception as e:
+                log('captcha_prefetch_failed', level='warning', host=self.scraper.host, error=str(e))
+        if self._is_stale(entry):
+            self.misses += 1
+            log('captcha_prefetch', outcome='miss', host=self.scraper.host)
+            entry = await self._fetch()
+        else:
+            self.hits += 1
+            log('captcha_prefetch', outcome='hit', host=self.scraper.host)
+        self.last_served = entry
+        return entry
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
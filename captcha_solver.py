@@ -1,85 +1,451 @@
-import google.generativeai as genai
 import base64
 import os
-from typing import Optional
+import threading
+import time
+from io import BytesIO
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 
+from telemetry import log, span
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:
+    Image = None
+
+try:
+    import pytesseract
+except ImportError:
+    pytesseract = None
+
 load_dotenv()
 
-class CaptchaSolver:
-    def __init__(self, api_key: Optional[str] = None):
+CAPTCHA_CHARSET = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+
+
+class CaptchaBackend:
+    """Base class for CAPTCHA solving backends."""
+
+    name = 'base'
+
+    def solve(self, image_bytes: bytes) -> Optional[str]:
         """
-        Initialize the CAPTCHA solver with Gemini API
-        
+        Solve a single CAPTCHA image
+
         Args:
-            api_key: Google Gemini API key. If None, will try to get from environment variable
+            image_bytes: CAPTCHA image as bytes
+
+        Returns:
+            Solved CAPTCHA text or None if this backend could not read it
         """
-        self.api_key = api_key or os.getenv('GOOGLE_GEMINI_API_KEY')
-        if not self.api_key:
-            raise ValueError("Google Gemini API key is required. Set GOOGLE_GEMINI_API_KEY environment variable or pass api_key parameter.")
-        
-        # Configure Gemini
-        genai.configure(api_key=self.api_key)
-        self.model = genai.GenerativeModel('gemini-2.5-flash')
-    
-    def solve_captcha(self, image_bytes: bytes) -> Optional[str]:
+        raise NotImplementedError
+
+    def solve_many(self, images: List[bytes]) -> List[Tuple[Optional[str], Optional[float]]]:
         """
-        Solve CAPTCHA using Gemini Vision API
-        
+        Solve several CAPTCHA images, in order
+
         Args:
-            image_bytes: CAPTCHA image as bytes
-            
+            images: CAPTCHA images as bytes
+
         Returns:
-            Solved CAPTCHA text or None if failed
+            One (text, confidence) pair per image; text is None where the
+            backend could not read it and confidence (0-1) is None when
+            the backend does not report one
         """
-        try:
-            # Convert bytes to base64 for Gemini
-            image_base64 = base64.b64encode(image_bytes).decode('utf-8')
-            
-            # Create prompt for CAPTCHA solving
-            prompt = """
+        return [(self.solve(image), None) for image in images]
+
+
+class CaptchaSolution:
+    """Answer for one CAPTCHA image."""
+
+    def __init__(self, text: Optional[str], confidence: Optional[float] = None, backend: Optional[str] = None):
+        self.text = text
+        self.confidence = confidence
+        self.backend = backend
+
+    def __bool__(self):
+        return bool(self.text)
+
+    def as_dict(self):
+        return {'text': self.text, 'confidence': self.confidence, 'backend': self.backend}
+
+
+class GeminiBackend(CaptchaBackend):
+    """Reads CAPTCHAs with the Gemini Vision API."""
+
+    name = 'gemini'
+
+    PROMPT = """
             This is a CAPTCHA image. Please read the text characters in the image and return ONLY the text, nothing else.
-            
+
             Rules:
             1. Return only the alphanumeric characters you see
             2. Ignore any background noise or distortions
             3. If you can't read it clearly, make your best guess
             4. Return the text in a single line without spaces
             5. Only return the text, no explanations or additional text
-            
+
             What text do you see in this CAPTCHA?
             """
-            
-            # Create image part for Gemini
-            image_part = {
-                "mime_type": "image/png",
-                "data": image_base64
-            }
-            
-            # Generate response
-            response = self.model.generate_content([prompt, image_part])
-            
-            if response.text:
-                # Clean the response - remove any extra text and keep only alphanumeric
-                captcha_text = ''.join(c for c in response.text.strip() if c.isalnum())
-                print(f"CAPTCHA SOLVED: {captcha_text}")
-                return captcha_text if captcha_text else None
-            else:
-                return None
-                
-        except Exception as e:
-            print(f"Error solving CAPTCHA with Gemini: {e}")
+
+    BATCH_PROMPT = """
+            The following {count} images are CAPTCHAs, numbered 1 to {count} in the order given.
+            For each image, read the alphanumeric characters, ignoring background noise and distortions.
+
+            Answer with exactly {count} lines, one per image, in the format:
+            <number>|<text>|<confidence between 0 and 1>
+
+            Return nothing else.
+            """
+
+    def __init__(self, api_key: Optional[str] = None, model_name: str = 'gemini-2.5-flash'):
+        """
+        Args:
+            api_key: Google Gemini API key. If None, will try to get from environment variable
+            model_name: Gemini model used for solving
+        """
+        self.api_key = api_key or os.getenv('GOOGLE_GEMINI_API_KEY')
+        if not self.api_key:
+            raise ValueError("Google Gemini API key is required. Set GOOGLE_GEMINI_API_KEY environment variable or pass api_key parameter.")
+
+        import google.generativeai as genai
+
+        # Configure Gemini
+        genai.configure(api_key=self.api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    def solve(self, image_bytes: bytes) -> Optional[str]:
+        # Convert bytes to base64 for Gemini
+        image_part = {
+            "mime_type": "image/png",
+            "data": base64.b64encode(image_bytes).decode('utf-8')
+        }
+        response = self.model.generate_content([self.PROMPT, image_part])
+        if not response.text:
             return None
-    
+        # Clean the response - remove any extra text and keep only alphanumeric
+        captcha_text = ''.join(c for c in response.text.strip() if c.isalnum())
+        return captcha_text or None
+
+    def solve_many(self, images: List[bytes]) -> List[Tuple[Optional[str], Optional[float]]]:
+        """Solves all images with a single generate_content call."""
+        if len(images) == 1:
+            return [(self.solve(images[0]), None)]
+
+        parts = [self.BATCH_PROMPT.format(count=len(images))]
+        for image_bytes in images:
+            parts.append({"mime_type": "image/png", "data": base64.b64encode(image_bytes).decode('utf-8')})
+        response = self.model.generate_content(parts)
+
+        results: List[Tuple[Optional[str], Optional[float]]] = [(None, None)] * len(images)
+        for line in (response.text or '').splitlines():
+            fields = [field.strip() for field in line.split('|')]
+            if len(fields) < 2 or not fields[0].isdigit():
+                continue
+            index = int(fields[0]) - 1
+            if not 0 <= index < len(images):
+                continue
+            text = ''.join(c for c in fields[1] if c.isalnum()) or None
+            try:
+                confidence = float(fields[2]) if len(fields) > 2 else None
+            except ValueError:
+                confidence = None
+            results[index] = (text, confidence)
+        return results
+
+
+class LocalOCRBackend(CaptchaBackend):
+    """
+    Offline solver for the siwp CAPTCHA images: removes the noise lines and
+    background with classical image processing, then reads the characters
+    with Tesseract restricted to the CAPTCHA alphabet.
+    """
+
+    name = 'local'
+
+    def __init__(self, expected_length: Optional[int] = None, min_confidence: float = 60, scale: int = 3):
+        """
+        Args:
+            expected_length: Reject readings that do not have this many characters
+            min_confidence: Reject readings whose mean Tesseract confidence is lower
+            scale: Upscaling factor applied before thresholding
+        """
+        if Image is None or pytesseract is None:
+            raise ValueError("The local CAPTCHA backend requires the Pillow and pytesseract packages and the tesseract binary.")
+        self.expected_length = expected_length
+        self.min_confidence = min_confidence
+        self.scale = scale
+        self.config = f"--psm 7 -c tessedit_char_whitelist={CAPTCHA_CHARSET}"
+        self.last_confidence = None
+
+    def preprocess(self, image_bytes: bytes):
+        """Grayscale, upscale, binarize around the mean and median-filter the noise lines away."""
+        image = ImageOps.grayscale(Image.open(BytesIO(image_bytes)))
+        image = image.resize((image.width * self.scale, image.height * self.scale), Image.LANCZOS)
+        image = ImageOps.autocontrast(image)
+        histogram = image.histogram()
+        pixels = sum(histogram)
+        threshold = sum(level * count for level, count in enumerate(histogram)) / pixels if pixels else 128
+        image = image.point(lambda level: 255 if level > threshold else 0)
+        return image.filter(ImageFilter.MedianFilter(5))
+
+    def read(self, image_bytes: bytes) -> Tuple[Optional[str], float]:
+        """Returns the cleaned text and mean confidence (0-100) of a reading."""
+        data = pytesseract.image_to_data(
+            self.preprocess(image_bytes), config=self.config, output_type=pytesseract.Output.DICT
+        )
+        words, confidences = [], []
+        for text, conf in zip(data['text'], data['conf']):
+            text = ''.join(c for c in text if c.isalnum())
+            if text:
+                words.append(text)
+                confidences.append(float(conf))
+        if not words:
+            return None, 0.0
+        return ''.join(words), sum(confidences) / len(confidences)
+
+    def _accept(self, text: Optional[str], confidence: float) -> Optional[str]:
+        if not text or confidence < self.min_confidence:
+            return None
+        if self.expected_length and len(text) != self.expected_length:
+            return None
+        return text
+
+    def solve(self, image_bytes: bytes) -> Optional[str]:
+        text, confidence = self.read(image_bytes)
+        self.last_confidence = confidence
+        return self._accept(text, confidence)
+
+    def solve_many(self, images: List[bytes]) -> List[Tuple[Optional[str], Optional[float]]]:
+        """
+        Stacks the cleaned images into one page, one CAPTCHA per line, and
+        reads it with a single Tesseract run instead of one process per
+        image. Falls back to per-image reads if the lines do not come back
+        one per image.
+        """
+        if len(images) == 1:
+            text, confidence = self.read(images[0])
+            return [(self._accept(text, confidence), confidence / 100)]
+
+        cleaned = [self.preprocess(image_bytes) for image_bytes in images]
+        margin = 10 * self.scale
+        width = max(image.width for image in cleaned) + 2 * margin
+        height = sum(image.height + margin for image in cleaned) + margin
+        page = Image.new('L', (width, height), 255)
+        offsets = []
+        top = margin
+        for image in cleaned:
+            page.paste(image, (margin, top))
+            offsets.append((top, top + image.height))
+            top += image.height + margin
+
+        data = pytesseract.image_to_data(
+            page, config=self.config.replace('--psm 7', '--psm 6'), output_type=pytesseract.Output.DICT
+        )
+        words = [[] for _ in images]
+        for text, conf, word_top, word_height in zip(data['text'], data['conf'], data['top'], data['height']):
+            text = ''.join(c for c in text if c.isalnum())
+            if not text:
+                continue
+            middle = word_top + word_height / 2
+            for index, (start, end) in enumerate(offsets):
+                if start - margin / 2 <= middle <= end + margin / 2:
+                    words[index].append((text, float(conf)))
+                    break
+
+        if any(not image_words for image_words in words):
+            return [(self._accept(*self.read(image_bytes)), None) for image_bytes in images]
+
+        results = []
+        for image_words in words:
+            text = ''.join(word for word, _ in image_words)
+            confidence = sum(conf for _, conf in image_words) / len(image_words)
+            results.append((self._accept(text, confidence), confidence / 100))
+        return results
+
+
+class BackendStats:
+    """Latency and accuracy counters for one backend."""
+
+    def __init__(self):
+        self.attempts = 0
+        self.solved = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.confirmed_correct = 0
+        self.confirmed_wrong = 0
+
+    def as_dict(self) -> Dict[str, float]:
+        confirmed = self.confirmed_correct + self.confirmed_wrong
+        return {
+            'attempts': self.attempts,
+            'solved': self.solved,
+            'errors': self.errors,
+            'avg_latency_ms': (self.total_seconds / self.attempts * 1000) if self.attempts else 0,
+            'confirmed_correct': self.confirmed_correct,
+            'confirmed_wrong': self.confirmed_wrong,
+            'accuracy': (self.confirmed_correct / confirmed * 100) if confirmed else None
+        }
+
+
+def build_backend(name: str, api_key: Optional[str] = None) -> CaptchaBackend:
+    """Creates a backend from its config name."""
+    if name == 'gemini':
+        return GeminiBackend(api_key)
+    if name == 'local':
+        length = os.getenv('CAPTCHA_LENGTH')
+        return LocalOCRBackend(
+            expected_length=int(length) if length else None,
+            min_confidence=float(os.getenv('CAPTCHA_LOCAL_MIN_CONFIDENCE', '60'))
+        )
+    raise ValueError(f"Unknown CAPTCHA backend '{name}'")
+
+
+class CaptchaSolver:
+    def __init__(self, api_key: Optional[str] = None, backends: Optional[List] = None):
+        """
+        Initialize the CAPTCHA solver with a fallback chain of backends
+
+        Args:
+            api_key: Google Gemini API key. If None, will try to get from environment variable
+            backends: Backend names or CaptchaBackend instances, tried in order.
+                If None, read from the CAPTCHA_BACKENDS environment variable
+                (comma separated, default "gemini").
+        """
+        if backends is None:
+            backends = [name.strip() for name in os.getenv('CAPTCHA_BACKENDS', 'gemini').split(',') if name.strip()]
+
+        self.backends: List[CaptchaBackend] = []
+        errors = []
+        for backend in backends:
+            if isinstance(backend, CaptchaBackend):
+                self.backends.append(backend)
+                continue
+            try:
+                self.backends.append(build_backend(backend, api_key))
+            except Exception as e:
+                errors.append(f"{backend}: {e}")
+                log('captcha_backend_unavailable', level='warning', backend=str(backend), error=str(e))
+
+        if not self.backends:
+            raise ValueError("No CAPTCHA backend could be initialized. " + "; ".join(errors))
+
+        self.stats: Dict[str, BackendStats] = {backend.name: BackendStats() for backend in self.backends}
+        self._stats_lock = threading.Lock()
+
+    def solve_with_backend(self, image_bytes: bytes) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Solve CAPTCHA with the first backend in the chain that produces an answer
+
+        Args:
+            image_bytes: CAPTCHA image as bytes
+
+        Returns:
+            Tuple of (solved_text, backend_name), both None if every backend failed
+        """
+        for backend in self.backends:
+            started = time.perf_counter()
+            text, failed = None, False
+            with span('captcha_solve', backend=backend.name) as stage:
+                try:
+                    text = backend.solve(image_bytes)
+                except Exception as e:
+                    failed = True
+                    log('captcha_solve_failed', level='warning', backend=backend.name, error=str(e))
+                stage.set('error' if failed else 'solved' if text else 'unsolved')
+            with self._stats_lock:
+                stats = self.stats[backend.name]
+                stats.attempts += 1
+                stats.total_seconds += time.perf_counter() - started
+                stats.errors += int(failed)
+                stats.solved += int(text is not None)
+            if text:
+                log('captcha_solved', level='debug', backend=backend.name)
+                return text, backend.name
+        return None, None
+
+    def solve_many(self, images: List[bytes]) -> List[CaptchaSolution]:
+        """
+        Solve several CAPTCHAs with one request per backend
+
+        Each backend gets the images still unsolved by the backends before
+        it in the chain as a single batch.
+
+        Args:
+            images: CAPTCHA images as bytes
+
+        Returns:
+            One CaptchaSolution per image, in the same order
+        """
+        solutions = [CaptchaSolution(None) for _ in images]
+        pending = list(range(len(images)))
+        for backend in self.backends:
+            if not pending:
+                break
+            started = time.perf_counter()
+            with span('captcha_solve', backend=backend.name, batch_size=len(pending)) as stage:
+                try:
+                    results = backend.solve_many([images[index] for index in pending])
+                    failed = False
+                except Exception as e:
+                    log('captcha_solve_failed', level='warning', backend=backend.name, batch_size=len(pending), error=str(e))
+                    results, failed = [(None, None)] * len(pending), True
+                stage.set('error' if failed else 'solved' if all(text for text, _ in results) else 'unsolved',
+                          solved=sum(1 for text, _ in results if text))
+
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                stats = self.stats[backend.name]
+                stats.attempts += len(pending)
+                stats.total_seconds += elapsed
+                stats.errors += len(pending) if failed else 0
+                stats.solved += sum(1 for text, _ in results if text)
+
+            still_pending = []
+            for index, (text, confidence) in zip(pending, results):
+                if text:
+                    solutions[index] = CaptchaSolution(text, confidence, backend.name)
+                else:
+                    still_pending.append(index)
+            pending = still_pending
+        return solutions
+
+    def solve_captcha(self, image_bytes: bytes) -> Optional[str]:
+        """
+        Solve CAPTCHA using the configured backends
+
+        Args:
+            image_bytes: CAPTCHA image as bytes
+
+        Returns:
+            Solved CAPTCHA text or None if failed
+        """
+        return self.solve_with_backend(image_bytes)[0]
+
     def solve_captcha_with_fallback(self, image_bytes: bytes) -> tuple[Optional[str], bool]:
         """
         Solve CAPTCHA with fallback information
-        
+
         Args:
             image_bytes: CAPTCHA image as bytes
-            
+
         Returns:
             Tuple of (solved_text, was_auto_solved)
         """
         solved_text = self.solve_captcha(image_bytes)
-        return solved_text, solved_text is not None 
\ No newline at end of file
+        return solved_text, solved_text is not None
+
+    def record_result(self, backend_name: Optional[str], correct: bool):
+        """Record whether the server accepted a CAPTCHA solved by the given backend"""
+        if backend_name not in self.stats:
+            return
+        with self._stats_lock:
+            if correct:
+                self.stats[backend_name].confirmed_correct += 1
+            else:
+                self.stats[backend_name].confirmed_wrong += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, float]]:
+        """Per-backend latency and accuracy counters"""
+        with self._stats_lock:
+            return {name: stats.as_dict() for name, stats in self.stats.items()}
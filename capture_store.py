@@ -0,0 +1,231 @@
+"""
+Opt-in captures of raw court responses, for reproducing parser failures.
+
+Capturing is off unless CAPTURE_DIR is set. A capture only queues the
+response text; a background thread gzips it, stores it once under its
+sha256 (objects/ab/abcdef....html.gz) and indexes it by CINO and capture
+time in index.db. Successful responses are sampled at CAPTURE_SAMPLE_RATE,
+responses that failed to parse are always kept, and captures older than
+CAPTURE_MAX_AGE_DAYS or beyond CAPTURE_MAX_MB are purged oldest first.
+
+    sqlite3 captures/index.db "SELECT * FROM captures WHERE cino = 'MHAU010012342023'"
+"""
+import gzip
+import hashlib
+import os
+import queue
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from telemetry import log
+
+# Purge after this many writes, besides on startup
+PURGE_EVERY = 200
+
+
+class CaptureStore:
+    def __init__(self, directory: str, sample_rate: float = 1.0, max_bytes: Optional[int] = None,
+                 max_age: Optional[float] = None, queue_size: int = 1000):
+        """
+        Args:
+            directory: Where objects and index.db are kept
+            sample_rate: Fraction of successful responses captured
+            max_bytes: Compressed size kept before the oldest captures are purged
+            max_age: Seconds a capture is kept
+            queue_size: Pending captures before new ones are dropped
+        """
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.db_path = os.path.join(directory, 'index.db')
+        self.captured = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.purged = 0
+        os.makedirs(os.path.join(directory, 'objects'), exist_ok=True)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._writer = threading.Thread(target=self._write_loop, name="capture-writer", daemon=True)
+        self._writer.start()
+
+    def capture(self, kind: str, text, cino=None, court_url=None, failed: bool = False) -> bool:
+        """
+        Queue a response for capture; never blocks or touches the disk.
+
+        Args:
+            kind: Response type, e.g. 'search_response' or 'case_details'
+            text: The response body
+            cino: CINO the response belongs to, if known
+            court_url: Court the response came from
+            failed: The response could not be parsed; bypasses sampling
+        """
+        if not text or (not failed and random.random() >= self.sample_rate):
+            return False
+        try:
+            self._queue.put_nowait((kind, cino, court_url, failed, text, time.time()))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _object_path(self, digest):
+        return os.path.join(self.directory, 'objects', digest[:2], f"{digest}.html.gz")
+
+    def _write_object(self, text) -> Tuple[str, int]:
+        """Store the compressed text under its hash unless it is already there"""
+        data = text.encode('utf-8') if isinstance(text, str) else text
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        if os.path.exists(path):
+            self.deduplicated += 1
+            return digest, os.path.getsize(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        # mtime=0 keeps the compressed bytes a function of the content alone
+        with open(tmp_path, 'wb') as f:
+            f.write(gzip.compress(data, mtime=0))
+        os.replace(tmp_path, path)
+        return digest, os.path.getsize(path)
+
+    def _init_database(self, conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS captures (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                captured_at DATETIME,
+                kind TEXT,
+                cino TEXT,
+                court_url TEXT,
+                failed BOOLEAN,
+                sha256 TEXT,
+                size INTEGER
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_captures_cino ON captures (cino, captured_at)')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_captures_sha256 ON captures (sha256)')
+        conn.commit()
+        conn.execute('PRAGMA journal_mode=WAL').fetchone()
+
+    def _write_loop(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._init_database(conn)
+        self._purge(conn)
+        writes = 0
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                kind, cino, court_url, failed, text, captured_at = item
+                try:
+                    digest, size = self._write_object(text)
+                    conn.execute('''
+                        INSERT INTO captures (captured_at, kind, cino, court_url, failed, sha256, size)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', (datetime.utcfromtimestamp(captured_at).strftime('%Y-%m-%d %H:%M:%S'),
+                          kind, cino, court_url, failed, digest, size))
+                    conn.commit()
+                    self.captured += 1
+                    writes += 1
+                    if writes % PURGE_EVERY == 0:
+                        self._purge(conn)
+                except (OSError, sqlite3.Error) as e:
+                    log('capture_write_failed', level='error', kind=kind, error=str(e))
+            finally:
+                self._queue.task_done()
+
+    def _purge(self, conn):
+        """Drop captures past the age and size limits and the objects nothing refers to"""
+        deleted = 0
+        if self.max_age:
+            cutoff = datetime.utcfromtimestamp(time.time() - self.max_age).strftime('%Y-%m-%d %H:%M:%S')
+            deleted += conn.execute('DELETE FROM captures WHERE captured_at < ?', (cutoff,)).rowcount
+        if self.max_bytes:
+            # Each object counts once, at its newest capture; keep the newest within budget
+            rows = conn.execute('''
+                SELECT sha256, MAX(size), MAX(id) AS newest FROM captures GROUP BY sha256 ORDER BY newest DESC
+            ''').fetchall()
+            total, over = 0, []
+            for digest, size, _ in rows:
+                total += size
+                if total > self.max_bytes:
+                    over.append((digest,))
+            deleted += conn.executemany('DELETE FROM captures WHERE sha256 = ?', over).rowcount
+        conn.commit()
+
+        if deleted:
+            referenced = {row[0] for row in conn.execute('SELECT DISTINCT sha256 FROM captures')}
+            objects_dir = os.path.join(self.directory, 'objects')
+            for prefix in os.listdir(objects_dir):
+                for name in os.listdir(os.path.join(objects_dir, prefix)):
+                    if name.split('.', 1)[0] not in referenced:
+                        try:
+                            os.remove(os.path.join(objects_dir, prefix, name))
+                        except OSError:
+                            pass
+            self.purged += deleted
+
+    def flush(self):
+        """Wait until every queued capture is written"""
+        self._queue.join()
+
+    def close(self):
+        """Write the queued captures and stop the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+
+    def list_captures(self, cino=None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Index entries newest first, optionally for one case"""
+        where, params = ('WHERE cino = ?', [cino]) if cino else ('', [])
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute(f'SELECT * FROM captures {where} ORDER BY id DESC LIMIT ?', params + [limit])
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def read(self, digest) -> str:
+        """The captured text stored under a sha256"""
+        with gzip.open(self._object_path(digest), 'rt', encoding='utf-8') as f:
+            return f.read()
+
+    def get_stats(self):
+        return {
+            'captured': self.captured,
+            'deduplicated': self.deduplicated,
+            'dropped': self.dropped,
+            'purged': self.purged,
+            'pending': self._queue.qsize(),
+            'sample_rate': self.sample_rate
+        }
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_capture_store() -> Optional[CaptureStore]:
+    """The process-wide store configured from the environment, or None when capturing is off"""
+    global _default_store
+    directory = os.getenv('CAPTURE_DIR')
+    if not directory:
+        return None
+    with _default_store_lock:
+        if _default_store is None:
+            max_mb = float(os.getenv('CAPTURE_MAX_MB', '500'))
+            max_age_days = float(os.getenv('CAPTURE_MAX_AGE_DAYS', '14'))
+            _default_store = CaptureStore(
+                directory,
+                sample_rate=float(os.getenv('CAPTURE_SAMPLE_RATE', '0.05')),
+                max_bytes=int(max_mb * 1024 * 1024) if max_mb > 0 else None,
+                max_age=max_age_days * 86400 if max_age_days > 0 else None
+            )
+    return _default_store
+
+
+def capture(kind: str, text, cino=None, court_url=None, failed: bool = False) -> bool:
+    """Capture through the default store; a no-op when CAPTURE_DIR is unset"""
+    store = get_capture_store()
+    return store.capture(kind, text, cino, court_url, failed) if store else False
@@ -0,0 +1,183 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def is_disposed(case_details: Dict[str, Any]) -> bool:
+    return 'disposed' in (case_details.get('case_status') or '').lower()
+
+
+class CaseCache:
+    """
+    Two-level cache for search results.
+
+    - (court URL, est_code, case_type, reg_no, reg_year) -> CINO. A known
+      mapping lets a search skip the CAPTCHA and go straight to the details.
+    - (court URL, CINO) -> parsed case details, kept for `disposed_ttl`
+      seconds for disposed cases and `pending_ttl` for everything else.
+
+    Entries live in a bounded in-memory LRU and, when `db_path` is given, in
+    a SQLite table that survives restarts and backs memory misses.
+    """
+
+    def __init__(self, max_entries: int = 2048, pending_ttl: float = 600,
+                 disposed_ttl: float = 3 * 86400, mapping_ttl: float = 30 * 86400,
+                 db_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.pending_ttl = pending_ttl
+        self.disposed_ttl = disposed_ttl
+        self.mapping_ttl = mapping_ttl
+        self.db_path = db_path
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            self.init_database()
+
+    def init_database(self):
+        """Initialize the persistent cache table"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS case_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    value TEXT,
+                    expires_at REAL
+                )
+            ''')
+            conn.commit()
+
+    @staticmethod
+    def _details_key(court_url, cino):
+        return f"details|{court_url.rstrip('/')}|{cino}"
+
+    @staticmethod
+    def _mapping_key(court_url, est_code, case_type, reg_no, reg_year):
+        return f"cino|{court_url.rstrip('/')}|{est_code}|{case_type}|{reg_no}|{reg_year}"
+
+    def _get_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._memory[key]
+        return None
+
+    def _get_stored(self, key, now):
+        """Look up a memory miss in the persistent tier, if there is one"""
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    'SELECT value, expires_at FROM case_cache WHERE cache_key = ? AND expires_at > ?', (key, now)
+                ).fetchone()
+            if row:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                with self._lock:
+                    self.hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _get(self, key):
+        now = time.time()
+        value = self._get_memory(key, now)
+        return value if value is not None else self._get_stored(key, now)
+
+    async def _get_async(self, key):
+        """_get() for the event loop: memory hits are served directly, the persistent tier in a thread"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is not None:
+            return value
+        if self.db_path:
+            return await asyncio.to_thread(self._get_stored, key, now)
+        return self._get_stored(key, now)
+
+    def _remember(self, key, value, expires_at):
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _store(self, key, value, expires_at):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO case_cache (cache_key, value, expires_at) VALUES (?, ?, ?)',
+                (key, json.dumps(value), expires_at)
+            )
+            conn.commit()
+
+    def _put(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        if self.db_path:
+            self._store(key, value, expires_at)
+
+    async def _put_async(self, key, value, ttl):
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        if self.db_path:
+            await asyncio.to_thread(self._store, key, value, expires_at)
+
+    def _details_ttl(self, case_details):
+        return self.disposed_ttl if is_disposed(case_details) else self.pending_ttl
+
+    def get_details(self, court_url, cino) -> Optional[Dict[str, Any]]:
+        return self._get(self._details_key(court_url, cino))
+
+    def put_details(self, court_url, cino, case_details: Dict[str, Any]):
+        self._put(self._details_key(court_url, cino), case_details, self._details_ttl(case_details))
+
+    def get_cino(self, court_url, est_code, case_type, reg_no, reg_year) -> Optional[str]:
+        return self._get(self._mapping_key(court_url, est_code, case_type, reg_no, reg_year))
+
+    def put_cino(self, court_url, est_code, case_type, reg_no, reg_year, cino):
+        self._put(self._mapping_key(court_url, est_code, case_type, reg_no, reg_year), cino, self.mapping_ttl)
+
+    # Async versions for callers on the event loop; only the SQLite tier runs in a thread
+
+    async def get_details_async(self, court_url, cino) -> Optional[Dict[str, Any]]:
+        return await self._get_async(self._details_key(court_url, cino))
+
+    async def put_details_async(self, court_url, cino, case_details: Dict[str, Any]):
+        await self._put_async(self._details_key(court_url, cino), case_details, self._details_ttl(case_details))
+
+    async def get_cino_async(self, court_url, est_code, case_type, reg_no, reg_year) -> Optional[str]:
+        return await self._get_async(self._mapping_key(court_url, est_code, case_type, reg_no, reg_year))
+
+    async def put_cino_async(self, court_url, est_code, case_type, reg_no, reg_year, cino):
+        key = self._mapping_key(court_url, est_code, case_type, reg_no, reg_year)
+        await self._put_async(key, cino, self.mapping_ttl)
+
+    def purge_expired(self):
+        """Drop expired entries from memory and the persistent tier"""
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._memory.items() if expires_at <= now]:
+                del self._memory[key]
+        if self.db_path:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('DELETE FROM case_cache WHERE expires_at <= ?', (now,))
+                conn.commit()
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._memory),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups * 100) if lookups else 0
+            }
@@ -0,0 +1,257 @@
+"""
+Single-pass parser for the get_cnr_details HTML.
+
+The case details page is a sequence of `table.data-table-1` tables, each
+identified by its caption, plus the petitioner/respondent lists under
+`h5` headings. The document is walked once; every table is dispatched by
+caption to the extractor registered for that section.
+"""
+import os
+
+from bs4 import BeautifulSoup
+
+try:
+    import lxml  # noqa: F401
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+
+def get_backend(name=None):
+    """
+    Resolves the BeautifulSoup tree builder: 'html.parser', 'lxml', or
+    'auto' (lxml when installed). Defaults to the CASE_PARSER_BACKEND
+    environment variable.
+    """
+    name = name or os.getenv('CASE_PARSER_BACKEND', 'auto')
+    if name == 'auto':
+        return 'lxml' if HAS_LXML else 'html.parser'
+    if name == 'lxml' and not HAS_LXML:
+        raise ValueError("lxml backend requested but lxml is not installed")
+    return name
+
+
+def make_soup(html, backend=None):
+    return BeautifulSoup(html, get_backend(backend))
+
+
+def parse_case_types(html, backend=None):
+    """Maps case type names to their numeric codes from the get_case_types options."""
+    case_types = {}
+    for option in make_soup(html, backend).find_all('option'):
+        if 'value' in option.attrs and option['value'].isdigit():
+            case_types[option.text.strip()] = option['value']
+    return case_types
+
+
+def find_cino(html, backend=None):
+    """Returns the data-cno of the first search result, or None."""
+    case_link = make_soup(html, backend).find('a', {'data-cno': True})
+    return case_link.get('data-cno') if case_link else None
+
+
+# Caption -> extractor(table, case_details)
+SECTION_EXTRACTORS = {}
+
+# Sections that are only read from the first data-table-1 table
+FIRST_TABLE_ONLY = {'Case Details'}
+
+# Keys of the resulting dict are produced in this order
+SECTION_ORDER = ['Case Details', 'Case Status', 'parties', 'FIR Details',
+                 'Case History', 'Acts', 'Orders', 'Process Details']
+
+PARTY_HEADINGS = {
+    'Petitioner and Advocate': ('petitioners', 'Petitioner'),
+    'Respondent and Advocate': ('respondents', 'respondent'),
+}
+
+
+def section(caption):
+    """Registers an extractor for the table with the given caption."""
+    def register(func):
+        SECTION_EXTRACTORS[caption] = func
+        return func
+    return register
+
+
+def _cell_texts(row):
+    return [cell.text.strip() for cell in row.find_all('td')]
+
+
+def _first_row_cells(table):
+    tbody = table.find('tbody')
+    if not tbody:
+        return None
+    row = tbody.find('tr')
+    if not row:
+        return None
+    return row.find_all('td')
+
+
+def _body_rows(table):
+    tbody = table.find('tbody')
+    return tbody.find_all('tr') if tbody else None
+
+
+@section('Case Details')
+def extract_case_details(table, case_details):
+    cells = _first_row_cells(table)
+    if cells and len(cells) >= 6:
+        case_details['case_type'] = cells[0].text.strip()
+        case_details['filing_number'] = cells[1].text.strip()
+        case_details['filing_date'] = cells[2].text.strip()
+        case_details['registration_number'] = cells[3].text.strip()
+        case_details['registration_date'] = cells[4].text.strip()
+        case_details['cnr_number'] = cells[5].text.strip()
+
+
+@section('Case Status')
+def extract_case_status(table, case_details):
+    cells = _first_row_cells(table)
+    if cells and len(cells) >= 5:
+        case_details['first_hearing_date'] = cells[0].text.strip()
+        case_details['decision_date'] = cells[1].text.strip()
+        case_details['case_status'] = cells[2].text.strip()
+        case_details['nature_of_disposal'] = cells[3].text.strip()
+        case_details['court_number_and_judge'] = cells[4].text.strip()
+
+
+@section('FIR Details')
+def extract_fir_details(table, case_details):
+    cells = _first_row_cells(table)
+    if cells and len(cells) >= 3:
+        case_details['police_station'] = cells[0].text.strip()
+        case_details['fir_number'] = cells[1].text.strip()
+        case_details['fir_year'] = cells[2].text.strip()
+
+
+@section('Case History')
+def extract_case_history(table, case_details):
+    rows = _body_rows(table)
+    if rows is None:
+        return
+    history = case_details['case_history'] = []
+    for row in rows:
+        cells = row.find_all('td')
+        if len(cells) >= 5:
+            # For business date, extract text from the link if it exists
+            business_date_link = cells[2].find('a')
+            business_date = (business_date_link or cells[2]).text.strip()
+            history.append({
+                'registration_number': cells[0].text.strip(),
+                'judge': cells[1].text.strip(),
+                'business_date': business_date,
+                'hearing_date': cells[3].text.strip(),
+                'purpose': cells[4].text.strip()
+            })
+
+
+@section('Acts')
+def extract_acts(table, case_details):
+    rows = _body_rows(table)
+    if rows is None:
+        return
+    acts = case_details['acts'] = []
+    for row in rows:
+        cells = _cell_texts(row)
+        if len(cells) >= 2:
+            acts.append({'under_act': cells[0], 'under_section': cells[1]})
+
+
+@section('Orders')
+def extract_orders(table, case_details):
+    rows = _body_rows(table)
+    if rows is None:
+        return
+    orders = case_details['orders'] = []
+    for row in rows:
+        cells = row.find_all('td')
+        if len(cells) >= 3:
+            order_details_cell = cells[2]
+            download_link = None
+            order_details_text = order_details_cell.text.strip()
+
+            link_element = order_details_cell.find('a')
+            if link_element and 'href' in link_element.attrs:
+                download_link = link_element['href']
+                order_details_text = link_element.text.strip()
+
+            orders.append({
+                'order_number': cells[0].text.strip(),
+                'order_date': cells[1].text.strip(),
+                'order_details': order_details_text,
+                'download_link': download_link
+            })
+
+
+@section('Process Details')
+def extract_process_details(table, case_details):
+    rows = _body_rows(table)
+    if rows is None:
+        return
+    processes = case_details['process_details'] = []
+    for row in rows:
+        cells = _cell_texts(row)
+        if len(cells) >= 5:
+            processes.append({
+                'process_id': cells[0],
+                'process_date': cells[1],
+                'process_title': cells[2],
+                'party_name': cells[3],
+                'issued_process': cells[4]
+            })
+
+
+def _extract_parties(heading, key, div_class, case_details):
+    party_div = heading.find_next('div', class_=div_class)
+    if party_div:
+        party_list = party_div.find('ul')
+        if party_list:
+            case_details[key] = [item.find('p').text.strip() for item in party_list.find_all('li') if item.find('p')]
+
+
+def _table_caption(table, first_table):
+    caption = table.find('caption')
+    if caption and caption.string in SECTION_EXTRACTORS and caption.string not in FIRST_TABLE_ONLY:
+        return caption.string
+    if first_table:
+        for name in FIRST_TABLE_ONLY:
+            if table.find('caption', string=name):
+                return name
+    return None
+
+
+def parse_case_details(html, backend=None, soup=None):
+    """
+    Parses the case details HTML into the dict returned by
+    ECourtsScraper.get_case_details. Only the first table of each section
+    is read, as the site never repeats a section.
+    """
+    if soup is None:
+        soup = make_soup(html, backend)
+
+    sections = {}
+    seen_first_table = False
+    for element in soup.find_all(['table', 'h5']):
+        if element.name == 'h5':
+            party = PARTY_HEADINGS.get(element.string)
+            if party and party[0] not in sections:
+                sections[party[0]] = element
+            continue
+
+        if 'data-table-1' not in element.get('class', []):
+            continue
+        name = _table_caption(element, not seen_first_table)
+        seen_first_table = True
+        if name and name not in sections:
+            sections[name] = element
+
+    case_details = {}
+    for name in SECTION_ORDER:
+        if name == 'parties':
+            for key, div_class in PARTY_HEADINGS.values():
+                if key in sections:
+                    _extract_parties(sections[key], key, div_class, case_details)
+        elif name in sections:
+            SECTION_EXTRACTORS[name](sections[name], case_details)
+    return case_details
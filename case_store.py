@@ -0,0 +1,355 @@
+"""
+Normalized storage for parsed case details.
+
+`parse_case_details` output is split into a `cases` row plus one table per
+list section (hearings from case_history, orders, acts, parties and
+process_details). Refreshing a case only writes what differs from the
+stored copy and records every difference in `case_changes`, so a monitored
+portfolio is stored once instead of once per lookup, and "next hearing date
+changed" or "new order" can be read off the change log. Order rows also
+record the PDF downloaded for them by order_downloader.py.
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# Scalar fields of parse_case_details kept on the cases row
+CASE_FIELDS = ('case_type', 'filing_number', 'filing_date', 'registration_number', 'registration_date',
+               'cnr_number', 'first_hearing_date', 'decision_date', 'case_status', 'nature_of_disposal',
+               'court_number_and_judge', 'police_station', 'fir_number', 'fir_year')
+
+# section key in case details -> (table, row fields)
+CHILD_TABLES = {
+    'case_history': ('hearings', ('registration_number', 'judge', 'business_date', 'hearing_date', 'purpose')),
+    'orders': ('orders', ('order_number', 'order_date', 'order_details', 'download_link')),
+    'acts': ('acts', ('under_act', 'under_section')),
+    'process_details': ('process_details', ('process_id', 'process_date', 'process_title', 'party_name', 'issued_process')),
+}
+
+# The CNR as printed on the page; it identifies the case, so differences are not recorded as changes
+UNTRACKED_FIELDS = ('cnr_number',)
+
+# table -> fields identifying a row, for tables whose other fields may be
+# corrected in place; rows of the other tables are identified by all fields
+ROW_KEY_FIELDS = {
+    'orders': ('order_number', 'order_date'),
+}
+
+PARTY_ROLES = {'petitioners': 'petitioner', 'respondents': 'respondent'}
+
+# Downloaded order file columns, filled in by order_downloader.py; they are
+# not part of the row, so they survive refreshes of the case
+ORDER_FILE_COLUMNS = (('file_sha256', 'TEXT'), ('file_size', 'INTEGER'), ('downloaded_at', 'DATETIME'),
+                      ('download_attempts', 'INTEGER DEFAULT 0'), ('download_error', 'TEXT'))
+
+_DATE_FORMATS = ('%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y', '%d-%m-%y', '%d %B %Y', '%d %b %Y', '%Y-%m-%d')
+_ORDINAL = re.compile(r'(\d+)(st|nd|rd|th)\b', re.IGNORECASE)
+
+
+def parse_court_date(text) -> Optional[str]:
+    """ISO date for the date formats used on eCourts pages, or None"""
+    text = _ORDINAL.sub(r'\1', (text or '').strip())
+    for date_format in _DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def next_hearing_date(case_details: Dict[str, Any]) -> Optional[str]:
+    """The hearing date of the latest case_history entry, as an ISO date"""
+    for hearing in reversed(case_details.get('case_history') or []):
+        date = parse_court_date(hearing.get('hearing_date'))
+        if date:
+            return date
+    return None
+
+
+def _digest(value) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+def _row_keys(rows, key_fields):
+    """Row keys for child rows in page order: a hash of the key fields"""
+    keys = []
+    for row in rows:
+        key = _digest({field: row.get(field) for field in key_fields})
+        # Identical rows (e.g. two equal hearings) get distinct keys
+        while key in keys:
+            key = _digest([key])
+        keys.append(key)
+    return keys
+
+
+def _party_rows(case_details):
+    return [
+        {'role': role, 'name': name}
+        for key, role in PARTY_ROLES.items()
+        for name in case_details.get(key) or []
+    ]
+
+
+class CaseStore:
+    def __init__(self, db_path: str = "cases.db"):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.init_database()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA foreign_keys=ON')
+        return conn
+
+    def init_database(self):
+        """Initialize the case tables"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS cases (
+                    cino TEXT PRIMARY KEY,
+                    court_url TEXT,
+                    {', '.join(f'{field} TEXT' for field in CASE_FIELDS)},
+                    next_hearing_date TEXT,
+                    content_hash TEXT,
+                    first_seen DATETIME,
+                    last_refreshed DATETIME,
+                    last_changed DATETIME
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cases_next_hearing ON cases (next_hearing_date)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_cases_court ON cases (court_url)')
+            cursor.execute('PRAGMA table_info(cases)')
+            if 'cnr_number' not in [column[1] for column in cursor.fetchall()]:
+                # Filled in when a case is next written; clearing the hash makes that the next refresh
+                cursor.execute('ALTER TABLE cases ADD COLUMN cnr_number TEXT')
+                cursor.execute('UPDATE cases SET content_hash = NULL')
+            # Child rows are identified by a hash of their key fields; `position` keeps the page order
+            for table, fields in list(CHILD_TABLES.values()) + [('parties', ('role', 'name'))]:
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        cino TEXT REFERENCES cases (cino) ON DELETE CASCADE,
+                        row_key TEXT,
+                        position INTEGER,
+                        {', '.join(f'{field} TEXT' for field in fields)},
+                        first_seen DATETIME,
+                        PRIMARY KEY (cino, row_key)
+                    )
+                ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_hearings_date ON hearings (hearing_date)')
+            cursor.execute('PRAGMA table_info(orders)')
+            columns = [column[1] for column in cursor.fetchall()]
+            for column, column_type in ORDER_FILE_COLUMNS:
+                if column not in columns:
+                    cursor.execute(f'ALTER TABLE orders ADD COLUMN {column} {column_type}')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_file ON orders (file_sha256)')
+            if cursor.execute('PRAGMA user_version').fetchone()[0] < 1:
+                self._rekey_orders(cursor)
+                cursor.execute('PRAGMA user_version = 1')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS case_changes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    cino TEXT,
+                    changed_at DATETIME,
+                    kind TEXT,
+                    detail TEXT
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_case_changes_cino ON case_changes (cino, id)')
+            conn.commit()
+            cursor.execute('PRAGMA journal_mode=WAL').fetchone()
+
+    def _rekey_orders(self, cursor):
+        """Re-key order rows stored when all their fields made up the key"""
+        fields = ('order_number', 'order_date')
+        rows = cursor.execute(f"SELECT cino, row_key, {', '.join(fields)} FROM orders ORDER BY cino, position").fetchall()
+        by_case = {}
+        for cino, row_key, *values in rows:
+            by_case.setdefault(cino, []).append((row_key, dict(zip(fields, values))))
+        updates = []
+        for cino, case_rows in by_case.items():
+            new_keys = _row_keys([values for _, values in case_rows], fields)
+            updates.extend((new_key, cino, row_key) for (row_key, _), new_key in zip(case_rows, new_keys))
+        # Through a temporary prefix, so no new key collides with an old one still in place
+        cursor.executemany("UPDATE orders SET row_key = '~' || ? WHERE cino = ? AND row_key = ?", updates)
+        cursor.execute("UPDATE orders SET row_key = substr(row_key, 2) WHERE row_key LIKE '~%'")
+
+    def _load_children(self, conn, cino, table, fields):
+        rows = conn.execute(
+            f"SELECT row_key, {', '.join(fields)} FROM {table} WHERE cino = ? ORDER BY position", (cino,)
+        ).fetchall()
+        return {row[0]: dict(zip(fields, row[1:])) for row in rows}
+
+    def _sync_children(self, conn, cino, table, fields, rows, now):
+        """Bring a child table in line with `rows`; returns (added rows, removed rows, (old, new) updated rows)"""
+        stored = self._load_children(conn, cino, table, fields)
+        rows = [{field: row.get(field) for field in fields} for row in rows]
+        keyed = dict(zip(_row_keys(rows, ROW_KEY_FIELDS.get(table, fields)), rows))
+
+        added = [values for key, values in keyed.items() if key not in stored]
+        removed = [values for key, values in stored.items() if key not in keyed]
+        updated = [(stored[key], values) for key, values in keyed.items() if key in stored and stored[key] != values]
+        conn.executemany(f'DELETE FROM {table} WHERE cino = ? AND row_key = ?',
+                         [(cino, key) for key in stored if key not in keyed])
+        conn.executemany(f'''
+            INSERT INTO {table} (cino, row_key, position, {', '.join(fields)}, first_seen)
+            VALUES (?, ?, ?, {', '.join('?' for _ in fields)}, ?)
+            ON CONFLICT (cino, row_key) DO UPDATE SET position = excluded.position,
+                {', '.join(f'{field} = excluded.{field}' for field in fields)}
+        ''', [(cino, key, position, *values.values(), now) for position, (key, values) in enumerate(keyed.items())])
+        return added, removed, updated
+
+    def upsert_case(self, court_url, cino, case_details: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Store a parsed case, writing only what changed since the last refresh.
+
+        Returns:
+            The changes recorded for this refresh (empty if nothing changed),
+            each a dict with 'kind' plus details, e.g. {'kind':
+            'next_hearing_date_changed', 'old': ..., 'new': ...} or
+            {'kind': 'new_order', 'order': {...}}
+        """
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        digest = _digest(case_details)
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                f"SELECT content_hash, next_hearing_date, {', '.join(CASE_FIELDS)} FROM cases WHERE cino = ?", (cino,)
+            ).fetchone()
+            if row and row[0] == digest:
+                conn.execute('UPDATE cases SET last_refreshed = ? WHERE cino = ?', (now, cino))
+                return []
+
+            new_case = {field: case_details.get(field) for field in CASE_FIELDS}
+            new_next_hearing = next_hearing_date(case_details)
+            changes = []
+            if row is None:
+                changes.append({'kind': 'new_case', 'next_hearing_date': new_next_hearing})
+            else:
+                old_case = dict(zip(CASE_FIELDS, row[2:]))
+                if row[1] != new_next_hearing:
+                    changes.append({'kind': 'next_hearing_date_changed', 'old': row[1], 'new': new_next_hearing})
+                for field in CASE_FIELDS:
+                    if old_case[field] != new_case[field] and field not in UNTRACKED_FIELDS:
+                        changes.append({'kind': f'{field}_changed', 'old': old_case[field], 'new': new_case[field]})
+
+            conn.execute(f'''
+                INSERT INTO cases (cino, court_url, {', '.join(CASE_FIELDS)}, next_hearing_date, content_hash,
+                                   first_seen, last_refreshed, last_changed)
+                VALUES (?, ?, {', '.join('?' for _ in CASE_FIELDS)}, ?, ?, ?, ?, ?)
+                ON CONFLICT (cino) DO UPDATE SET
+                    court_url = excluded.court_url,
+                    {', '.join(f'{field} = excluded.{field}' for field in CASE_FIELDS)},
+                    next_hearing_date = excluded.next_hearing_date,
+                    content_hash = excluded.content_hash,
+                    last_refreshed = excluded.last_refreshed,
+                    last_changed = excluded.last_changed
+            ''', (cino, court_url, *new_case.values(), new_next_hearing, digest, now, now, now))
+
+            sections = [(key, table, fields, case_details.get(key) or []) for key, (table, fields) in CHILD_TABLES.items()]
+            sections.append(('parties', 'parties', ('role', 'name'), _party_rows(case_details)))
+            for key, table, fields, rows in sections:
+                added, removed, updated = self._sync_children(conn, cino, table, fields, rows, now)
+                if row is None:
+                    continue
+                if key == 'orders':
+                    changes.extend({'kind': 'new_order', 'order': order} for order in added)
+                    changes.extend({'kind': 'order_updated', 'old': old, 'new': new} for old, new in updated)
+                elif key == 'case_history':
+                    changes.extend({'kind': 'new_hearing', 'hearing': hearing} for hearing in added)
+                elif added:
+                    changes.append({'kind': f'{key}_added', 'rows': added})
+                if removed:
+                    changes.append({'kind': f'{key}_removed', 'rows': removed})
+
+            conn.executemany(
+                'INSERT INTO case_changes (cino, changed_at, kind, detail) VALUES (?, ?, ?, ?)',
+                [(cino, now, change['kind'], json.dumps(change, ensure_ascii=False)) for change in changes]
+            )
+            return changes
+
+    def get_case_row(self, cino) -> Optional[Dict[str, Any]]:
+        """The `cases` row of a stored case, without its child tables"""
+        with self._connect() as conn:
+            cursor = conn.execute('SELECT * FROM cases WHERE cino = ?', (cino,))
+            row = cursor.fetchone()
+            return dict(zip([column[0] for column in cursor.description], row)) if row else None
+
+    def get_case(self, cino) -> Optional[Dict[str, Any]]:
+        """Rebuild the parse_case_details dict for a stored case"""
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT court_url, next_hearing_date, last_refreshed, {', '.join(CASE_FIELDS)} FROM cases WHERE cino = ?",
+                (cino,)
+            ).fetchone()
+            if row is None:
+                return None
+            case_details = {'cino': cino}
+            case_details.update((field, value) for field, value in zip(CASE_FIELDS, row[3:]) if value is not None)
+            parties = self._load_children(conn, cino, 'parties', ('role', 'name')).values()
+            for key, role in PARTY_ROLES.items():
+                names = [party['name'] for party in parties if party['role'] == role]
+                if names:
+                    case_details[key] = names
+            for key, (table, fields) in CHILD_TABLES.items():
+                rows = self._load_children(conn, cino, table, fields)
+                if table == 'orders':
+                    for row_key, file in self._order_files(conn, cino).items():
+                        rows[row_key]['file'] = file
+                if rows:
+                    case_details[key] = list(rows.values())
+        case_details['court_url'], case_details['next_hearing_date'], case_details['last_refreshed'] = row[:3]
+        return case_details
+
+    def _order_files(self, conn, cino):
+        rows = conn.execute('''
+            SELECT row_key, file_sha256, file_size, downloaded_at FROM orders
+            WHERE cino = ? AND file_sha256 IS NOT NULL
+        ''', (cino,)).fetchall()
+        return {row[0]: {'sha256': row[1], 'size': row[2], 'downloaded_at': row[3]} for row in rows}
+
+    def pending_orders(self, cino, max_attempts: int = 3) -> List[Dict[str, Any]]:
+        """Orders of a case with a download link whose file is not stored yet"""
+        with self._connect() as conn:
+            rows = conn.execute('''
+                SELECT row_key, order_number, order_date, download_link FROM orders
+                WHERE cino = ? AND download_link IS NOT NULL AND file_sha256 IS NULL
+                    AND COALESCE(download_attempts, 0) < ?
+                ORDER BY position
+            ''', (cino, max_attempts)).fetchall()
+        return [dict(zip(('row_key', 'order_number', 'order_date', 'download_link'), row)) for row in rows]
+
+    def record_order_file(self, cino, row_key, sha256=None, size=None, error=None):
+        """Store the outcome of an order download; failures count towards its attempts"""
+        now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock, self._connect() as conn:
+            conn.execute('''
+                UPDATE orders SET file_sha256 = ?, file_size = ?, downloaded_at = ?, download_error = ?,
+                    download_attempts = COALESCE(download_attempts, 0) + 1
+                WHERE cino = ? AND row_key = ?
+            ''', (sha256, size, now if sha256 else None, error, cino, row_key))
+
+    def has_order_file(self, sha256) -> bool:
+        """Whether any stored order refers to the file with this hash"""
+        with self._connect() as conn:
+            return conn.execute('SELECT 1 FROM orders WHERE file_sha256 = ? LIMIT 1', (sha256,)).fetchone() is not None
+
+    def get_changes(self, cino=None, since_id: int = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Recorded changes, oldest first, optionally for one case and after a change id"""
+        clauses, params = [], []
+        if cino:
+            clauses.append('cino = ?')
+            params.append(cino)
+        if since_id is not None:
+            clauses.append('id > ?')
+            params.append(since_id)
+        where = (' WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        with self._connect() as conn:
+            rows = conn.execute(
+                f'SELECT id, cino, changed_at, detail FROM case_changes{where} ORDER BY id LIMIT ?', params + [limit]
+            ).fetchall()
+        return [{'id': row[0], 'cino': row[1], 'changed_at': row[2], **json.loads(row[3])} for row in rows]
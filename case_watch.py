@@ -0,0 +1,360 @@
+"""
+Background refreshes for a watch list of cases.
+
+Each watched case has a due time derived from its next hearing date and
+status (see `next_refresh_at`): cases with an imminent hearing are
+refreshed often, pending cases at least weekly, disposed cases rarely. Due
+cases are taken from a heap ordered by due time, then by hearing date, and
+refreshed by a small pool of workers that share one pooled session per
+court and stay within a per-court request budget.
+"""
+import asyncio
+import heapq
+import sqlite3
+import time
+from datetime import date, datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+
+from case_cache import is_disposed
+from telemetry import log
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# How long after a hearing without a new date the case keeps the hearing interval
+HEARING_GRACE = 3 * DAY
+
+# Session pool client token under which the watcher's sessions are kept
+WATCH_CLIENT_TOKEN = "case-watch"
+
+# Pause of a worker after an unexpected error, doubling while errors repeat
+WORKER_ERROR_DELAY = 5
+WORKER_ERROR_MAX_DELAY = 5 * 60
+
+
+def _hearing_epoch(next_hearing_date: Optional[str]) -> Optional[float]:
+    if not next_hearing_date:
+        return None
+    try:
+        return time.mktime(date.fromisoformat(next_hearing_date).timetuple())
+    except ValueError:
+        return None
+
+
+def next_refresh_at(now: float, next_hearing_date: Optional[str], disposed: bool, failures: int = 0) -> float:
+    """
+    When a case should be refreshed next.
+
+    - failed refreshes back off exponentially from 5 minutes up to 6 hours
+    - disposed cases: every 30 days
+    - hearing within 2 days, or passed in the last 3 days without a new
+      date yet: every 6 hours
+    - hearing further out: the day before it, but at least weekly
+    - no known hearing date, or one passed longer ago: daily
+    """
+    if failures:
+        return now + min(300 * 2 ** (failures - 1), 6 * HOUR)
+    if disposed:
+        return now + 30 * DAY
+    hearing = _hearing_epoch(next_hearing_date)
+    if hearing is None or hearing < now - HEARING_GRACE:
+        return now + DAY
+    if hearing - now <= 2 * DAY:
+        return now + 6 * HOUR
+    return min(hearing - DAY, now + 7 * DAY)
+
+
+class CourtBudget:
+    """Token bucket of refresh requests per court host"""
+
+    def __init__(self, per_minute: float = 6, burst: int = 3):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self._buckets: Dict[str, List[float]] = {}
+
+    def _refill(self, court_url, now):
+        host = urlsplit(court_url).netloc or court_url
+        tokens, updated = self._buckets.get(host, [self.burst, now])
+        return host, min(self.burst, tokens + (now - updated) * self.rate)
+
+    def reserve(self, court_url, now: Optional[float] = None) -> float:
+        """
+        Takes a token for the court if one is available and returns 0,
+        otherwise returns the seconds until one will be.
+        """
+        now = time.monotonic() if now is None else now
+        host, tokens = self._refill(court_url, now)
+        if tokens >= 1:
+            self._buckets[host] = [tokens - 1, now]
+            return 0
+        self._buckets[host] = [tokens, now]
+        return (1 - tokens) / self.rate
+
+    def take(self, court_url, count: int, now: Optional[float] = None) -> int:
+        """Takes up to `count` tokens available for the court right now; returns how many were taken"""
+        now = time.monotonic() if now is None else now
+        host, tokens = self._refill(court_url, now)
+        taken = max(0, min(count, int(tokens)))
+        self._buckets[host] = [tokens - taken, now]
+        return taken
+
+
+class CaseWatcher:
+    def __init__(self, case_store, session_pool, cache=None, workers: int = 2,
+                 court_budget: Optional[CourtBudget] = None,
+                 on_changes: Optional[Callable[[str, list], Awaitable[None]]] = None,
+                 order_downloader=None):
+        """
+        Args:
+            case_store: CaseStore the refreshed cases are written to; the
+                watch list is kept in the same database
+            session_pool: ScraperSessionPool building AsyncECourtsScraper sessions
+            cache: Optional CaseCache updated with refreshed details
+            workers: Concurrent refreshes
+            court_budget: Per-court request budget, 6 per minute by default
+            on_changes: Async callback receiving (cino, changes) when a
+                refresh changed something
+            order_downloader: Optional OrderDownloader fetching the order
+                PDFs not stored yet after each refresh, each download
+                taking a request from the court's budget
+        """
+        self.case_store = case_store
+        self.db_path = case_store.db_path
+        self.session_pool = session_pool
+        self.cache = cache
+        self.workers = workers
+        self.court_budget = court_budget or CourtBudget()
+        self.on_changes = on_changes
+        self.order_downloader = order_downloader
+        self._heap = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._court_locks: Dict[str, asyncio.Lock] = {}
+        self.refreshed = 0
+        self.failed = 0
+        self.init_database()
+
+    def _connect(self):
+        # The case store writes to the same database, so wait for its locks as long as it does
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_database(self):
+        """Initialize the watch list table"""
+        with self._connect() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS case_watch (
+                    cino TEXT PRIMARY KEY,
+                    court_url TEXT,
+                    next_refresh_at REAL,
+                    next_hearing_date TEXT,
+                    failures INTEGER DEFAULT 0,
+                    last_error TEXT,
+                    added_at DATETIME DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_case_watch_due ON case_watch (next_refresh_at)')
+            conn.commit()
+
+    def _push(self, cino, court_url, due, next_hearing_date):
+        # Among equally due cases the one with the nearer hearing goes first
+        heapq.heappush(self._heap, (due, next_hearing_date or '9999-12-31', cino, court_url))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _save(self, cino, due, next_hearing_date, failures=0, last_error=None):
+        with self._connect() as conn:
+            conn.execute('''
+                UPDATE case_watch SET next_refresh_at = ?, next_hearing_date = ?, failures = ?, last_error = ?
+                WHERE cino = ?
+            ''', (due, next_hearing_date, failures, last_error, cino))
+            conn.commit()
+
+    def _store_watch(self, cino, court_url, refresh_now):
+        stored = self.case_store.get_case_row(cino)
+        next_hearing_date = stored.get('next_hearing_date') if stored else None
+        due = time.time() if refresh_now or not stored else next_refresh_at(
+            time.time(), next_hearing_date, is_disposed(stored))
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT INTO case_watch (cino, court_url, next_refresh_at, next_hearing_date) VALUES (?, ?, ?, ?)
+                ON CONFLICT (cino) DO UPDATE SET court_url = excluded.court_url,
+                    next_refresh_at = excluded.next_refresh_at, failures = 0
+            ''', (cino, court_url, due, next_hearing_date))
+            conn.commit()
+        return due, next_hearing_date
+
+    def watch(self, cino, court_url, refresh_now: bool = True):
+        """Add a case to the watch list (or move it to the court given)"""
+        due, next_hearing_date = self._store_watch(cino, court_url, refresh_now)
+        self._push(cino, court_url, due, next_hearing_date)
+
+    async def watch_async(self, cino, court_url, refresh_now: bool = True):
+        """watch() for the event loop: the database writes run in a thread, the heap is updated on the loop"""
+        due, next_hearing_date = await asyncio.to_thread(self._store_watch, cino, court_url, refresh_now)
+        self._push(cino, court_url, due, next_hearing_date)
+
+    def unwatch(self, cino) -> bool:
+        """Remove a case from the watch list; stale heap entries are skipped when popped"""
+        with self._connect() as conn:
+            removed = conn.execute('DELETE FROM case_watch WHERE cino = ?', (cino,)).rowcount
+            conn.commit()
+        return bool(removed)
+
+    def list_watched(self, limit: int = 100, offset: int = 0):
+        """Watched cases, soonest refresh first"""
+        with self._connect() as conn:
+            rows = conn.execute('''
+                SELECT cino, court_url, next_refresh_at, next_hearing_date, failures, last_error
+                FROM case_watch ORDER BY next_refresh_at LIMIT ? OFFSET ?
+            ''', (limit, offset)).fetchall()
+        return [
+            {'cino': cino, 'court_url': court_url,
+             'next_refresh_at': datetime.utcfromtimestamp(due).strftime('%Y-%m-%d %H:%M:%S'),
+             'next_hearing_date': hearing, 'failures': failures, 'last_error': error}
+            for cino, court_url, due, hearing, failures, error in rows
+        ]
+
+    def _current(self, cino):
+        with self._connect() as conn:
+            return conn.execute(
+                'SELECT court_url, next_refresh_at, failures, next_hearing_date FROM case_watch WHERE cino = ?', (cino,)
+            ).fetchone()
+
+    def _save_due(self, cino, due):
+        with self._connect() as conn:
+            conn.execute('UPDATE case_watch SET next_refresh_at = ? WHERE cino = ?', (due, cino))
+            conn.commit()
+
+    async def _postpone(self, cino, court_url, due, next_hearing_date):
+        await asyncio.to_thread(self._save_due, cino, due)
+        self._push(cino, court_url, due, next_hearing_date)
+
+    def _reschedule(self, cino, due, next_hearing_date, failures, error) -> bool:
+        """Store the next refresh of a case still on the watch list; False once it was unwatched"""
+        if not self._current(cino):
+            return False
+        self._save(cino, due, next_hearing_date, failures, error)
+        return True
+
+    async def _session(self, court_url, force_refresh=False):
+        lock = self._court_locks.setdefault(court_url, asyncio.Lock())
+        async with lock:
+            return await self.session_pool.acquire_async(WATCH_CLIENT_TOKEN, court_url, force_refresh=force_refresh)
+
+    async def refresh(self, cino, court_url, failures=0) -> Optional[list]:
+        """Fetch and store one case; returns its changes, or None if the fetch failed"""
+        scraper = await self._session(court_url, force_refresh=failures > 0)
+        case_details = await scraper.get_case_details(cino) if scraper else None
+        if case_details is None:
+            return None
+        if self.cache is not None:
+            await self.cache.put_details_async(court_url, cino, case_details)
+        changes = await asyncio.to_thread(self.case_store.upsert_case, court_url, cino, case_details)
+        if self.order_downloader is not None:
+            try:
+                # Orders over the court's budget are left for the next refresh
+                await self.order_downloader.download_case(
+                    scraper, cino, reserve=lambda count: self.court_budget.take(court_url, count))
+            except Exception as e:
+                log('order_downloads_failed', level='warning', cino=cino, error=str(e))
+        return changes
+
+    async def _next_due(self):
+        """Wait for and pop the next due heap entry"""
+        while True:
+            now = time.time()
+            if self._heap and self._heap[0][0] <= now:
+                return heapq.heappop(self._heap)
+            self._wakeup.clear()
+            timeout = self._heap[0][0] - now if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process(self, due, cino, court_url):
+        """Refresh a popped case and schedule its next refresh"""
+        current = await asyncio.to_thread(self._current, cino)
+        # Skip entries for unwatched or since rescheduled cases
+        if not current or current[0] != court_url or current[1] != due:
+            return
+        failures, next_hearing_date = current[2], current[3]
+
+        wait = self.court_budget.reserve(court_url)
+        if wait:
+            # Over the court's budget, come back when a request is available
+            await self._postpone(cino, court_url, time.time() + wait, next_hearing_date)
+            return
+
+        try:
+            changes = await self.refresh(cino, court_url, failures)
+            error = None if changes is not None else "Case details could not be fetched"
+        except Exception as e:
+            changes, error = None, str(e)
+
+        stored = await asyncio.to_thread(self.case_store.get_case_row, cino)
+        next_hearing_date = stored.get('next_hearing_date') if stored else None
+        if error:
+            self.failed += 1
+            failures += 1
+            log('case_watch_refresh', level='warning', outcome='error', cino=cino, failures=failures, error=error)
+        else:
+            self.refreshed += 1
+            failures = 0
+            if changes and self.on_changes:
+                try:
+                    await self.on_changes(cino, changes)
+                except Exception as e:
+                    log('case_watch_callback_failed', level='error', cino=cino, error=str(e))
+        due = next_refresh_at(time.time(), next_hearing_date, bool(stored) and is_disposed(stored), failures)
+        if await asyncio.to_thread(self._reschedule, cino, due, next_hearing_date, failures, error):
+            self._push(cino, court_url, due, next_hearing_date)
+
+    async def _worker(self):
+        errors = 0
+        while True:
+            due, hearing, cino, court_url = await self._next_due()
+            try:
+                await self._process(due, cino, court_url)
+                errors = 0
+            except Exception as e:
+                # e.g. "database is locked": put the case back and pause instead of ending the worker
+                errors += 1
+                delay = min(WORKER_ERROR_DELAY * 2 ** (errors - 1), WORKER_ERROR_MAX_DELAY)
+                log('case_watch_error', level='error', cino=cino, error=str(e), retry_in=delay)
+                self._push(cino, court_url, due, hearing)
+                await asyncio.sleep(delay)
+
+    def start(self):
+        """Load the watch list and start the workers on the running event loop"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        with self._connect() as conn:
+            rows = conn.execute('SELECT cino, court_url, next_refresh_at, next_hearing_date FROM case_watch').fetchall()
+        self._heap = [(due, hearing or '9999-12-31', cino, court_url) for cino, court_url, due, hearing in rows]
+        heapq.heapify(self._heap)
+        self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+        log('case_watch_started', cases=len(rows), workers=self.workers)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def get_stats(self):
+        with self._connect() as conn:
+            watched, overdue = conn.execute(
+                'SELECT COUNT(*), SUM(next_refresh_at <= ?) FROM case_watch', (time.time(),)
+            ).fetchone()
+        return {
+            'watched': watched,
+            'overdue': overdue or 0,
+            'queued': len(self._heap),
+            'refreshed': self.refreshed,
+            'failed': self.failed,
+            'workers': self.workers,
+            'running_workers': sum(not task.done() for task in self._tasks)
+        }
@@ -0,0 +1,220 @@
+"""
+Indexed, read-only view of ecourts_data.json.
+
+The directory is built once at startup: sorted state and district lists
+(with their JSON responses pre-encoded), a normalized-name index so
+"tamil nadu", "Tamil Nadu " and "TAMIL-NADU" resolve to the same state,
+word-prefix and fuzzy search for typeahead, and a reverse index from a
+court URL (or just its host) to (state, district).
+
+The built indexes and pre-encoded responses are cached in a marshal
+snapshot next to the source file, so a start with an unchanged source
+skips parsing the JSON and building them; the snapshot is rebuilt
+whenever the source changes.
+"""
+import bisect
+import difflib
+import hashlib
+import json
+import marshal
+import os
+import re
+import sys
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from telemetry import log
+
+_NON_ALNUM = re.compile(r'[^0-9a-z]+')
+
+
+def normalize_name(name) -> str:
+    """Case, accent, punctuation and whitespace insensitive form of a name"""
+    name = unicodedata.normalize('NFKD', str(name or '')).encode('ascii', 'ignore').decode('ascii')
+    name = name.casefold().replace('&', ' and ')
+    return _NON_ALNUM.sub(' ', name).strip()
+
+
+def url_key(court_url) -> Optional[str]:
+    """host/path of a court URL without scheme, 'www.' or trailing slash"""
+    if not court_url:
+        return None
+    parts = urlsplit(court_url if '//' in court_url else f'//{court_url}')
+    host = parts.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return host + parts.path.rstrip('/').lower()
+
+
+class CourtDirectory:
+    """
+    Rows are (state, district, court_url) tuples; everything else is derived
+    from them. Instances are immutable after construction, so they can be
+    shared across requests without locking.
+    """
+
+    SNAPSHOT_VERSION = 2
+
+    def __init__(self, rows: List[Tuple[str, str, Optional[str]]]):
+        self.rows = sorted(rows, key=lambda row: (row[0].casefold(), row[1].casefold()))
+        self.states: List[str] = sorted({row[0] for row in self.rows}, key=str.casefold)
+        self._districts: Dict[str, List[str]] = {state: [] for state in self.states}
+        self._court_urls: Dict[Tuple[str, str], Optional[str]] = {}
+        self._state_index: Dict[str, str] = {}
+        self._district_index: Dict[Tuple[str, str], str] = {}
+        self._url_index: Dict[str, Tuple[str, str]] = {}
+        self._host_index: Dict[str, List[Tuple[str, str]]] = {}
+        # (word-prefix key, row index) pairs, sorted for bisect
+        self._prefixes: List[Tuple[str, int]] = []
+
+        for state in self.states:
+            self._state_index.setdefault(normalize_name(state), state)
+        for i, (state, district, court_url) in enumerate(self.rows):
+            self._districts[state].append(district)
+            self._court_urls[(state, district)] = court_url
+            self._district_index.setdefault((state, normalize_name(district)), district)
+            key = url_key(court_url)
+            if key:
+                self._url_index.setdefault(key, (state, district))
+                self._host_index.setdefault(key.split('/', 1)[0], []).append((state, district))
+            words = normalize_name(district).split()
+            for start in range(len(words)):
+                self._prefixes.append((' '.join(words[start:]), i))
+        self._prefixes.sort()
+        self._prefix_rows: Dict[str, List[int]] = {}
+        for key, i in self._prefixes:
+            self._prefix_rows.setdefault(key, []).append(i)
+        self._prefix_keys = list(self._prefix_rows)
+
+        self.states_json = json.dumps({"success": True, "states": self.states}, ensure_ascii=False).encode('utf-8')
+        self._districts_json = {
+            state: json.dumps({"success": True, "districts": districts}, ensure_ascii=False).encode('utf-8')
+            for state, districts in self._districts.items()
+        }
+        self.etag = hashlib.sha256(repr(self.rows).encode('utf-8')).hexdigest()[:16]
+
+    @classmethod
+    def from_data(cls, ecourts_data: dict) -> 'CourtDirectory':
+        """Build from the ecourts_data.json structure"""
+        return cls([
+            (state, district, info.get('court_url'))
+            for state, state_data in ecourts_data.items()
+            for district, info in state_data.get('districts', {}).items()
+        ])
+
+    @classmethod
+    def load(cls, path: str = 'ecourts_data.json', snapshot_path: Optional[str] = None) -> 'CourtDirectory':
+        """
+        Load the directory for `path`, from its snapshot when that was
+        written for the current source file, otherwise from the JSON (and
+        refresh the snapshot). A missing source gives an empty directory.
+        """
+        snapshot_path = snapshot_path or f"{os.path.splitext(path)[0]}.snapshot"
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return cls([])
+        source_id = (cls.SNAPSHOT_VERSION, tuple(sys.version_info[:2]), stat.st_size, stat.st_mtime_ns)
+
+        try:
+            # Read whole: marshal.load on the file object reads it piecemeal and is far slower
+            with open(snapshot_path, 'rb') as f:
+                snapshot_id, state = marshal.loads(f.read())
+            if snapshot_id == source_id:
+                directory = cls.__new__(cls)
+                directory.__dict__.update(state)
+                return directory
+        except (FileNotFoundError, EOFError, ValueError, TypeError):
+            pass
+
+        with open(path, 'r', encoding='utf-8') as f:
+            directory = cls.from_data(json.load(f))
+        try:
+            tmp_path = f"{snapshot_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                # Every attribute is built from plain lists, dicts, tuples, str and bytes
+                f.write(marshal.dumps((source_id, vars(directory))))
+            os.replace(tmp_path, snapshot_path)
+        except OSError as e:
+            log('court_directory_snapshot_failed', level='warning', path=snapshot_path, error=str(e))
+        return directory
+
+    def __len__(self):
+        return len(self.rows)
+
+    def resolve_state(self, state_name) -> Optional[str]:
+        """Canonical state name for any spelling that normalizes to it"""
+        if state_name in self._districts:
+            return state_name
+        return self._state_index.get(normalize_name(state_name))
+
+    def resolve_district(self, state_name, district_name) -> Optional[Tuple[str, str]]:
+        """Canonical (state, district) names, or None if either is unknown"""
+        state = self.resolve_state(state_name)
+        if state is None:
+            return None
+        if (state, district_name) in self._court_urls:
+            return state, district_name
+        district = self._district_index.get((state, normalize_name(district_name)))
+        return (state, district) if district else None
+
+    def districts(self, state_name) -> Optional[List[str]]:
+        state = self.resolve_state(state_name)
+        return self._districts[state] if state else None
+
+    def districts_json(self, state_name) -> Optional[bytes]:
+        """Pre-encoded /api/districts response body for a state"""
+        state = self.resolve_state(state_name)
+        return self._districts_json[state] if state else None
+
+    def court_url(self, state_name, district_name) -> Optional[str]:
+        resolved = self.resolve_district(state_name, district_name)
+        return self._court_urls[resolved] if resolved else None
+
+    def lookup_url(self, court_url) -> Optional[Tuple[str, str]]:
+        """
+        (state, district) for a court URL. Falls back to matching the host
+        alone when exactly one district lives on it.
+        """
+        key = url_key(court_url)
+        if not key:
+            return None
+        if key in self._url_index:
+            return self._url_index[key]
+        matches = self._host_index.get(key.split('/', 1)[0], [])
+        return matches[0] if len(matches) == 1 else None
+
+    def _entry(self, i):
+        state, district, court_url = self.rows[i]
+        return {"state": state, "district": district, "court_url": court_url}
+
+    def search(self, query, state_name=None, limit: int = 10, fuzzy: bool = True) -> List[dict]:
+        """
+        Typeahead search over district names. Matches on the start of any
+        word first (so "andaman" finds "North and Middle Andaman"), then,
+        if that leaves room, on close spellings.
+        """
+        query = normalize_name(query)
+        state = self.resolve_state(state_name) if state_name else None
+        if not query or (state_name and state is None):
+            return []
+
+        matches, seen = [], set()
+        start = bisect.bisect_left(self._prefixes, (query, -1))
+        for key, i in self._prefixes[start:]:
+            if not key.startswith(query):
+                break
+            if i not in seen and (state is None or self.rows[i][0] == state):
+                matches.append(i)
+                seen.add(i)
+        matches.sort(key=lambda i: (not normalize_name(self.rows[i][1]).startswith(query), i))
+
+        if fuzzy and len(matches) < limit:
+            for key in difflib.get_close_matches(query, self._prefix_keys, n=limit * 2, cutoff=0.75):
+                for i in self._prefix_rows[key]:
+                    if i not in seen and (state is None or self.rows[i][0] == state):
+                        matches.append(i)
+                        seen.add(i)
+
+        return [self._entry(i) for i in matches[:limit]]
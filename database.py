@@ -1,12 +1,97 @@
 import sqlite3
 import json
+import queue
+import threading
 from datetime import datetime
 from typing import Dict, Any
 
+from telemetry import log
+
+# Column order of query_logs rows returned to the admin page
+LOG_COLUMNS = ('id', 'timestamp', 'state', 'district', 'court_complex', 'case_type', 'case_number',
+               'case_year', 'captcha_value', 'request_data', 'response_data', 'raw_json_response',
+               'success', 'error_message', 'latency_ms')
+
+# Projection without the request/response JSON payloads
+LOG_SUMMARY_COLUMNS = ('id', 'timestamp', 'state', 'district', 'court_complex', 'case_type', 'case_number',
+                       'case_year', 'success', 'error_message', 'latency_ms')
+
+# raw_json_response is stored only when it differs from response_data
+LOG_COLUMN_SQL = {
+    'raw_json_response': 'CASE WHEN raw_is_response THEN response_data ELSE raw_json_response END'
+}
+
+
+def log_select(columns):
+    return 'SELECT ' + ', '.join(LOG_COLUMN_SQL.get(column, column) for column in columns) + ' FROM query_logs'
+
+
+def log_filters(state=None, district=None, success=None, since=None, until=None, before_id=None, after_id=None):
+    """
+    WHERE clause and parameters for query log filters. `since` is inclusive
+    and `until` exclusive; both are UTC 'YYYY-MM-DD[ HH:MM:SS]' strings.
+    """
+    clauses, params = [], []
+    for clause, value in (('state = ?', state), ('district = ?', district), ('timestamp >= ?', since),
+                          ('timestamp < ?', until), ('id < ?', before_id), ('id > ?', after_id)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    if success is not None:
+        clauses.append('success = ?')
+        params.append(1 if success else 0)
+    return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+# Upper bounds (ms) of the latency histogram buckets kept per district
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 3000, 5000, 8000, 13000, 20000, 30000, 60000, float('inf'))
+
+_STOP = object()
+
+
+def latency_bucket(latency_ms: float) -> int:
+    for bucket, upper in enumerate(LATENCY_BUCKETS_MS):
+        if latency_ms <= upper:
+            return bucket
+    return len(LATENCY_BUCKETS_MS) - 1
+
+
+def histogram_percentiles(counts: Dict[int, int], percentiles=(50, 90, 99)):
+    """Percentiles from a bucket histogram, reported as the bucket's upper bound"""
+    total = sum(counts.values())
+    if not total:
+        return {f'p{p}': None for p in percentiles}
+    result = {}
+    for p in percentiles:
+        threshold = total * p / 100
+        seen = 0
+        for bucket in sorted(counts):
+            seen += counts[bucket]
+            if seen >= threshold:
+                upper = LATENCY_BUCKETS_MS[bucket]
+                result[f'p{p}'] = None if upper == float('inf') else upper
+                break
+    return result
+
 class QueryLogger:
-    def __init__(self, db_path: str = "queries.db"):
+    def __init__(self, db_path: str = "queries.db", background: bool = True,
+                 queue_size: int = 10000, batch_size: int = 500):
+        """
+        Args:
+            db_path: SQLite database file
+            background: Write from a single background thread in batched
+                transactions instead of one connection and commit per query
+            queue_size: Pending log entries before log_query blocks
+            batch_size: Most entries written per transaction
+        """
         self.db_path = db_path
+        self.batch_size = batch_size
         self.init_database()
+        self._queue = None
+        self._writer = None
+        if background:
+            self._queue = queue.Queue(maxsize=queue_size)
+            self._writer = threading.Thread(target=self._write_loop, name="query-log-writer", daemon=True)
+            self._writer.start()
     
     def init_database(self):
         """Initialize the database with the required table"""
@@ -46,7 +131,56 @@ class QueryLogger:
                     # Add the new column to existing table
                     cursor.execute('ALTER TABLE query_logs ADD COLUMN raw_json_response TEXT')
             
+            cursor.execute("PRAGMA table_info(query_logs)")
+            columns = [column[1] for column in cursor.fetchall()]
+            if 'raw_is_response' not in columns:
+                cursor.execute('ALTER TABLE query_logs ADD COLUMN raw_is_response BOOLEAN DEFAULT 0')
+            if 'latency_ms' not in columns:
+                cursor.execute('ALTER TABLE query_logs ADD COLUMN latency_ms REAL')
+            
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_logs_timestamp ON query_logs (timestamp)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_logs_state_district ON query_logs (state, district)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_logs_success ON query_logs (success)')
+            
+            # Aggregates maintained on insert, so /api/stats never scans query_logs.
+            # Unknown state/district are stored as '' because NULLs never conflict.
+            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='query_summary'")
+            summary_exists = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS query_summary (
+                    day TEXT,
+                    state TEXT,
+                    district TEXT,
+                    success BOOLEAN,
+                    count INTEGER,
+                    latency_count INTEGER DEFAULT 0,
+                    latency_sum REAL DEFAULT 0,
+                    PRIMARY KEY (day, state, district, success)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS query_latency (
+                    state TEXT,
+                    district TEXT,
+                    bucket INTEGER,
+                    count INTEGER,
+                    PRIMARY KEY (state, district, bucket)
+                )
+            ''')
+            if not summary_exists:
+                # One-off backfill from the logs written before the summary existed
+                cursor.execute('''
+                    INSERT INTO query_summary (day, state, district, success, count, latency_count, latency_sum)
+                    SELECT date(timestamp), COALESCE(state, ''), COALESCE(district, ''), COALESCE(success, 0),
+                           COUNT(*), COUNT(latency_ms), COALESCE(SUM(latency_ms), 0)
+                    FROM query_logs
+                    GROUP BY date(timestamp), COALESCE(state, ''), COALESCE(district, ''), COALESCE(success, 0)
+                ''')
+            
             conn.commit()
+            
+            # WAL lets the admin endpoints read while the writer appends
+            cursor.execute('PRAGMA journal_mode=WAL').fetchone()
     
     def log_query(self, 
                   state: str = None,
@@ -60,69 +194,232 @@ class QueryLogger:
                   response_data: Dict[str, Any] = None,
                   raw_json_response: Dict[str, Any] = None,
                   success: bool = True,
-                  error_message: str = None):
-        """Log a query with all its details"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO query_logs 
-                (state, district, court_complex, case_type, case_number, case_year, 
-                 captcha_value, request_data, response_data, raw_json_response, success, error_message)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                state, district, court_complex, case_type, case_number, case_year,
-                captcha_value, 
-                json.dumps(request_data) if request_data else None,
-                json.dumps(response_data) if response_data else None,
-                json.dumps(raw_json_response) if raw_json_response else None,
-                success,
-                error_message
-            ))
-            conn.commit()
+                  error_message: str = None,
+                  latency_ms: float = None):
+        """
+        Log a query with all its details. In background mode the entry is
+        queued and written by the writer thread; this blocks only when the
+        queue is full.
+        """
+        entry = (state, district, court_complex, case_type, case_number, case_year,
+                 captcha_value, request_data, response_data, raw_json_response, success, error_message,
+                 latency_ms, datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'))
+        if self._queue is None:
+            self._write_batch(None, [entry])
+        else:
+            self._queue.put(entry)
+    
+    @staticmethod
+    def _row(entry):
+        """Serialize a queued entry into an INSERT row"""
+        (state, district, court_complex, case_type, case_number, case_year,
+         captcha_value, request_data, response_data, raw_json_response, success, error_message,
+         latency_ms, timestamp) = entry
+        response_json = json.dumps(response_data) if response_data else None
+        raw_is_response = raw_json_response is response_data or raw_json_response == response_data
+        raw_json = None if raw_is_response else (json.dumps(raw_json_response) if raw_json_response else None)
+        return (
+            state, district, court_complex, case_type, case_number, case_year,
+            captcha_value,
+            json.dumps(request_data) if request_data else None,
+            response_json,
+            raw_json,
+            bool(raw_is_response and response_json),
+            success,
+            error_message,
+            latency_ms,
+            timestamp
+        )
+    
+    @staticmethod
+    def _aggregate(rows):
+        """Summary and latency histogram increments for a batch of INSERT rows"""
+        summary = {}
+        latency = {}
+        for row in rows:
+            state, district = row[0] or '', row[1] or ''
+            success, latency_ms, timestamp = bool(row[11]), row[13], row[14]
+            counts = summary.setdefault((timestamp[:10], state, district, success), [0, 0, 0.0])
+            counts[0] += 1
+            if latency_ms is not None:
+                counts[1] += 1
+                counts[2] += latency_ms
+                key = (state, district, latency_bucket(latency_ms))
+                latency[key] = latency.get(key, 0) + 1
+        return (
+            [key + tuple(counts) for key, counts in summary.items()],
+            [key + (count,) for key, count in latency.items()]
+        )
+    
+    def _write_batch(self, conn, entries):
+        rows = [self._row(entry) for entry in entries]
+        summary_rows, latency_rows = self._aggregate(rows)
+        own_connection = conn is None
+        if own_connection:
+            conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                conn.executemany('''
+                    INSERT INTO query_logs 
+                    (state, district, court_complex, case_type, case_number, case_year, 
+                     captcha_value, request_data, response_data, raw_json_response, raw_is_response,
+                     success, error_message, latency_ms, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                conn.executemany('''
+                    INSERT INTO query_summary (day, state, district, success, count, latency_count, latency_sum)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (day, state, district, success) DO UPDATE SET
+                        count = count + excluded.count,
+                        latency_count = latency_count + excluded.latency_count,
+                        latency_sum = latency_sum + excluded.latency_sum
+                ''', summary_rows)
+                conn.executemany('''
+                    INSERT INTO query_latency (state, district, bucket, count) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (state, district, bucket) DO UPDATE SET count = count + excluded.count
+                ''', latency_rows)
+        finally:
+            if own_connection:
+                conn.close()
+    
+    def _write_loop(self):
+        """Writer thread: drain the queue in batches, one transaction per batch"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        stopping = False
+        while not stopping:
+            entries = [self._queue.get()]
+            while len(entries) < self.batch_size:
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in entries:
+                stopping = True
+                entries = [entry for entry in entries if entry is not _STOP]
+            try:
+                if entries:
+                    self._write_batch(conn, entries)
+            except Exception as e:
+                log('query_log_write_failed', level='error', entries=len(entries), error=str(e))
+            finally:
+                for _ in range(len(entries) + stopping):
+                    self._queue.task_done()
+        conn.close()
+    
+    def flush(self):
+        """Block until every queued entry has been written"""
+        if self._queue is not None:
+            self._queue.join()
+    
+    def close(self):
+        """Write what is still queued and stop the writer thread"""
+        if self._writer is not None and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
     
     def get_recent_queries(self, limit: int = 50):
         """Get recent queries for viewing"""
+        return self.get_queries(limit)[1]
+    
+    def get_queries(self, limit: int = 50, before_id: int = None, full: bool = True, **filters):
+        """
+        One page of query logs, newest first. Pass the smallest id of a page
+        as `before_id` to get the next one; the primary key index makes every
+        page equally cheap however deep it is.
+        
+        Returns:
+            (column names, rows)
+        """
+        columns = LOG_COLUMNS if full else LOG_SUMMARY_COLUMNS
+        where, params = log_filters(before_id=before_id, **filters)
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM query_logs 
-                ORDER BY timestamp DESC 
-                LIMIT ?
-            ''', (limit,))
-            return cursor.fetchall()
+            cursor.execute(log_select(columns) + where + ' ORDER BY id DESC LIMIT ?', params + [limit])
+            return columns, cursor.fetchall()
+    
+    def iter_queries(self, after_id: int = None, full: bool = True, page_size: int = 1000, **filters):
+        """
+        Yield matching query log rows oldest first, reading one keyset page
+        per short transaction so a long export never holds a read snapshot
+        open against the writer.
+        """
+        columns = LOG_COLUMNS if full else LOG_SUMMARY_COLUMNS
+        id_index = columns.index('id')
+        while True:
+            where, params = log_filters(after_id=after_id, **filters)
+            with sqlite3.connect(self.db_path) as conn:
+                rows = conn.execute(log_select(columns) + where + ' ORDER BY id LIMIT ?', params + [page_size]).fetchall()
+            yield from rows
+            if len(rows) < page_size:
+                return
+            after_id = rows[-1][id_index]
     
-    def get_query_stats(self):
-        """Get basic statistics about queries"""
+    def get_query_stats(self, days: int = 14):
+        """
+        Query statistics from the incrementally maintained summary tables;
+        the cost depends on the number of districts and days, not on the
+        number of logged queries.
+        """
         with sqlite3.connect(self.db_path) as conn:
             cursor = conn.cursor()
             
-            # Total queries
-            cursor.execute('SELECT COUNT(*) FROM query_logs')
-            total_queries = cursor.fetchone()[0]
-            
-            # Successful queries
-            cursor.execute('SELECT COUNT(*) FROM query_logs WHERE success = 1')
-            successful_queries = cursor.fetchone()[0]
-            
-            # Failed queries
-            cursor.execute('SELECT COUNT(*) FROM query_logs WHERE success = 0')
-            failed_queries = cursor.fetchone()[0]
-            
-            # Most common states
             cursor.execute('''
-                SELECT state, COUNT(*) as count 
-                FROM query_logs 
-                WHERE state IS NOT NULL 
-                GROUP BY state 
-                ORDER BY count DESC 
-                LIMIT 5
+                SELECT state, district,
+                       SUM(count), SUM(CASE WHEN success THEN count ELSE 0 END),
+                       SUM(latency_count), SUM(latency_sum)
+                FROM query_summary
+                GROUP BY state, district
             ''')
-            top_states = cursor.fetchall()
+            by_district = cursor.fetchall()
+            
+            cursor.execute('''
+                SELECT day, SUM(count), SUM(CASE WHEN success THEN count ELSE 0 END)
+                FROM query_summary
+                GROUP BY day
+                ORDER BY day DESC
+                LIMIT ?
+            ''', (days,))
+            daily = cursor.fetchall()
             
-            return {
-                'total_queries': total_queries,
-                'successful_queries': successful_queries,
-                'failed_queries': failed_queries,
-                'success_rate': (successful_queries / total_queries * 100) if total_queries > 0 else 0,
-                'top_states': top_states
-            } 
\ No newline at end of file
+            cursor.execute('SELECT state, district, bucket, count FROM query_latency')
+            histograms = {}
+            overall = {}
+            for state, district, bucket, count in cursor.fetchall():
+                histograms.setdefault((state, district), {})[bucket] = count
+                overall[bucket] = overall.get(bucket, 0) + count
+        
+        total_queries = sum(row[2] for row in by_district)
+        successful_queries = sum(row[3] for row in by_district)
+        
+        state_counts = {}
+        for state, _, total, *_ in by_district:
+            if state:
+                state_counts[state] = state_counts.get(state, 0) + total
+        top_states = sorted(state_counts.items(), key=lambda item: item[1], reverse=True)[:5]
+        
+        districts = []
+        for state, district, total, successful, latency_count, latency_sum in by_district:
+            if not district:
+                continue
+            districts.append({
+                'state': state,
+                'district': district,
+                'total_queries': total,
+                'successful_queries': successful,
+                'success_rate': successful / total * 100 if total else 0,
+                'avg_latency_ms': latency_sum / latency_count if latency_count else None,
+                **histogram_percentiles(histograms.get((state, district), {}))
+            })
+        districts.sort(key=lambda item: item['total_queries'], reverse=True)
+        
+        return {
+            'total_queries': total_queries,
+            'successful_queries': successful_queries,
+            'failed_queries': total_queries - successful_queries,
+            'success_rate': (successful_queries / total_queries * 100) if total_queries > 0 else 0,
+            'top_states': top_states,
+            'latency_ms': histogram_percentiles(overall),
+            'districts': districts,
+            'daily': [{'day': day, 'total_queries': total, 'successful_queries': successful} for day, total, successful in daily]
+        }
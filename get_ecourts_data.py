@@ -1,63 +1,197 @@
-import requests
-from bs4 import BeautifulSoup
+"""
+Builds ecourts_data.json, the state -> district -> court URL directory.
+
+State pages are fetched concurrently on one pooled HTTP client with
+bounded parallelism and retries with exponential backoff. Every finished
+state is checkpointed, so an interrupted crawl resumes where it stopped,
+and at the end the districts and court URLs that changed compared to the
+previous ecourts_data.json are reported (and written with --diff).
+
+    python get_ecourts_data.py
+    python get_ecourts_data.py --concurrency 8 --diff ecourts_data.diff.json
+    python get_ecourts_data.py --fresh        # ignore an existing checkpoint
+"""
+import argparse
+import asyncio
 import json
+import os
+import random
+
+import httpx
+
+from case_parser import make_soup
 
-def get_states():
-    """Get all states from ECourts"""
-    print("Getting states...")
-    url = "https://ecourts.gov.in/ecourts_home/index.php"
-    
-    response = requests.get(url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
+HOME_URL = "https://ecourts.gov.in/ecourts_home/index.php"
+SITE_URL = "https://ecourts.gov.in"
+OUTPUT_PATH = 'ecourts_data.json'
+CHECKPOINT_PATH = 'ecourts_data.checkpoint.json'
+
+
+def parse_states(html):
+    """Get all states from the ECourts home page"""
+    soup = make_soup(html)
     states = {}
     states_list = soup.find('ul', class_='state-district')
-    
+
     for li in states_list.find_all('li'):
         link = li.find('a')
         if link:
             state_name = link.text.strip()
-            state_url = "https://ecourts.gov.in" + link.get('href')
+            state_url = SITE_URL + link.get('href')
             states[state_name] = {'url': state_url, 'districts': {}}
-            print(f"Found: {state_name}")
-    
+
     return states
 
-def get_districts(state_name, state_url):
-    """Get districts for a state"""
-    print(f"Getting districts for {state_name}...")
-    
-    response = requests.get(state_url)
-    soup = BeautifulSoup(response.text, 'html.parser')
-    
+
+def parse_districts(html, state_name):
+    """Get districts from a state page"""
+    soup = make_soup(html)
     districts = {}
     districts_list = soup.find('ul', class_='state-district')
-    
+
     for li in districts_list.find_all('li'):
         link = li.find('a')
         if link:
             district_name = link.text.strip()
             court_url = link.get('href')
             districts[district_name] = {'court_url': court_url, 'state': state_name}
-            print(f"  Found: {district_name} -> {court_url}")
-    
+
     return districts
 
-# Main execution
-print("Starting ECourts data collection...")
 
-states = get_states()
-print(f"\nFound {len(states)} states")
+async def fetch_with_retries(client, url, semaphore, retries=4, backoff=1.0):
+    """GET a page, retrying transient failures with exponential backoff and jitter"""
+    for attempt in range(retries + 1):
+        try:
+            async with semaphore:
+                response = await client.get(url)
+            if response.status_code < 500:
+                response.raise_for_status()
+                return response.text
+            error = f"HTTP {response.status_code}"
+        except httpx.HTTPStatusError:
+            raise
+        except httpx.HTTPError as e:
+            error = str(e) or type(e).__name__
+        if attempt == retries:
+            raise RuntimeError(f"Giving up on {url} after {retries + 1} attempts: {error}")
+        delay = backoff * (2 ** attempt) * (1 + random.random() / 2)
+        print(f"  Retrying {url} in {delay:.1f}s ({error})")
+        await asyncio.sleep(delay)
+
+
+def load_json(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_json(path, data):
+    """Write JSON atomically so an interrupted write never leaves a truncated file"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def diff_directories(old, new):
+    """Districts added, removed, or whose court URL changed between two directories"""
+    def flatten(data):
+        return {
+            (state_name, district_name): district['court_url']
+            for state_name, state in (data or {}).items()
+            for district_name, district in state.get('districts', {}).items()
+        }
+
+    before, after = flatten(old), flatten(new)
+    return {
+        'added': [{'state': s, 'district': d, 'court_url': after[(s, d)]} for s, d in sorted(after.keys() - before.keys())],
+        'removed': [{'state': s, 'district': d, 'court_url': before[(s, d)]} for s, d in sorted(before.keys() - after.keys())],
+        'changed': [
+            {'state': s, 'district': d, 'old_court_url': before[(s, d)], 'new_court_url': after[(s, d)]}
+            for s, d in sorted(before.keys() & after.keys()) if before[(s, d)] != after[(s, d)]
+        ]
+    }
+
+
+async def crawl(concurrency=6, checkpoint_path=CHECKPOINT_PATH, fresh=False, timeout=20):
+    """
+    Crawl all states and their districts, resuming from the checkpoint.
+    Returns the directory and the names of states that failed.
+    """
+    checkpoint = None if fresh else load_json(checkpoint_path)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=True) as client:
+        if checkpoint and checkpoint.get('states'):
+            states = checkpoint['states']
+            done = set(checkpoint.get('done', []))
+            print(f"Resuming from checkpoint: {len(done)}/{len(states)} states already crawled")
+        else:
+            print("Getting states...")
+            states = parse_states(await fetch_with_retries(client, HOME_URL, semaphore))
+            done = set()
+            write_json(checkpoint_path, {'states': states, 'done': []})
+        print(f"Found {len(states)} states")
+
+        failed = []
+        checkpoint_lock = asyncio.Lock()
+
+        async def crawl_state(state_name):
+            state_data = states[state_name]
+            try:
+                html = await fetch_with_retries(client, state_data['url'], semaphore)
+                state_data['districts'] = parse_districts(html, state_name)
+            except Exception as e:
+                print(f"Failed to get districts for {state_name}: {e}")
+                failed.append(state_name)
+                return
+            print(f"  {state_name}: {len(state_data['districts'])} districts")
+            async with checkpoint_lock:
+                done.add(state_name)
+                write_json(checkpoint_path, {'states': states, 'done': sorted(done)})
+
+        await asyncio.gather(*(crawl_state(name) for name in states if name not in done))
+
+    return states, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl the eCourts state/district court directory")
+    parser.add_argument('--output', default=OUTPUT_PATH, help="directory JSON to write")
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help="checkpoint file used to resume")
+    parser.add_argument('--concurrency', type=int, default=6, help="state pages fetched in parallel")
+    parser.add_argument('--fresh', action='store_true', help="ignore an existing checkpoint")
+    parser.add_argument('--diff', help="also write the changes against the previous output to this file")
+    args = parser.parse_args()
+
+    print("Starting ECourts data collection...")
+    states, failed = asyncio.run(crawl(args.concurrency, args.checkpoint, args.fresh))
+
+    if failed:
+        print(f"\n{len(failed)} states failed: {', '.join(failed)}")
+        print(f"Progress is kept in {args.checkpoint}; run again to retry them.")
+        return 1
+
+    previous = load_json(args.output)
+    changes = diff_directories(previous, states)
+    write_json(args.output, states)
+    os.remove(args.checkpoint)
 
-# Get districts for each state
-for state_name, state_data in states.items():
-    districts = get_districts(state_name, state_data['url'])
-    state_data['districts'] = districts
+    print(f"\nData saved to {args.output}")
+    print(f"Total states: {len(states)}")
+    print(f"Total districts: {sum(len(state['districts']) for state in states.values())}")
+    print(f"Changes: {len(changes['added'])} added, {len(changes['removed'])} removed, {len(changes['changed'])} court URLs changed")
+    for change in changes['changed']:
+        print(f"  {change['state']} / {change['district']}: {change['old_court_url']} -> {change['new_court_url']}")
+    if args.diff:
+        write_json(args.diff, changes)
+        print(f"Diff written to {args.diff}")
+    return 0
 
-# Save to JSON
-with open('ecourts_data.json', 'w', encoding='utf-8') as f:
-    json.dump(states, f, indent=2, ensure_ascii=False)
 
-print(f"\nData saved to ecourts_data.json")
-print(f"Total states: {len(states)}")
-print(f"Total districts: {sum(len(state['districts']) for state in states.values())}") 
\ No newline at end of file
+if __name__ == "__main__":
+    raise SystemExit(main())
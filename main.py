@@ -1,16 +1,38 @@
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi import FastAPI, Request, Response, HTTPException
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 import uvicorn
-from scraper import ECourtsScraper
+import asyncio
+import weakref
+from async_scraper import AsyncECourtsScraper, get_default_engine
+from session_pool import ScraperSessionPool
+from captcha_prefetch import CaptchaPrefetcher
+from captcha_batcher import CaptchaBatcher
+from search_engine import get_many_details_cached, search_with_retries
+from capture_store import get_capture_store
+from case_cache import CaseCache
+from metadata_store import MetadataStore
+from case_store import CaseStore
+from case_watch import CaseWatcher, CourtBudget
+from court_directory import CourtDirectory
+from order_downloader import OrderDownloader
+from scraper import SearchStatus, normalize_cnr
+from telemetry import get_prometheus_sink, log, register_collector, render_metrics, trace
 import base64
 from io import BytesIO
 import json
-from database import QueryLogger
+from database import QueryLogger, LOG_COLUMNS, LOG_SUMMARY_COLUMNS
+import csv
+import io
 from captcha_solver import CaptchaSolver
+import logging
 import os
+import time
+
+# Scraper and service events go through telemetry to the "ecourts" logger
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper(), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
 
 app = FastAPI(title="ECourts Case Scraper")
 
@@ -20,30 +42,160 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 # Templates
 templates = Jinja2Templates(directory="templates")
 
-# Global scraper instance
-scraper = None
+# Per-client pool of initialized scrapers, keyed by client token and district
+session_pool = ScraperSessionPool(
+    ttl=float(os.getenv('SESSION_TTL_SECONDS', '900')),
+    max_size=int(os.getenv('SESSION_POOL_SIZE', '256')),
+    scraper_factory=AsyncECourtsScraper
+)
+CLIENT_COOKIE = "ecourts_client"
+
+# One CAPTCHA prefetcher per pooled scraper; it only holds its scraper weakly,
+# so the entry is dropped once the pool lets go of the scraper
+captcha_prefetchers = weakref.WeakKeyDictionary()
+
+# Query logs are written by a background thread in batched transactions
+query_logger = QueryLogger(queue_size=int(os.getenv('QUERY_LOG_QUEUE_SIZE', '10000')))
+
+# Search and case details cache; CASE_CACHE_DB adds a persistent SQLite tier
+case_cache = CaseCache(
+    max_entries=int(os.getenv('CASE_CACHE_SIZE', '2048')),
+    pending_ttl=float(os.getenv('CASE_CACHE_PENDING_TTL', '600')),
+    disposed_ttl=float(os.getenv('CASE_CACHE_DISPOSED_TTL', str(3 * 86400))),
+    db_path=os.getenv('CASE_CACHE_DB') or None
+)
+
+# Normalized case tables with a change log of every refresh
+case_store = CaseStore(os.getenv('CASE_STORE_DB', 'cases.db'))
+
+# Order PDFs, stored once per content hash and recorded on the order rows
+order_downloader = OrderDownloader(
+    case_store,
+    directory=os.getenv('ORDER_DOWNLOAD_DIR', 'orders'),
+    concurrency=int(os.getenv('ORDER_DOWNLOAD_CONCURRENCY', '4'))
+)
 
-# Initialize query logger
-query_logger = QueryLogger()
+async def report_case_changes(cino, changes):
+    log('case_changed', cino=cino, changes=','.join(change['kind'] for change in changes))
 
-# Initialize CAPTCHA solver (optional)
-captcha_solver = CaptchaSolver()
+# Scheduled refreshes of watched cases on their own pooled sessions
+case_watcher = CaseWatcher(
+    case_store, session_pool, cache=case_cache,
+    workers=int(os.getenv('CASE_WATCH_WORKERS', '2')),
+    court_budget=CourtBudget(per_minute=float(os.getenv('CASE_WATCH_COURT_BUDGET', '6'))),
+    on_changes=report_case_changes,
+    # Watched cases get their new orders downloaded after each refresh
+    order_downloader=order_downloader if os.getenv('ORDER_DOWNLOAD_ON_WATCH', '1') == '1' else None
+)
+
+# Court complex and case type lists per district, persisted across restarts
+metadata_store = MetadataStore(
+    path=os.getenv('METADATA_STORE_PATH', 'court_metadata.json'),
+    max_age=float(os.getenv('METADATA_MAX_AGE', '86400'))
+)
+
+# Initialize CAPTCHA solver (optional), backends chosen by CAPTCHA_BACKENDS
+captcha_solver = None
 try:
     captcha_solver = CaptchaSolver()
-    print("CAPTCHA solver initialized successfully")
+    log('captcha_solver_ready', backends=','.join(backend.name for backend in captcha_solver.backends))
 except Exception as e:
-    print(f"CAPTCHA solver initialization failed: {e}")
-    print("CAPTCHA auto-solving will be disabled")
+    log('captcha_solver_unavailable', level='warning', error=str(e), detail="CAPTCHA auto-solving is disabled")
+
+# Concurrent CAPTCHA requests from different clients are solved in batches
+captcha_batcher = CaptchaBatcher(captcha_solver) if captcha_solver else None
+
+# State/district/court URL directory, loaded from its snapshot when current
+court_directory = CourtDirectory.load(os.getenv('ECOURTS_DATA_PATH', 'ecourts_data.json'))
+
+def service_metrics():
+    """Solver, cache and per-host counters kept by the components themselves, for /metrics"""
+    if captcha_solver:
+        backends = captcha_solver.get_stats()
+        yield ('ecourts_captcha_solve_attempts_total', 'counter', "CAPTCHAs sent to each solver backend",
+               [('', {'backend': name}, stats['attempts']) for name, stats in backends.items()])
+        yield ('ecourts_captcha_solved_total', 'counter', "CAPTCHAs each backend produced an answer for",
+               [('', {'backend': name}, stats['solved']) for name, stats in backends.items()])
+        yield ('ecourts_captcha_confirmed_total', 'counter', "Solved CAPTCHAs the court accepted or rejected",
+               [('', {'backend': name, 'result': result}, stats[f'confirmed_{result}'])
+                for name, stats in backends.items() for result in ('correct', 'wrong')])
+        yield ('ecourts_captcha_solve_ratio', 'gauge', "Share of attempts each backend produced an answer for",
+               [('', {'backend': name}, stats['solved'] / stats['attempts'] if stats['attempts'] else 0)
+                for name, stats in backends.items()])
+        yield ('ecourts_captcha_accuracy_ratio', 'gauge', "Share of confirmed answers the court accepted",
+               [('', {'backend': name}, stats['accuracy'] / 100)
+                for name, stats in backends.items() if stats['accuracy'] is not None])
+
+    cache_stats = case_cache.get_stats()
+    sink = get_prometheus_sink()
+    prefetch_hits = sink.event_count('captcha_prefetch', 'hit') if sink else 0
+    prefetch_misses = sink.event_count('captcha_prefetch', 'miss') if sink else 0
+    caches = {'case': (cache_stats['hits'], cache_stats['misses']), 'captcha_prefetch': (prefetch_hits, prefetch_misses)}
+    yield ('ecourts_cache_lookups_total', 'counter', "Cache lookups by cache and result",
+           [('', {'cache': cache, 'result': result}, count)
+            for cache, counts in caches.items() for result, count in zip(('hit', 'miss'), counts)])
+    yield ('ecourts_cache_hit_ratio', 'gauge', "Share of cache lookups that hit",
+           [('', {'cache': cache}, hits / (hits + misses)) for cache, (hits, misses) in caches.items() if hits + misses])
 
-# Load ECourts data
-def load_ecourts_data():
+    hosts = get_default_engine().get_stats()
+    yield ('ecourts_host_concurrency_limit', 'gauge', "Adaptive concurrency limit per court host",
+           [('', {'host': host}, stats['concurrency_limit']) for host, stats in hosts.items()])
+    yield ('ecourts_host_in_flight', 'gauge', "Requests in flight per court host",
+           [('', {'host': host}, stats['in_flight']) for host, stats in hosts.items()])
+
+register_collector(service_metrics)
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """Give every request a trace id shared by its spans and events"""
+    with trace() as trace_id:
+        response = await call_next(request)
+    response.headers["X-Trace-Id"] = trace_id
+    return response
+
+def get_court_url(state_name, district_name):
+    """Resolve the court URL for a state/district pair, or None if unknown"""
+    return court_directory.court_url(state_name, district_name)
+
+def get_client_scraper(request: Request, state_name=None, district_name=None):
+    """Look up the calling client's initialized scraper or fail with 400"""
+    court_url = get_court_url(state_name, district_name) if state_name and district_name else None
+    scraper = session_pool.get(request.cookies.get(CLIENT_COOKIE), court_url)
+    if not scraper:
+        raise HTTPException(status_code=400, detail="Scraper not initialized")
+    return scraper
+
+async def store_case(court_url, cino, case_details):
+    """Upsert fetched case details into the case store, returning the recorded changes"""
     try:
-        with open('ecourts_data.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+        return await asyncio.to_thread(case_store.upsert_case, court_url, cino, case_details)
+    except Exception as e:
+        log('case_store_failed', level='error', cino=cino, error=str(e))
+        return []
+
+SEARCH_STATUS_MESSAGES = {
+    SearchStatus.NOT_FOUND: "No case found for these details",
+    SearchStatus.CAPTCHA_REJECTED: "The CAPTCHA was rejected, please try again",
+    SearchStatus.SESSION_EXPIRED: "The court session expired and was renewed, please enter the new CAPTCHA",
+    SearchStatus.NETWORK_ERROR: "The court website did not respond",
+    SearchStatus.PARSE_ERROR: "The case was found but its details could not be read",
+}
 
-ecourts_data = load_ecourts_data()
+def get_prefetcher(scraper):
+    """Get or create the CAPTCHA prefetcher of a scraper"""
+    prefetcher = captcha_prefetchers.get(scraper)
+    if prefetcher is None:
+        solve = captcha_batcher.solve if captcha_batcher else None
+        prefetcher = captcha_prefetchers[scraper] = CaptchaPrefetcher(scraper, solve)
+    return prefetcher
+
+def metadata_response(request: Request, response: Response, key, entry):
+    """Serve a metadata store entry with its content hash as ETag"""
+    etag = f'"{entry["hash"]}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return {"success": True, key: entry["value"], "revision": entry["revision"]}
 
 class SearchRequest(BaseModel):
     court_complex: str
@@ -60,29 +212,38 @@ async def home(request: Request):
 async def admin(request: Request):
     return templates.TemplateResponse("admin.html", {"request": request})
 
+def directory_response(request: Request, body: bytes):
+    """Serve a pre-encoded court directory response, honouring If-None-Match"""
+    etag = f'"{court_directory.etag}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
+
 @app.get("/api/states")
-async def get_states():
+async def get_states(request: Request):
     """Get all available states"""
-    states = list(ecourts_data.keys())
-    return {"success": True, "states": states}
+    return directory_response(request, court_directory.states_json)
 
 @app.post("/api/districts")
 async def get_districts(request: Request):
     """Get districts for a specific state"""
     data = await request.json()
-    state_name = data.get("state")
+    body = court_directory.districts_json(data.get("state"))
     
-    if not state_name or state_name not in ecourts_data:
+    if body is None:
         raise HTTPException(status_code=400, detail="Invalid state name")
     
-    districts = list(ecourts_data[state_name]["districts"].keys())
-    return {"success": True, "districts": districts}
+    return directory_response(request, body)
+
+@app.get("/api/courts/search")
+async def search_courts(q: str, state: str = None, limit: int = 10):
+    """Typeahead search over district names, optionally within one state"""
+    matches = court_directory.search(q, state_name=state, limit=max(1, min(limit, 50)))
+    return {"success": True, "results": matches}
 
 @app.post("/api/initialize")
-async def initialize_scraper(request: Request):
+async def initialize_scraper(request: Request, response: Response):
     """Initialize the scraper session for a specific district"""
-    global scraper
-    
     data = await request.json()
     state_name = data.get("state")
     district_name = data.get("district")
@@ -90,15 +251,20 @@ async def initialize_scraper(request: Request):
     if not state_name or not district_name:
         raise HTTPException(status_code=400, detail="State and district required")
     
-    if state_name not in ecourts_data or district_name not in ecourts_data[state_name]["districts"]:
+    court_url = get_court_url(state_name, district_name)
+    if not court_url:
         raise HTTPException(status_code=400, detail="Invalid state or district")
     
-    court_url = ecourts_data[state_name]["districts"][district_name]["court_url"]
+    client_token = request.cookies.get(CLIENT_COOKIE) or session_pool.new_client_token()
+    response.set_cookie(CLIENT_COOKIE, client_token, httponly=True, samesite="lax")
     
     try:
-        scraper = ECourtsScraper(court_url)
-        success = scraper.initialize_session()
-        if success:
+        scraper = await session_pool.acquire_async(client_token, court_url, force_refresh=bool(data.get("force_refresh")))
+        if scraper:
+            # Have the first CAPTCHA ready by the time the user gets to it
+            get_prefetcher(scraper).schedule()
+            if scraper.court_complex_map:
+                metadata_store.put_court_complexes(court_url, scraper.court_complex_map)
             return {"success": True, "message": f"Session initialized successfully for {district_name}, {state_name}"}
         else:
             return {"success": False, "message": "Failed to initialize session"}
@@ -106,61 +272,79 @@ async def initialize_scraper(request: Request):
         return {"success": False, "message": f"Error: {str(e)}"}
 
 @app.get("/api/court-complexes")
-async def get_court_complexes():
+async def get_court_complexes(request: Request, response: Response, state: str = None, district: str = None):
     """Get available court complexes"""
-    global scraper
-    if not scraper:
-        raise HTTPException(status_code=400, detail="Scraper not initialized")
+    court_url = get_court_url(state, district) if state and district else None
+    if not court_url:
+        court_url = get_client_scraper(request).base_url
+    
+    entry = metadata_store.get_court_complexes(court_url)
+    if entry is None:
+        scraper = get_client_scraper(request, state, district)
+        metadata_store.put_court_complexes(court_url, scraper.court_complex_map)
+        entry = metadata_store.get_court_complexes(court_url)
     
-    return {"success": True, "court_complexes": scraper.court_complex_map}
+    return metadata_response(request, response, "court_complexes", entry)
 
 @app.post("/api/case-types")
-async def get_case_types(request: Request):
+async def get_case_types(request: Request, response: Response):
     """Get case types for a court complex"""
-    global scraper
-    if not scraper:
-        raise HTTPException(status_code=400, detail="Scraper not initialized")
-    
     data = await request.json()
     court_complex_code = data.get("court_complex_code")
     
     if not court_complex_code:
         raise HTTPException(status_code=400, detail="Court complex code required")
     
+    state_name, district_name = data.get("state"), data.get("district")
+    court_url = get_court_url(state_name, district_name) if state_name and district_name else None
+    scraper = session_pool.get(request.cookies.get(CLIENT_COOKIE), court_url)
+    if not court_url:
+        if not scraper:
+            raise HTTPException(status_code=400, detail="Scraper not initialized")
+        court_url = scraper.base_url
+    
     try:
-        case_types = scraper.get_case_types(court_complex_code)
-        return {"success": True, "case_types": case_types}
+        entry = metadata_store.get_case_types(court_url, court_complex_code)
+        if entry is not None and metadata_store.is_stale(entry) and scraper:
+            # Serve what we have and refresh it behind the response
+            metadata_store.refresh_in_background(
+                (court_url, court_complex_code),
+                lambda: scraper.get_case_types(court_complex_code),
+                lambda case_types: metadata_store.put_case_types(court_url, court_complex_code, case_types)
+            )
+        if entry is None:
+            if not scraper:
+                raise HTTPException(status_code=400, detail="Scraper not initialized")
+            case_types = await scraper.get_case_types(court_complex_code)
+            if not case_types:
+                return {"success": True, "case_types": case_types}
+            metadata_store.put_case_types(court_url, court_complex_code, case_types)
+            entry = metadata_store.get_case_types(court_url, court_complex_code)
+        return metadata_response(request, response, "case_types", entry)
+    except HTTPException:
+        raise
     except Exception as e:
         return {"success": False, "message": f"Error: {str(e)}"}
 
 @app.get("/api/captcha")
-async def get_captcha():
+async def get_captcha(request: Request):
     """Get CAPTCHA image with optional auto-solving"""
-    global scraper, captcha_solver
-    if not scraper:
-        raise HTTPException(status_code=400, detail="Scraper not initialized")
+    scraper = get_client_scraper(request)
     
     try:
-        captcha_image = scraper.get_captcha_image()
-        if captcha_image:
+        captcha = await get_prefetcher(scraper).take()
+        if captcha:
             # Convert to base64 for frontend display
-            image_base64 = base64.b64encode(captcha_image).decode('utf-8')
+            image_base64 = base64.b64encode(captcha.image).decode('utf-8')
             
-            # Try to auto-solve if solver is available
-            auto_solved_text = None
-            if captcha_solver:
-                try:
-                    auto_solved_text, was_solved = captcha_solver.solve_captcha_with_fallback(captcha_image)
-                    if not was_solved:
-                        auto_solved_text = None
-                except Exception as e:
-                    print(f"Auto-solving failed: {e}")
-                    auto_solved_text = None
+            # Auto-solved text, if the solver is available and succeeded
+            auto_solved_text = captcha.text
             
             return {
                 "success": True, 
                 "captcha_image": f"data:image/png;base64,{image_base64}",
-                "auto_solved_text": auto_solved_text
+                "auto_solved_text": auto_solved_text,
+                "auto_solved_confidence": captcha.solution.confidence
             }
         else:
             return {"success": False, "message": "Failed to get CAPTCHA"}
@@ -170,11 +354,9 @@ async def get_captcha():
 @app.post("/api/search")
 async def search_case(request: Request):
     """Search for a case"""
-    global scraper, query_logger
-    if not scraper:
-        raise HTTPException(status_code=400, detail="Scraper not initialized")
-    
+    global query_logger
     data = await request.json()
+    scraper = get_client_scraper(request, data.get("state"), data.get("district"))
     
     # Extract search parameters for logging
     state = data.get("state")
@@ -184,17 +366,33 @@ async def search_case(request: Request):
     case_number = data.get("case_number")
     case_year = data.get("year")
     captcha_value = data.get("captcha_value")
+    started = time.perf_counter()
     
     try:
-        result = scraper.search_case_by_number(
+        # Credit the solver if the user submitted the auto-solved text unchanged
+        prefetcher = get_prefetcher(scraper)
+        served = prefetcher.last_served
+        captcha_backend = served.solution.backend if served and served.text == captcha_value else None
+        
+        search_result = await search_with_retries(
+            scraper, prefetcher,
             case_type_code=case_type,
             case_number=case_number,
             year=case_year,
+            court_complex_code=court_complex,
             captcha_value=captcha_value,
-            court_complex_code=court_complex
+            captcha_backend=captcha_backend,
+            solver=captcha_solver,
+            # Without a solver only the user's own CAPTCHA can be tried
+            max_attempts=int(os.getenv('SEARCH_MAX_ATTEMPTS', '3')) if captcha_solver else 1,
+            cache=case_cache
         )
+        result = search_result.case_details
+        log('search', outcome=search_result.status, host=scraper.host, state=state, district=district,
+            attempts=search_result.attempts, latency_ms=round((time.perf_counter() - started) * 1000, 1))
         
         if result:
+            changes = await store_case(scraper.base_url, search_result.cino, result)
             # Log successful query
             query_logger.log_query(
                 state=state,
@@ -207,9 +405,11 @@ async def search_case(request: Request):
                 request_data=data,
                 response_data=result,
                 raw_json_response=result,
-                success=True
+                success=True,
+                latency_ms=(time.perf_counter() - started) * 1000
             )
-            return {"success": True, "case_details": result}
+            return {"success": True, "status": search_result.status, "attempts": search_result.attempts,
+                    "case_details": result, "changes": changes}
         else:
             # Log failed query
             query_logger.log_query(
@@ -223,10 +423,17 @@ async def search_case(request: Request):
                 request_data=data,
                 response_data=None,
                 success=False,
-                error_message="No case found or search failed"
+                error_message=f"{search_result.status}: {search_result.message}",
+                latency_ms=(time.perf_counter() - started) * 1000
             )
-            return {"success": False, "message": "No case found or search failed"}
+            return {
+                "success": False,
+                "status": search_result.status,
+                "attempts": search_result.attempts,
+                "message": SEARCH_STATUS_MESSAGES.get(search_result.status, "No case found or search failed")
+            }
     except Exception as e:
+        log('search', outcome='error', host=scraper.host, state=state, district=district, error=str(e))
         # Log error
         query_logger.log_query(
             state=state,
@@ -239,29 +446,274 @@ async def search_case(request: Request):
             request_data=data,
             response_data=None,
             success=False,
-            error_message=str(e)
+            error_message=str(e),
+            latency_ms=(time.perf_counter() - started) * 1000
         )
         return {"success": False, "message": f"Error: {str(e)}"}
 
+@app.post("/api/cnr")
+async def get_cases_by_cnr(request: Request, response: Response):
+    """Fetch case details directly by CNR number(s), without a search or CAPTCHA"""
+    data = await request.json()
+    state_name = data.get("state")
+    district_name = data.get("district")
+    cnrs = data.get("cnrs") or ([data["cnr"]] if data.get("cnr") else [])
+    
+    court_url = get_court_url(state_name, district_name)
+    if not court_url:
+        raise HTTPException(status_code=400, detail="Invalid state or district")
+    if not cnrs:
+        raise HTTPException(status_code=400, detail="CNR number required")
+    max_cnrs = int(os.getenv('CNR_BATCH_LIMIT', '50'))
+    if len(cnrs) > max_cnrs:
+        raise HTTPException(status_code=400, detail=f"At most {max_cnrs} CNR numbers per request")
+    
+    normalized = {cnr: normalize_cnr(cnr) for cnr in cnrs}
+    invalid = [cnr for cnr, cino in normalized.items() if not cino]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Invalid CNR number(s): {', '.join(invalid)}")
+    
+    # Reuse (or create) the client's session for this district
+    client_token = request.cookies.get(CLIENT_COOKIE) or session_pool.new_client_token()
+    response.set_cookie(CLIENT_COOKIE, client_token, httponly=True, samesite="lax")
+    
+    try:
+        scraper = await session_pool.acquire_async(client_token, court_url)
+        if not scraper:
+            return {"success": False, "message": "Failed to initialize session"}
+        
+        cinos = list(dict.fromkeys(normalized.values()))
+        details = await get_many_details_cached(scraper, cinos, case_cache)
+        results = [
+            {"cnr": cino, "success": details[cino] is not None, "case_details": details[cino],
+             "changes": await store_case(court_url, cino, details[cino]) if details[cino] else []}
+            for cino in cinos
+        ]
+        for result in results:
+            log('cnr_lookup', outcome='found' if result["success"] else 'failed', host=scraper.host, cino=result["cnr"])
+            query_logger.log_query(
+                state=state_name,
+                district=district_name,
+                case_number=result["cnr"],
+                request_data=data,
+                response_data=result["case_details"],
+                success=result["success"],
+                error_message=None if result["success"] else "CNR lookup failed"
+            )
+        return {"success": any(result["success"] for result in results), "results": results}
+    except Exception as e:
+        return {"success": False, "message": f"Error: {str(e)}"}
+
+@app.get("/api/cases/{cino}")
+async def get_stored_case(cino: str):
+    """Get the stored copy of a case, as last refreshed"""
+    case_details = await asyncio.to_thread(case_store.get_case, normalize_cnr(cino) or cino)
+    if case_details is None:
+        raise HTTPException(status_code=404, detail="Case not stored")
+    return {"success": True, "case_details": case_details}
+
+@app.post("/api/cases/{cino}/orders/download")
+async def download_case_orders(cino: str, request: Request, response: Response):
+    """Download the order PDFs of a stored case that are not stored yet"""
+    cino = normalize_cnr(cino) or cino
+    stored = await asyncio.to_thread(case_store.get_case_row, cino)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Case not stored")
+    
+    client_token = request.cookies.get(CLIENT_COOKIE) or session_pool.new_client_token()
+    response.set_cookie(CLIENT_COOKIE, client_token, httponly=True, samesite="lax")
+    try:
+        scraper = await session_pool.acquire_async(client_token, stored['court_url'])
+        if not scraper:
+            return {"success": False, "message": "Failed to initialize session"}
+        results = await order_downloader.download_case(scraper, cino)
+        return {"success": all(result["success"] for result in results), "orders": results}
+    except Exception as e:
+        return {"success": False, "message": f"Error: {str(e)}"}
+
+@app.get("/api/order-files/{sha256}")
+async def get_order_file(sha256: str):
+    """Serve a downloaded order PDF by the content hash recorded on its order"""
+    if len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256) \
+            or not await asyncio.to_thread(case_store.has_order_file, sha256):
+        raise HTTPException(status_code=404, detail="Order file not found")
+    path = order_downloader.object_path(sha256)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Order file not found")
+    return FileResponse(path, media_type="application/pdf", filename=f"{sha256}.pdf")
+
+@app.get("/api/case-changes")
+async def get_case_changes(cino: str = None, since_id: int = None, limit: int = 100):
+    """Get recorded case changes (new orders, hearing date moves, ...) oldest first"""
+    changes = await asyncio.to_thread(
+        case_store.get_changes, normalize_cnr(cino) or cino if cino else None, since_id, max(1, min(limit, 1000)))
+    return {"success": True, "changes": changes}
+
+@app.post("/api/watch")
+async def watch_case(request: Request):
+    """Add a case to the watch list; it is refreshed ahead of each hearing"""
+    data = await request.json()
+    court_url = get_court_url(data.get("state"), data.get("district"))
+    if not court_url:
+        raise HTTPException(status_code=400, detail="Invalid state or district")
+    cino = normalize_cnr(data.get("cnr"))
+    if not cino:
+        raise HTTPException(status_code=400, detail="Invalid CNR number")
+    await case_watcher.watch_async(cino, court_url)
+    return {"success": True, "cnr": cino}
+
+@app.delete("/api/watch/{cino}")
+async def unwatch_case(cino: str):
+    """Remove a case from the watch list"""
+    if not await asyncio.to_thread(case_watcher.unwatch, normalize_cnr(cino) or cino):
+        raise HTTPException(status_code=404, detail="Case not watched")
+    return {"success": True}
+
+@app.get("/api/watch")
+async def list_watched_cases(limit: int = 100, offset: int = 0):
+    """Get watched cases, soonest scheduled refresh first"""
+    cases = await asyncio.to_thread(case_watcher.list_watched, max(1, min(limit, 1000)), max(0, offset))
+    return {"success": True, "cases": cases}
+
 @app.get("/api/logs")
-async def get_logs(limit: int = 50):
-    """Get recent query logs"""
+async def get_logs(limit: int = 50, before_id: int = None, fields: str = "full",
+                   state: str = None, district: str = None, success: bool = None,
+                   since: str = None, until: str = None):
+    """
+    Get query logs newest first, one page at a time. Pass `next_before_id`
+    from a response as `before_id` for the next page; `fields=summary`
+    leaves out the request/response payloads.
+    """
     global query_logger
+    limit = max(1, min(limit, 500))
     try:
-        logs = query_logger.get_recent_queries(limit)
-        return {"success": True, "logs": logs}
+        columns, logs = query_logger.get_queries(
+            limit=limit, before_id=before_id, full=fields != "summary",
+            state=state, district=district, success=success, since=since, until=until
+        )
+        next_before_id = logs[-1][0] if len(logs) == limit else None
+        return {"success": True, "columns": columns, "logs": logs, "next_before_id": next_before_id}
     except Exception as e:
         return {"success": False, "message": f"Error: {str(e)}"}
 
+@app.get("/api/logs/export")
+def export_logs(format: str = "ndjson", after_id: int = None, fields: str = "full",
+                state: str = None, district: str = None, success: bool = None,
+                since: str = None, until: str = None):
+    """
+    Stream matching query logs oldest first as NDJSON or CSV. Rows are read
+    in keyset pages, so neither the response nor a long read transaction
+    holds the whole result; pass the last exported id as `after_id` to
+    ship only new logs.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    full = fields != "summary"
+    columns = LOG_COLUMNS if full else LOG_SUMMARY_COLUMNS
+    rows = query_logger.iter_queries(after_id=after_id, full=full, state=state, district=district,
+                                     success=success, since=since, until=until)
+
+    def ndjson():
+        lines = []
+        for row in rows:
+            lines.append(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+            if len(lines) >= 500:
+                yield "".join(lines)
+                lines = []
+        yield "".join(lines)
+
+    def csv_lines():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            if buffer.tell() > 65536:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(
+        ndjson() if format == "ndjson" else csv_lines(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="query_logs.{format}"'}
+    )
+
 @app.get("/api/stats")
 async def get_stats():
     """Get query statistics"""
     global query_logger
     try:
         stats = query_logger.get_query_stats()
+        if captcha_solver:
+            stats['captcha_backends'] = captcha_solver.get_stats()
+            stats['captcha_batches'] = captcha_batcher.get_stats()
+        stats['case_cache'] = case_cache.get_stats()
+        stats['case_watch'] = await asyncio.to_thread(case_watcher.get_stats)
+        stats['order_downloads'] = order_downloader.get_stats()
+        stats['http_hosts'] = get_default_engine().get_stats()
+        stats['sessions'] = session_pool.stats()
+        if get_capture_store():
+            stats['captures'] = get_capture_store().get_stats()
         return {"success": True, "stats": stats}
     except Exception as e:
         return {"success": False, "message": f"Error: {str(e)}"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics: stage latency histograms per court host, solver and cache counters"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.on_event("startup")
+async def start_case_watcher():
+    """Start refreshing watched cases"""
+    if case_watcher.workers > 0:
+        case_watcher.start()
+
+async def refresh_aging_sessions():
+    """Renew pooled sessions before the court site expires them"""
+    max_age = float(os.getenv('SESSION_MAX_AGE', '1200'))
+    while True:
+        await asyncio.sleep(min(60, max_age / 4))
+        refreshed = await session_pool.refresh_aging_async(max_age)
+        if refreshed:
+            log('sessions_refreshed', count=refreshed)
+
+@app.on_event("startup")
+async def start_session_refresher():
+    app.state.session_refresher = asyncio.ensure_future(refresh_aging_sessions())
+
+@app.on_event("shutdown")
+async def stop_session_refresher():
+    app.state.session_refresher.cancel()
+
+@app.on_event("shutdown")
+async def stop_case_watcher():
+    await case_watcher.stop()
+
+@app.on_event("shutdown")
+async def close_http_engine():
+    """Close the pooled sessions' clients, then the async HTTP transport they share"""
+    await session_pool.close_all_async()
+    await get_default_engine().aclose()
+
+@app.on_event("shutdown")
+def close_query_logger():
+    """Write the queued query logs before exiting"""
+    query_logger.close()
+
+@app.on_event("shutdown")
+def close_metadata_store():
+    """Write pending court complex and case type changes before exiting"""
+    metadata_store.close()
+
+@app.on_event("shutdown")
+def close_capture_store():
+    """Write the queued response captures before exiting"""
+    if get_capture_store():
+        get_capture_store().close()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,168 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from telemetry import log
+
+
+def content_hash(value) -> str:
+    """Stable hash of a JSON-serializable value, used as its ETag."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+class MetadataStore:
+    """
+    On-disk store of the rarely changing per-district dropdown data: court
+    complexes per court URL and case types per (court URL, court complex).
+
+    Everything is served from memory. Entries older than `max_age` are still
+    served but trigger a background refresh; a refresh that returns the same
+    content (by hash) only bumps the timestamp, otherwise the revision is
+    incremented and the file is rewritten. Rewrites happen on a background
+    thread, `save_delay` seconds after the first change so that changes in
+    quick succession are written together.
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(self, path: str = 'court_metadata.json', max_age: float = 86400, save_delay: float = 1.0):
+        self.path = path
+        self.max_age = max_age
+        self.save_delay = save_delay
+        self._courts: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self.load()
+        self._dirty = threading.Event()
+        self._closing = False
+        self._writer = threading.Thread(target=self._write_loop, name="metadata-writer", daemon=True)
+        self._writer.start()
+
+    def load(self):
+        """Load the store from disk, ignoring files written by another format version"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        if data.get('version') != self.FORMAT_VERSION:
+            log('metadata_store_ignored', level='warning', path=self.path, version=data.get('version'),
+                expected=self.FORMAT_VERSION)
+            return
+        self._courts = data.get('courts', {})
+
+    def save(self):
+        """Atomically write the store to disk"""
+        with self._lock:
+            payload = json.dumps({'version': self.FORMAT_VERSION, 'courts': self._courts}, ensure_ascii=False)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, self.path)
+
+    def _write_loop(self):
+        while True:
+            self._dirty.wait()
+            if not self._closing:
+                time.sleep(self.save_delay)
+            self._dirty.clear()
+            try:
+                self.save()
+            except OSError as e:
+                log('metadata_save_failed', level='error', path=self.path, error=str(e))
+            if self._closing:
+                return
+
+    def close(self):
+        """Write pending changes and stop the writer thread"""
+        if self._writer.is_alive():
+            self._closing = True
+            self._dirty.set()
+            self._writer.join()
+
+    @staticmethod
+    def _court_key(court_url):
+        return court_url.rstrip('/')
+
+    def _entry(self, court_url, section, key=None):
+        court = self._courts.get(self._court_key(court_url), {})
+        entry = court.get(section)
+        if key is not None:
+            entry = (entry or {}).get(key)
+        return entry
+
+    def _store(self, court_url, section, key, value) -> bool:
+        """Stores a value, returning True if its content changed."""
+        digest = content_hash(value)
+        now = time.time()
+        with self._lock:
+            court = self._courts.setdefault(self._court_key(court_url), {})
+            if key is None:
+                previous = court.get(section)
+            else:
+                previous = court.setdefault(section, {}).get(key)
+
+            if previous and previous['hash'] == digest:
+                previous['fetched_at'] = now
+                return False
+
+            entry = {
+                'value': value,
+                'hash': digest,
+                'revision': (previous['revision'] + 1) if previous else 1,
+                'fetched_at': now
+            }
+            if key is None:
+                court[section] = entry
+            else:
+                court[section][key] = entry
+            return True
+
+    def is_stale(self, entry) -> bool:
+        return entry is None or time.time() - entry['fetched_at'] > self.max_age
+
+    def get_court_complexes(self, court_url) -> Optional[dict]:
+        """Entry dict with 'value', 'hash', 'revision' and 'fetched_at', or None"""
+        return self._entry(court_url, 'court_complexes')
+
+    def put_court_complexes(self, court_url, court_complexes: dict) -> bool:
+        changed = self._store(court_url, 'court_complexes', None, court_complexes)
+        if changed:
+            self._dirty.set()
+        return changed
+
+    def get_case_types(self, court_url, court_complex_code) -> Optional[dict]:
+        return self._entry(court_url, 'case_types', court_complex_code)
+
+    def put_case_types(self, court_url, court_complex_code, case_types: dict) -> bool:
+        changed = self._store(court_url, 'case_types', court_complex_code, case_types)
+        if changed:
+            self._dirty.set()
+        return changed
+
+    def refresh_in_background(self, refresh_key, fetch: Callable[[], Awaitable[Optional[dict]]],
+                              store: Callable[[dict], bool]):
+        """
+        Runs `fetch` in a background task unless a refresh for the same key
+        is already running, and stores a non-empty result.
+        """
+        if refresh_key in self._refreshing:
+            return
+        self._refreshing.add(refresh_key)
+
+        async def run():
+            try:
+                value = await fetch()
+                if value:
+                    changed = store(value)
+                    log('metadata_refresh', level='debug', key=refresh_key, outcome='changed' if changed else 'unchanged')
+            except Exception as e:
+                log('metadata_refresh', level='warning', key=refresh_key, outcome='error', error=str(e))
+            finally:
+                self._refreshing.discard(refresh_key)
+
+        asyncio.ensure_future(run())
@@ -0,0 +1,171 @@
+"""
+Downloads of the order PDFs linked from case details.
+
+Orders are fetched on the case's court session (the links need its
+cookie), a few at a time across all cases, and streamed to disk in chunks
+while being hashed. Files are stored once per content hash under
+<directory>/ab/abcdef....pdf, and the hash, size and download time are
+recorded on the order's row in the case store, so orders already stored
+are skipped when the case is refreshed again.
+"""
+import asyncio
+import hashlib
+import os
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urljoin
+
+import httpx
+
+from async_scraper import is_congestion
+from telemetry import log, span
+
+CHUNK_SIZE = 64 * 1024
+# Received bytes collected before they are written out in a worker thread
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+class OrderDownloadError(Exception):
+    pass
+
+
+class OrderDownloader:
+    def __init__(self, case_store, directory: str = "orders", concurrency: int = 4, max_attempts: int = 3):
+        """
+        Args:
+            case_store: CaseStore holding the orders and their file metadata
+            directory: Where the PDFs are stored
+            concurrency: Downloads in flight across all cases
+            max_attempts: Failed downloads of an order before it is no longer retried
+        """
+        self.case_store = case_store
+        self.directory = directory
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self.downloaded = 0
+        self.deduplicated = 0
+        self.failed = 0
+        self.bytes_written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], f"{sha256}.pdf")
+
+    async def _stream_to_disk(self, scraper, url, tmp_path):
+        """GET `url` on the scraper's session into tmp_path; returns (sha256, size)"""
+        digest = hashlib.sha256()
+        size = 0
+        head = b''
+        headers = {**scraper.page_headers, 'Referer': scraper.search_url}
+        async with scraper.engine.host_control(url).request(is_congestion):
+            async with scraper.session.stream('GET', url, headers=headers) as response:
+                response.raise_for_status()
+                # File operations run in worker threads so slow disks do not stall the event loop
+                f = await asyncio.to_thread(open, tmp_path, 'wb')
+                try:
+                    buffer = bytearray()
+                    async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                        if len(head) < 5:
+                            head += chunk[:5 - len(head)]
+                        digest.update(chunk)
+                        buffer += chunk
+                        size += len(chunk)
+                        if len(buffer) >= WRITE_BUFFER_SIZE:
+                            await asyncio.to_thread(f.write, bytes(buffer))
+                            buffer.clear()
+                    if buffer:
+                        await asyncio.to_thread(f.write, bytes(buffer))
+                finally:
+                    await asyncio.to_thread(f.close)
+        if not head.startswith(b'%PDF'):
+            # An expired session gets an HTML page instead of the file
+            raise OrderDownloadError("Response is not a PDF" + (" (HTML page)" if head.lstrip()[:1] == b'<' else ""))
+        return digest.hexdigest(), size
+
+    async def _download(self, scraper, url):
+        """Download one file into the store; returns (sha256, size, deduplicated)"""
+        tmp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}.part")
+        try:
+            generation = scraper.generation
+            try:
+                sha256, size = await self._stream_to_disk(scraper, url, tmp_path)
+            except OrderDownloadError:
+                # Retry once on a renewed session
+                if not await scraper.reinitialize(generation):
+                    raise
+                sha256, size = await self._stream_to_disk(scraper, url, tmp_path)
+
+            deduplicated = await asyncio.to_thread(self._store, tmp_path, sha256)
+            return sha256, size, deduplicated
+        finally:
+            await asyncio.to_thread(self._discard, tmp_path)
+
+    def _store(self, tmp_path, sha256) -> bool:
+        """Move a downloaded file to its hash path; True if that file was already stored"""
+        path = self.object_path(sha256)
+        if os.path.exists(path):
+            return True
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+        return False
+
+    @staticmethod
+    def _discard(tmp_path):
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    async def download_order(self, scraper, cino, order: Dict[str, Any]) -> Dict[str, Any]:
+        """Download one pending order (from CaseStore.pending_orders) and record the outcome"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        url = urljoin(scraper.site_url + '/', order['download_link'])
+        result = {'order_number': order['order_number'], 'order_date': order['order_date']}
+
+        async with self._semaphore:
+            with span('order_download', scraper.host, cino=cino, order_number=order['order_number']) as stage:
+                try:
+                    sha256, size, deduplicated = await self._download(scraper, url)
+                except (httpx.HTTPError, OrderDownloadError, OSError) as e:
+                    stage.set('error', error=str(e))
+                    self.failed += 1
+                    await asyncio.to_thread(self.case_store.record_order_file, cino, order['row_key'], error=str(e))
+                    return {**result, 'success': False, 'error': str(e)}
+                stage.set('deduplicated' if deduplicated else 'ok', size=size)
+
+        if deduplicated:
+            self.deduplicated += 1
+        else:
+            self.downloaded += 1
+            self.bytes_written += size
+        await asyncio.to_thread(self.case_store.record_order_file, cino, order['row_key'], sha256, size)
+        return {**result, 'success': True, 'sha256': sha256, 'size': size}
+
+    async def download_case(self, scraper, cino, reserve: Optional[Callable[[int], int]] = None) -> List[Dict[str, Any]]:
+        """
+        Download the stored orders of a case that have a link but no file yet.
+
+        Args:
+            scraper: AsyncECourtsScraper session of the case's court
+            cino: The case
+            reserve: Optional callable given the number of pending orders and
+                returning how many may be fetched now; the rest stay pending
+        """
+        pending = await asyncio.to_thread(self.case_store.pending_orders, cino, self.max_attempts)
+        if pending and reserve is not None:
+            allowed = reserve(len(pending))
+            if allowed < len(pending):
+                log('order_downloads_deferred', cino=cino, deferred=len(pending) - allowed)
+                pending = pending[:allowed]
+        if not pending:
+            return []
+        return list(await asyncio.gather(*(self.download_order(scraper, cino, order) for order in pending)))
+
+    def get_stats(self):
+        return {
+            'downloaded': self.downloaded,
+            'deduplicated': self.deduplicated,
+            'failed': self.failed,
+            'bytes_written': self.bytes_written,
+            'concurrency': self.concurrency
+        }
@@ -0,0 +1,150 @@
+"""
+Per-host request pacing shared by every async session in the process.
+
+Each court host gets a token bucket (a hard cap on request rate) and an
+AIMD concurrency limit: the number of requests allowed in flight grows by
+one per window of healthy responses and is halved when the host times out,
+returns a 5xx or throttles us, so every host converges on the most
+concurrency it serves without degrading.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Bucket size, the most requests that can start back to back
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.throttled = 0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Wait until a token is available and take it"""
+        while True:
+            self._refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            self.throttled += 1
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AIMDLimiter:
+    """Additive-increase / multiplicative-decrease limit on requests in flight"""
+
+    def __init__(self, initial: int = 2, min_limit: int = 1, max_limit: int = 8,
+                 latency_target: float = 3.0, backoff: float = 0.5):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.in_flight = 0
+        self.successes = 0
+        self.congestion_events = 0
+        self._last_decrease = 0.0
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _cond(self):
+        # Created lazily so the limiter can be built outside an event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def acquire(self):
+        condition = self._cond()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, latency: float, congested: bool, failed: bool = False):
+        """Return a slot; `failed` requests that were not congestion leave the limit alone"""
+        now = time.monotonic()
+        if congested:
+            # One decrease per latency window, so a burst of failures from
+            # the same overload halves the limit once rather than collapsing it
+            if now - self._last_decrease > self.latency_target:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._last_decrease = now
+                self.congestion_events += 1
+        elif not failed and latency <= self.latency_target:
+            # +1 per `limit` healthy responses, i.e. about one step per round trip
+            self.successes += 1
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+        condition = self._cond()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+
+class HostControl:
+    def __init__(self, bucket: TokenBucket, limiter: AIMDLimiter):
+        self.bucket = bucket
+        self.limiter = limiter
+
+    @asynccontextmanager
+    async def request(self, is_congestion: Callable[[BaseException], bool] = lambda e: False):
+        """
+        Wraps one request: waits for a concurrency slot and a rate token,
+        then feeds the outcome back. Exceptions for which `is_congestion`
+        is true count as the host being overloaded.
+        """
+        await self.limiter.acquire()
+        congested = failed = False
+        started = time.monotonic()
+        try:
+            await self.bucket.acquire()
+            started = time.monotonic()
+            yield
+        except BaseException as e:
+            failed = True
+            congested = is_congestion(e)
+            raise
+        finally:
+            await self.limiter.release(time.monotonic() - started, congested, failed)
+
+    def stats(self):
+        return {
+            'concurrency_limit': round(self.limiter.limit, 2),
+            'in_flight': self.limiter.in_flight,
+            'congestion_events': self.limiter.congestion_events,
+            'rate_limited_waits': self.bucket.throttled
+        }
+
+
+class HostRateControl:
+    """Registry of HostControl per host, built on first use with shared settings"""
+
+    def __init__(self, rate: float = 4, burst: float = 8, initial_concurrency: int = 2,
+                 max_concurrency: int = 8, latency_target: float = 3.0):
+        self.rate = rate
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self._hosts: Dict[str, HostControl] = {}
+
+    def get(self, host: str) -> HostControl:
+        control = self._hosts.get(host)
+        if control is None:
+            control = self._hosts[host] = HostControl(
+                TokenBucket(self.rate, self.burst),
+                AIMDLimiter(min(self.initial_concurrency, self.max_concurrency), 1,
+                            self.max_concurrency, self.latency_target)
+            )
+        return control
+
+    def stats(self):
+        return {host: control.stats() for host, control in self._hosts.items()}
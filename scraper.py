@@ -1,8 +1,104 @@
 import requests
-from bs4 import BeautifulSoup
 import re
 import json
+import threading
 import time
+from collections import namedtuple
+from types import MappingProxyType
+from urllib.parse import urlsplit
+from capture_store import capture
+from case_parser import find_cino, make_soup, parse_case_details, parse_case_types
+from telemetry import log, span
+
+class SearchStatus:
+    """Outcomes of a case search."""
+    FOUND = 'found'
+    NOT_FOUND = 'not_found'
+    CAPTCHA_REJECTED = 'captcha_rejected'
+    SESSION_EXPIRED = 'session_expired'
+    NETWORK_ERROR = 'network_error'
+    PARSE_ERROR = 'parse_error'
+
+class SearchResult:
+    """
+    Result of a case search: the status, the CINO when a case was found
+    and, once fetched, its parsed details.
+    """
+
+    def __init__(self, status, cino=None, message=None, case_details=None, attempts=1):
+        self.status = status
+        self.cino = cino
+        self.message = message
+        self.case_details = case_details
+        self.attempts = attempts
+
+    def __bool__(self):
+        return self.status == SearchStatus.FOUND
+
+    def as_dict(self):
+        return {
+            'status': self.status,
+            'cino': self.cino,
+            'message': self.message,
+            'attempts': self.attempts
+        }
+
+# WordPress admin-ajax answers "0" for unknown actions and "-1" for a failed nonce check
+EXPIRED_AJAX_BODIES = ('0', '-1')
+SESSION_EXPIRY_MARKERS = ('session', 'token', 'expired', 'invalid request')
+
+CNR_PATTERN = re.compile(r'^[A-Z]{4}\d{12}$')
+
+def normalize_cnr(cnr):
+    """Uppercases a CNR and strips separators; returns None if it is not a 16-character CNR."""
+    cleaned = re.sub(r'[\s\-/]', '', (cnr or '')).upper()
+    return cleaned if CNR_PATTERN.match(cleaned) else None
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36'
+
+# Header templates. Cookies are left to the HTTP session and Accept-Encoding
+# to the client, which only advertises encodings it can decode.
+BROWSER_HEADERS = {
+    'User-Agent': USER_AGENT,
+    'Accept-Language': 'en-US,en-IN;q=0.9,en;q=0.8,ml;q=0.7',
+    'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
+    'sec-ch-ua-mobile': '?0',
+    'sec-ch-ua-platform': '"Windows"'
+}
+
+PAGE_HEADERS = MappingProxyType({
+    **BROWSER_HEADERS,
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1'
+})
+
+AJAX_HEADERS = {
+    **BROWSER_HEADERS,
+    'Accept': 'application/json, text/javascript, */*; q=0.01',
+    'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+    'X-Requested-With': 'XMLHttpRequest',
+    'Sec-Fetch-Dest': 'empty',
+    'Sec-Fetch-Mode': 'cors',
+    'Sec-Fetch-Site': 'same-origin'
+}
+
+# admin-ajax.php actions: whether the payload carries the page's tok_*/scid
+# tokens, whether an expired-session answer may be retried on a new
+# session (not for searches, whose CAPTCHA belongs to the old session), and
+# the pipeline stage the call is timed as
+AjaxAction = namedtuple('AjaxAction', ['with_tokens', 'retry_expired', 'stage'])
+AJAX_ACTIONS = {
+    's3waas_pll_lang_cookie': AjaxAction(with_tokens=False, retry_expired=False, stage='cookie'),
+    'get_case_types': AjaxAction(with_tokens=True, retry_expired=True, stage='case_types'),
+    'get_cases': AjaxAction(with_tokens=True, retry_expired=False, stage='search'),
+    'get_cnr_details': AjaxAction(with_tokens=False, retry_expired=True, stage='details'),
+}
 
 class ECourtsScraper:
     def __init__(self, district_court_url):
@@ -11,11 +107,24 @@ class ECourtsScraper:
         The session object will automatically handle cookies.
         """
         self.base_url = district_court_url
+        # Endpoint URLs and header sets never change for a court, so they are built once
+        self.site_url = district_court_url.rstrip('/')
+        self.host = urlsplit(self.site_url).netloc
+        self.search_url = f"{self.site_url}/case-status-search-by-case-number/"
+        self.ajax_url = f"{self.site_url}/wp-admin/admin-ajax.php"
+        self.page_headers = PAGE_HEADERS
+        self.ajax_headers = MappingProxyType({**AJAX_HEADERS, 'Origin': self.site_url, 'Referer': self.search_url})
         self.session = requests.Session()
         self.dynamic_tokens = {}
         self.case_type_map = {}
         self.court_complex_map = {}
         self.captcha_url = ""
+        # Session lifecycle: bumped on every successful initialization, so a
+        # caller can tell whether the session it saw expire was already replaced
+        self.generation = 0
+        self.initialized_at = None
+        self.reinit_count = 0
+        self._reinit_lock = threading.Lock()
 
     def _fetch_page_content(self, url, headers=None, data=None):
         """
@@ -30,46 +139,64 @@ class ECourtsScraper:
             response.raise_for_status()
             return response
         except requests.RequestException as e:
-            print(f"Error fetching {url}: {e}")
+            log('fetch_failed', level='warning', host=self.host, url=url.split('?', 1)[0], error=str(e))
             return None
 
-    def initialize_session(self):
+    # --- Request building, shared by the sync and async scrapers ---
+
+    def _ajax_payload(self, action, fields):
+        spec = AJAX_ACTIONS.get(action)
+        if spec is None:
+            raise ValueError(f"Unknown admin-ajax action: {action}")
+        payload = {**fields, 'action': action}
+        if spec.with_tokens:
+            payload.update(self.dynamic_tokens)
+        return payload
+
+    def ajax(self, action: str, headers=None, **fields):
         """
-        Performs the full session initialization flow:
-        1. Initial page load to get dynamic tokens.
-        2. AJAX call to set the PHPSESSID cookie.
-        3. Scrapes court complex map.
-        4. Constructs the CAPTCHA URL.
+        POSTs an admin-ajax.php action with the given form fields (plus the
+        session tokens when the action needs them) and returns the response,
+        or None on a network error. For actions that allow it, a response
+        showing the session expired re-initializes the session once and the
+        request is rebuilt and sent again; None is returned if the session
+        is still expired after that.
         """
-        # Ensure base_url doesn't end with slash to avoid double slashes
-        base_url = self.base_url.rstrip('/')
-        search_url = f"{base_url}/case-status-search-by-case-number/"
-        print(f"Initializing session by fetching: {search_url}")
+        generation = self.generation
+        payload = self._ajax_payload(action, fields)
+        with span(AJAX_ACTIONS[action].stage, self.host) as stage:
+            response = self._fetch_page_content(self.ajax_url, headers=headers or self.ajax_headers, data=payload)
+            if (response is not None and AJAX_ACTIONS[action].retry_expired
+                    and self._is_expired_response(response) and self.reinitialize(generation)):
+                stage.set(reinitialized=True)
+                response = self._fetch_page_content(
+                    self.ajax_url, headers=headers or self.ajax_headers, data=self._ajax_payload(action, fields)
+                )
+            if response is not None and AJAX_ACTIONS[action].retry_expired and self._is_expired_response(response):
+                # Still expired: the session could not be renewed or the court keeps rejecting it
+                stage.set('expired')
+                response = None
+            elif response is None:
+                stage.set('error')
+        return response
 
-        # Step 1: Initial page load to get dynamic tokens
-        initial_headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
-            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8,application/signed-exchange;v=b3;q=0.7',
-            'Accept-Language': 'en-US,en-IN;q=0.9,en;q=0.8,ml;q=0.7',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
-            'DNT': '1',
-            'Connection': 'keep-alive',
-            'Upgrade-Insecure-Requests': '1',
-            'Sec-Fetch-Dest': 'document',
-            'Sec-Fetch-Mode': 'navigate',
-            'Sec-Fetch-Site': 'none',
-            'Sec-Fetch-User': '?1',
-            'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"'
+    @staticmethod
+    def _search_fields(case_type_code, case_number, year, captcha_value, court_complex_code):
+        return {
+            'service_type': 'courtComplex',
+            'est_code': court_complex_code,
+            'case_type': case_type_code,
+            'reg_no': case_number,
+            'reg_year': year,
+            'siwp_captcha_value': captcha_value,
+            'es_ajax_request': '1',
+            'submit': 'Search'
         }
-        
-        response = self._fetch_page_content(search_url, headers=initial_headers)
-        if not response:
-            return False
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        
+    # --- Response parsing, shared by the sync and async scrapers ---
+
+    def _extract_dynamic_tokens(self, soup):
+        """Collects the tok_* and scid hidden inputs. Returns False if none are found."""
         self.dynamic_tokens = {}
         for hidden_input in soup.find_all('input', type='hidden'):
             if 'name' in hidden_input.attrs and hidden_input['name'].startswith('tok_'):
@@ -78,84 +205,182 @@ class ECourtsScraper:
                 self.dynamic_tokens['scid'] = hidden_input['value']
         
         if not self.dynamic_tokens:
-            print("Failed to find dynamic tokens. The HTML structure might have changed.")
+            log('session_tokens_missing', level='warning', host=self.host)
             return False
         
-        print(f"Dynamic tokens found: {self.dynamic_tokens}")
-
-        # Step 2: Make the POST request to set the session cookie
-        print("Making POST request to establish session and get cookies...")
-        payload = {
-            'time': int(time.time()),
-            'lang': 'en',
-            'action': 's3waas_pll_lang_cookie'
-        }
-        # Build cookie string from session cookies
-        cookie_string = '; '.join([f"{name}={value}" for name, value in self.session.cookies.items()])
-        
-        # Ensure base_url doesn't end with slash to avoid double slashes
-        base_url = self.base_url.rstrip('/')
-        
-        headers = {
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Accept-Language': 'en-US,en-IN;q=0.9,en;q=0.8,ml;q=0.7',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'Origin': base_url,
-            'Referer': search_url,
-            'X-Requested-With': 'XMLHttpRequest',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
-            'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"'
-        }
-        
-        # Add cookie header if cookies exist
-        if cookie_string:
-            headers['Cookie'] = cookie_string
-        cookie_response = self._fetch_page_content(
-            f"{base_url}/wp-admin/admin-ajax.php",
-            headers=headers,
-            data=payload
-        )
-        if not cookie_response:
-            print("Failed to get session cookie. Exiting.")
-            return False
-            
-        print("Session cookie established successfully.")
+        log('session_tokens_found', level='debug', host=self.host, count=len(self.dynamic_tokens))
+        return True
 
-        # Step 3: Scrape the court complex options
+    def _finish_initialization(self, soup):
+        """Scrapes the court complex map and constructs the CAPTCHA URL."""
         court_complex_select = soup.find('select', {'name': 'est_code'})
         if court_complex_select:
             for option in court_complex_select.find_all('option'):
                 if option.text.strip() and 'value' in option.attrs:
                     self.court_complex_map[option.text.strip()] = option['value']
         else:
-            print("Failed to find 'est_code' select element.")
+            log('court_complexes_missing', level='warning', host=self.host)
             return False
         
-        print(f"Court complexes found: {self.court_complex_map}")
+        log('court_complexes_found', level='debug', host=self.host, count=len(self.court_complex_map))
         
-        # Step 4: Construct CAPTCHA URL using the scid token
+        # Construct CAPTCHA URL using the scid token
         if 'scid' in self.dynamic_tokens:
-            # Ensure base_url doesn't end with slash to avoid double slashes
-            base_url = self.base_url.rstrip('/')
-            self.captcha_url = f"{base_url}/?_siwp_captcha&id={self.dynamic_tokens['scid']}"
-        
-        print(f"CAPTCHA URL constructed: {self.captcha_url}")
+            self.captcha_url = f"{self.site_url}/?_siwp_captcha&id={self.dynamic_tokens['scid']}"
         
+        self.generation += 1
+        self.initialized_at = time.monotonic()
+        log('session_initialized', level='debug', host=self.host, generation=self.generation)
         return True
 
+    def session_age(self):
+        """Seconds since the session was (re)initialized, or None if it never was"""
+        return None if self.initialized_at is None else time.monotonic() - self.initialized_at
+
+    @staticmethod
+    def _is_expired_response(response):
+        """
+        True if an AJAX response shows the session's tokens or cookie are no
+        longer accepted: WordPress's bare "0"/"-1" bodies, or an HTML page
+        where JSON was expected.
+        """
+        body = response.text.strip()
+        return body in EXPIRED_AJAX_BODIES or '<html' in body[:500].lower()
+
+    def _parse_case_types(self, response):
+        """Parses the get_case_types AJAX response into a name -> code map."""
+        try:
+            json_data = response.json()
+            if not isinstance(json_data, dict) or not json_data.get('success'):
+                log('case_types_missing', level='warning', host=self.host)
+                return {}
+
+            with span('parse', self.host, kind='case_types'):
+                case_types = parse_case_types(json_data['data'])
+            self.case_type_map = case_types
+            log('case_types_parsed', level='debug', host=self.host, count=len(case_types))
+            return case_types
+        except (json.JSONDecodeError, KeyError) as e:
+            log('case_types_unparseable', level='warning', host=self.host, error=str(e))
+            return {}
+
+    def _parse_search_response(self, response):
+        """Classifies the get_cases AJAX response into a SearchResult carrying the CINO (data-cno)."""
+        if not response:
+            log('search_response', level='warning', outcome=SearchStatus.NETWORK_ERROR, host=self.host)
+            return SearchResult(SearchStatus.NETWORK_ERROR, message="No response from the court server")
+
+        if self._is_expired_response(response):
+            log('search_response', level='warning', outcome=SearchStatus.SESSION_EXPIRED, host=self.host)
+            return SearchResult(SearchStatus.SESSION_EXPIRED, message="Session expired")
+
+        try:
+            json_data = response.json()
+            if not isinstance(json_data, dict):
+                raise ValueError(f"Expected a JSON object, got {type(json_data).__name__}")
+        except ValueError as e:
+            log('search_response', level='warning', outcome=SearchStatus.PARSE_ERROR, host=self.host, error=str(e))
+            return SearchResult(SearchStatus.PARSE_ERROR, message=str(e))
+
+        if not json_data.get('success'):
+            message = json_data.get('data') or json_data.get('message') or ''
+            if not isinstance(message, str):
+                message = json.dumps(message)
+            log('search_rejected', level='info', host=self.host, message=message[:200])
+            lowered = message.lower()
+            if 'captcha' in lowered:
+                return SearchResult(SearchStatus.CAPTCHA_REJECTED, message=message)
+            if any(marker in lowered for marker in SESSION_EXPIRY_MARKERS):
+                return SearchResult(SearchStatus.SESSION_EXPIRED, message=message)
+            return SearchResult(SearchStatus.NOT_FOUND, message=message or "No cases found")
+
+        html = json_data.get('data', '')
+        # Look for the case number in the response
+        with span('parse', self.host, kind='search_response'):
+            cino = find_cino(html)
+        capture('search_response', html, cino, self.base_url, failed=not cino)
+        if cino:
+            log('search_response', level='info', outcome=SearchStatus.FOUND, host=self.host, cino=cino)
+            return SearchResult(SearchStatus.FOUND, cino=cino)
+        log('search_response', level='info', outcome=SearchStatus.NOT_FOUND, host=self.host, message="No CINO in the results")
+        return SearchResult(SearchStatus.NOT_FOUND, message="Could not find case number in the results")
+
+    def _parse_case_details(self, response, cino=None):
+        """Parses the get_cnr_details AJAX response into the case details dict."""
+        try:
+            json_data = json.loads(response.text)
+            if not isinstance(json_data, dict):
+                raise ValueError(f"Expected a JSON object, got {type(json_data).__name__}")
+            # The HTML is returned as a JSON string with escaped characters
+            html_content = json_data.get("data") or ""
+        except ValueError as e:
+            log('case_details_unparseable', level='warning', host=self.host, cino=cino, error=str(e))
+            capture('case_details', response.text, cino, self.base_url, failed=True)
+            return None
+        
+        with span('parse', self.host, kind='case_details', cino=cino):
+            case_details = parse_case_details(html_content)
+        capture('case_details', html_content, cino, self.base_url, failed=not case_details)
+        log('case_details_parsed', level='debug', host=self.host, cino=cino, sections=len(case_details))
+        return case_details
+
+    # --- Public API ---
+
+    def reinitialize(self, generation=None):
+        """
+        Starts a fresh session (new cookie and tokens) for the same court.
+        If `generation` is given and the session has been re-initialized
+        since, nothing is done and True is returned.
+        """
+        with self._reinit_lock:
+            if generation is not None and generation != self.generation:
+                return True
+            log('session_reinitialized', host=self.host, generation=self.generation)
+            self.session.cookies.clear()
+            self.reinit_count += 1
+            return self.initialize_session()
+
+    def initialize_session(self):
+        """
+        Performs the full session initialization flow:
+        1. Initial page load to get dynamic tokens.
+        2. AJAX call to set the PHPSESSID cookie.
+        3. Scrapes court complex map.
+        4. Constructs the CAPTCHA URL.
+        """
+        log('session_initializing', level='debug', host=self.host)
+
+        # Step 1: Initial page load to get dynamic tokens
+        with span('page_load', self.host) as stage:
+            response = self._fetch_page_content(self.search_url, headers=self.page_headers)
+            if not response:
+                stage.set('error')
+        if not response:
+            return False
+
+        soup = make_soup(response.text)
+        if not self._extract_dynamic_tokens(soup):
+            return False
+
+        # Step 2: Make the POST request to set the session cookie
+        cookie_response = self.ajax('s3waas_pll_lang_cookie', time=int(time.time()), lang='en')
+        if not cookie_response:
+            log('session_cookie_failed', level='warning', host=self.host)
+            return False
+
+        # Steps 3 and 4: Court complex options and CAPTCHA URL
+        return self._finish_initialization(soup)
+
     def get_captcha_image(self):
         """Fetches the CAPTCHA image and returns its binary content."""
         if not self.captcha_url:
-            print("Session not initialized. Please run initialize_session() first.")
+            log('session_not_initialized', level='warning', host=self.host)
             return None
             
-        print(f"Fetching CAPTCHA image from: {self.captcha_url}")
-        response = self._fetch_page_content(self.captcha_url)
+        with span('captcha_fetch', self.host) as stage:
+            response = self._fetch_page_content(self.captcha_url)
+            if not response:
+                stage.set('error')
         if response:
             return response.content
         return None
@@ -165,382 +390,54 @@ class ECourtsScraper:
         Fetches the case types for a given court complex code using an AJAX call.
         Returns a dictionary mapping case type names to their codes.
         """
-        payload = {
-            'action': 'get_case_types',
-            'est_code': court_complex_code,
-            'service_type': 'courtComplex',
-            'es_ajax_request': '1',
-            **self.dynamic_tokens  # Add dynamic tokens to payload
-        }
-        
-        # Build cookie string from session cookies
-        cookie_string = '; '.join([f"{name}={value}" for name, value in self.session.cookies.items()])
-        
-        # Ensure base_url doesn't end with slash to avoid double slashes
-        base_url = self.base_url.rstrip('/')
-        
-        headers = {
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
-            'Accept-Language': 'en-US,en-IN;q=0.9,en;q=0.8,ml;q=0.7',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'Origin': base_url,
-            'Referer': f"{base_url}/case-status-search-by-case-number/",
-            'X-Requested-With': 'XMLHttpRequest',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
-            'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"'
-        }
-        
-        # Add cookie header if cookies exist
-        if cookie_string:
-            headers['Cookie'] = cookie_string
-        
-        print(f"Fetching case types for {court_complex_code}...")
-        response = self._fetch_page_content(
-            f"{base_url}/wp-admin/admin-ajax.php",
-            headers=headers,
-            data=payload
-        )
+        log('case_types_fetching', level='debug', host=self.host, court_complex=court_complex_code)
+        response = self.ajax('get_case_types', est_code=court_complex_code, service_type='courtComplex', es_ajax_request='1')
         if not response:
-            print(f"Case types request failed. Response status: {response.status_code if response else 'No response'}")
-            print(f"Case types response text: {response.text if response else 'No response'}")
+            log('case_types_failed', level='warning', host=self.host, court_complex=court_complex_code)
             return {}
 
-        try:
-            json_data = response.json()
-            if not json_data.get('success'):
-                print("Failed to get case types from API.")
-                return {}
+        return self._parse_case_types(response)
 
-            soup = BeautifulSoup(json_data['data'], 'html.parser')
-            case_types = {}
-            for option in soup.find_all('option'):
-                if 'value' in option.attrs and option['value'].isdigit():
-                    case_types[option.text.strip()] = option['value']
-            
-            self.case_type_map = case_types
-            print("Case types successfully extracted.")
-            return case_types
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"Error parsing case types response: {e}")
-            return {}
+    def submit_search(self, case_type_code, case_number, year, captcha_value, court_complex_code):
+        """
+        Submits the search form and returns a SearchResult. The CAPTCHA has
+        been consumed once this returns.
+        """
+        log('search_submitting', level='debug', host=self.host, case_type=case_type_code, case_number=case_number, year=year)
+        
+        response = self.ajax('get_cases', **self._search_fields(case_type_code, case_number, year, captcha_value, court_complex_code))
+        return self._parse_search_response(response)
+
+    def find_case_cino(self, case_type_code, case_number, year, captcha_value, court_complex_code):
+        """Submits the search form and returns the CINO of the matching case, or None."""
+        return self.submit_search(case_type_code, case_number, year, captcha_value, court_complex_code).cino
 
     def search_case_by_number(self, case_type_code, case_number, year, captcha_value, court_complex_code):
         """
-        Performs the main search request and returns the URL
-        to the detailed case page.
+        Performs the main search request and returns the parsed
+        details of the matching case.
         """
-        print(f"Searching for case: {case_type_code}/{case_number}/{year}...")
-        
-        # Build the payload using a combination of static and dynamic values
-        payload = {
-            'service_type': 'courtComplex',
-            'est_code': court_complex_code,
-            'case_type': case_type_code,
-            'reg_no': case_number,
-            'reg_year': year,
-            'siwp_captcha_value': captcha_value,
-            'es_ajax_request': '1',
-            'submit': 'Search',
-            'action': 'get_cases',
-            **self.dynamic_tokens  # Add dynamic tokens to payload
-        }
-        
-        # Build cookie string from session cookies
-        cookie_string = '; '.join([f"{name}={value}" for name, value in self.session.cookies.items()])
-        
-        # Ensure base_url doesn't end with slash to avoid double slashes
-        base_url = self.base_url.rstrip('/')
-        
-        headers = {
-            'Accept': 'application/json, text/javascript, */*; q=0.01',
-            'Accept-Encoding': 'gzip, deflate, br, zstd',
-            'Accept-Language': 'en-US,en-IN;q=0.9,en;q=0.8,ml;q=0.7',
-            'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-            'Origin': base_url,
-            'Referer': f"{base_url}/case-status-search-by-case-number/",
-            'X-Requested-With': 'XMLHttpRequest',
-            'Sec-Fetch-Dest': 'empty',
-            'Sec-Fetch-Mode': 'cors',
-            'Sec-Fetch-Site': 'same-origin',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/138.0.0.0 Safari/537.36',
-            'sec-ch-ua': '"Not)A;Brand";v="8", "Chromium";v="138", "Google Chrome";v="138"',
-            'sec-ch-ua-mobile': '?0',
-            'sec-ch-ua-platform': '"Windows"'
-        }
-        
-        # Add cookie header if cookies exist
-        if cookie_string:
-            headers['Cookie'] = cookie_string
-        
-        
-        response = self._fetch_page_content(
-            f"{base_url}/wp-admin/admin-ajax.php",
-            headers=headers,
-            data=payload
-        )
-        if not response:
-            print(f"Search request failed. Response status: {response.status_code if response else 'No response'}")
-            print(f"Search response text: {response.text if response else 'No response'}")
+        cino = self.find_case_cino(case_type_code, case_number, year, captcha_value, court_complex_code)
+        if not cino:
             return None
 
-        try:
-            json_data = response.json()
-            if not json_data.get('success'):
-                print(f"Search failed or no cases found. Server response: {response.text}")
-                return None
-            
-            # Save the HTML response to a file for debugging
-            with open('search_response.html', 'w', encoding='utf-8') as f:
-                f.write(json_data['data'])
-            print("Search response HTML saved to 'search_response.html'")
-            
-            soup = BeautifulSoup(json_data['data'], 'html.parser')
-            
-            # Look for the case number in the response
-            case_div = soup.find('a', {'data-cno': True})
-            if case_div:
-                cino = case_div.get('data-cno')
-                print(f"Found case number: {cino}")
-                
-                # Call the separate function to get case details
-                return self.get_case_details(cino, headers)
-            else:
-                print("Could not find case number in the results.")
-                return None
-        except (json.JSONDecodeError, KeyError) as e:
-            print(f"Error parsing final search response: {e}")
-            return None
+        # Call the separate function to get case details
+        return self.get_case_details(cino)
 
-    def get_case_details(self, cino, headers):
+    def get_case_details(self, cino, headers=None):
         """
-        Makes a POST request to get the case details URL using the CINO.
-        Returns the case details URL or None if failed.
+        Makes a POST request to get the case details using the CINO (the
+        CNR number). No CAPTCHA is needed, so a known CNR can be fetched
+        directly on an initialized session.
+        Returns the parsed case details dict or None if failed.
         """
-        print(f"\nStep 5: Getting case details URL for CINO: {cino}")
-        
-        # Build the payload for case details request
-        case_details_payload = {
-            'cino': cino,
-            'action': 'get_cnr_details',
-            'es_ajax_request': '1'
-        }
-        
-        
-        
-        # Ensure base_url doesn't end with slash to avoid double slashes
-        base_url = self.base_url.rstrip('/')
+        log('case_details_fetching', level='debug', host=self.host, cino=cino)
         
         # Make the POST request to get case details
-        case_details_response = self._fetch_page_content(
-            f"{base_url}/wp-admin/admin-ajax.php",
-            headers=headers,
-            data=case_details_payload
-        )
+        case_details_response = self.ajax('get_cnr_details', headers=headers, cino=cino, es_ajax_request='1')
         
         if not case_details_response:
-            print(f"Case details request failed. Response status: {case_details_response.status_code if case_details_response else 'No response'}")
-            print(f"Case details response text: {case_details_response.text if case_details_response else 'No response'}")
-            return None
-        
-        
-        
-        try:
-            json_data = json.loads(case_details_response.text)
-            # The HTML is returned as a JSON string with escaped characters
-            html_content = json_data.get("data", "")
-            
-            # Save the HTML response to a file for debugging
-            with open('case_details_response.html', 'w', encoding='utf-8') as f:
-                f.write(html_content)
-            print("Case details response HTML saved to 'case_details_response.html'")
-            
-            # Parse the HTML response to extract case details
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-        except json.JSONDecodeError as e:
-            print(f"Error parsing JSON response: {e}")
+            log('case_details_failed', level='warning', host=self.host, cino=cino)
             return None
         
-        # Extract case details from the tables
-        case_details = {}
-        
-        # Extract Case Details table - FIXED SELECTOR
-        case_details_table = soup.find('table', class_='data-table-1')
-        if case_details_table and case_details_table.find('caption', string='Case Details'):
-            tbody = case_details_table.find('tbody')
-            if tbody:
-                row = tbody.find('tr')
-                if row:
-                    cells = row.find_all('td')
-                    if len(cells) >= 6:
-                        case_details['case_type'] = cells[0].text.strip()
-                        case_details['filing_number'] = cells[1].text.strip()
-                        case_details['filing_date'] = cells[2].text.strip()
-                        case_details['registration_number'] = cells[3].text.strip()
-                        case_details['registration_date'] = cells[4].text.strip()
-                        case_details['cnr_number'] = cells[5].text.strip()
-        
-        # Extract Case Status table - FIXED SELECTOR
-        case_status_tables = soup.find_all('table', class_='data-table-1')
-        for table in case_status_tables:
-            caption = table.find('caption')
-            if caption and caption.string == 'Case Status':
-                tbody = table.find('tbody')
-                if tbody:
-                    row = tbody.find('tr')
-                    if row:
-                        cells = row.find_all('td')
-                        if len(cells) >= 5:
-                            case_details['first_hearing_date'] = cells[0].text.strip()
-                            case_details['decision_date'] = cells[1].text.strip()
-                            case_details['case_status'] = cells[2].text.strip()
-                            case_details['nature_of_disposal'] = cells[3].text.strip()
-                            case_details['court_number_and_judge'] = cells[4].text.strip()
-                break
-        
-        # Extract Petitioner and Respondent info - STRUCTURE IS CORRECT
-        petitioner_section = soup.find('h5', string='Petitioner and Advocate')
-        if petitioner_section:
-            petitioner_div = petitioner_section.find_next('div', class_='Petitioner')
-            if petitioner_div:
-                petitioner_list = petitioner_div.find('ul')
-                if petitioner_list:
-                    petitioner_items = petitioner_list.find_all('li')
-                    case_details['petitioners'] = [item.find('p').text.strip() for item in petitioner_items if item.find('p')]
-        
-        respondent_section = soup.find('h5', string='Respondent and Advocate')
-        if respondent_section:
-            respondent_div = respondent_section.find_next('div', class_='respondent')
-            if respondent_div:
-                respondent_list = respondent_div.find('ul')
-                if respondent_list:
-                    respondent_items = respondent_list.find_all('li')
-                    case_details['respondents'] = [item.find('p').text.strip() for item in respondent_items if item.find('p')]
-        
-        # Extract FIR Details - NEW SECTION THAT WAS MISSING
-        fir_tables = soup.find_all('table', class_='data-table-1')
-        for table in fir_tables:
-            caption = table.find('caption')
-            if caption and caption.string == 'FIR Details':
-                tbody = table.find('tbody')
-                if tbody:
-                    row = tbody.find('tr')
-                    if row:
-                        cells = row.find_all('td')
-                        if len(cells) >= 3:
-                            case_details['police_station'] = cells[0].text.strip()
-                            case_details['fir_number'] = cells[1].text.strip()
-                            case_details['fir_year'] = cells[2].text.strip()
-                break
-        
-                 # Extract Case History - FIXED SELECTOR AND BUSINESS DATE EXTRACTION
-        case_history_tables = soup.find_all('table', class_='data-table-1')
-        for table in case_history_tables:
-            caption = table.find('caption')
-            if caption and caption.string == 'Case History':
-                tbody = table.find('tbody')
-                if tbody:
-                    rows = tbody.find_all('tr')
-                    case_details['case_history'] = []
-                    for row in rows:
-                        cells = row.find_all('td')
-                        if len(cells) >= 5:
-                            # For business date, extract text from the link if it exists
-                            business_date_cell = cells[2]
-                            business_date_link = business_date_cell.find('a')
-                            business_date = business_date_link.text.strip() if business_date_link else business_date_cell.text.strip()
-                            
-                            history_entry = {
-                                'registration_number': cells[0].text.strip(),
-                                'judge': cells[1].text.strip(),
-                                'business_date': business_date,
-                                'hearing_date': cells[3].text.strip(),
-                                'purpose': cells[4].text.strip()
-                            }
-                            case_details['case_history'].append(history_entry)
-                break
-        
-        # Extract Acts - NEW SECTION FOR ONGOING CASES
-        acts_tables = soup.find_all('table', class_='data-table-1')
-        for table in acts_tables:
-            caption = table.find('caption')
-            if caption and caption.string == 'Acts':
-                tbody = table.find('tbody')
-                if tbody:
-                    rows = tbody.find_all('tr')
-                    case_details['acts'] = []
-                    for row in rows:
-                        cells = row.find_all('td')
-                        if len(cells) >= 2:
-                            act_entry = {
-                                'under_act': cells[0].text.strip(),
-                                'under_section': cells[1].text.strip()
-                            }
-                            case_details['acts'].append(act_entry)
-                break
-        
-        # Extract Orders - NEW SECTION FOR ONGOING CASES (WITH DOWNLOAD LINKS)
-        orders_tables = soup.find_all('table', class_='data-table-1')
-        for table in orders_tables:
-            caption = table.find('caption')
-            if caption and caption.string == 'Orders':
-                tbody = table.find('tbody')
-                if tbody:
-                    rows = tbody.find_all('tr')
-                    case_details['orders'] = []
-                    for row in rows:
-                        cells = row.find_all('td')
-                        if len(cells) >= 3:
-                            # Extract order details and download link if present
-                            order_number = cells[0].text.strip()
-                            order_date = cells[1].text.strip()
-                            order_details_cell = cells[2]
-                            
-                            # Check if there's a download link
-                            download_link = None
-                            order_details_text = order_details_cell.text.strip()
-                            
-                            link_element = order_details_cell.find('a')
-                            if link_element and 'href' in link_element.attrs:
-                                download_link = link_element['href']
-                                order_details_text = link_element.text.strip()
-                            
-                            order_entry = {
-                                'order_number': order_number,
-                                'order_date': order_date,
-                                'order_details': order_details_text,
-                                'download_link': download_link
-                            }
-                            case_details['orders'].append(order_entry)
-                break
-        
-        # Extract Process Details - NEW SECTION FOR ONGOING CASES
-        process_tables = soup.find_all('table', class_='data-table-1')
-        for table in process_tables:
-            caption = table.find('caption')
-            if caption and caption.string == 'Process Details':
-                tbody = table.find('tbody')
-                if tbody:
-                    rows = tbody.find_all('tr')
-                    case_details['process_details'] = []
-                    for row in rows:
-                        cells = row.find_all('td')
-                        if len(cells) >= 5:
-                            process_entry = {
-                                'process_id': cells[0].text.strip(),
-                                'process_date': cells[1].text.strip(),
-                                'process_title': cells[2].text.strip(),
-                                'party_name': cells[3].text.strip(),
-                                'issued_process': cells[4].text.strip()
-                            }
-                            case_details['process_details'].append(process_entry)
-                break
-        
-        print(f"Successfully extracted case details: {case_details}")
-        return case_details
\ No newline at end of file
+        return self._parse_case_details(case_details_response, cino)
@@ -0,0 +1,132 @@
+"""
+CAPTCHA retry loop around AsyncECourtsScraper.submit_search.
+
+A rejected CAPTCHA costs one round trip; instead of handing the failure
+back to the user, the engine takes the next (prefetched, auto-solved)
+CAPTCHA and resubmits, up to a bounded number of attempts. Every server
+verdict is fed back to the solver so per-backend accuracy is measured.
+A search that finds the session expired re-initializes it in place before
+the next attempt.
+"""
+from typing import Optional
+
+from scraper import SearchResult, SearchStatus
+from telemetry import log
+
+# Statuses after which another CAPTCHA attempt can help; an expired session
+# is re-initialized first
+RETRYABLE_STATUSES = (SearchStatus.CAPTCHA_REJECTED, SearchStatus.NETWORK_ERROR, SearchStatus.SESSION_EXPIRED)
+
+
+def record_captcha_verdict(solver, backend: Optional[str], result: SearchResult):
+    """Credits or debits the backend that solved the CAPTCHA used for `result`."""
+    if not solver or not backend:
+        return
+    if result.status == SearchStatus.CAPTCHA_REJECTED:
+        solver.record_result(backend, False)
+    elif result.status in (SearchStatus.FOUND, SearchStatus.NOT_FOUND):
+        solver.record_result(backend, True)
+
+
+async def get_details_cached(scraper, cino, cache=None):
+    """Case details from the cache, or fetched with the known CINO and cached."""
+    if cache is not None:
+        case_details = await cache.get_details_async(scraper.base_url, cino)
+        if case_details is not None:
+            return case_details
+    case_details = await scraper.get_case_details(cino)
+    if case_details is not None and cache is not None:
+        await cache.put_details_async(scraper.base_url, cino, case_details)
+    return case_details
+
+
+async def get_many_details_cached(scraper, cinos, cache=None):
+    """
+    Details for several CNRs on one session: cached ones are served from
+    the cache and the rest are fetched concurrently. Returns {cino: details or None}.
+    """
+    results = {}
+    missing = []
+    for cino in cinos:
+        case_details = await cache.get_details_async(scraper.base_url, cino) if cache is not None else None
+        if case_details is not None:
+            results[cino] = case_details
+        else:
+            missing.append(cino)
+    if missing:
+        fetched = await scraper.get_many_case_details(missing)
+        for cino, case_details in fetched.items():
+            if case_details is not None and cache is not None:
+                await cache.put_details_async(scraper.base_url, cino, case_details)
+            results[cino] = case_details
+    return {cino: results[cino] for cino in cinos}
+
+
+async def search_with_retries(scraper, prefetcher, case_type_code, case_number, year, court_complex_code,
+                              max_attempts: int = 3, captcha_value: Optional[str] = None,
+                              captcha_backend: Optional[str] = None, solver=None,
+                              fetch_details: bool = True, cache=None) -> SearchResult:
+    """
+    Searches for a case, retrying with fresh auto-solved CAPTCHAs while the
+    server rejects the CAPTCHA or the request fails in transit.
+
+    Args:
+        scraper: An initialized AsyncECourtsScraper
+        prefetcher: The session's CaptchaPrefetcher, source of retry CAPTCHAs
+        max_attempts: Upper bound on search submissions
+        captcha_value: CAPTCHA text for the first attempt (e.g. typed by a user);
+            when omitted the first attempt also uses the prefetcher
+        captcha_backend: Backend that produced `captcha_value`, if it was auto-solved
+        solver: CaptchaSolver to record accuracy on
+        fetch_details: Also fetch and parse the case details when found
+        cache: Optional CaseCache; a known CINO for these search fields skips
+            the CAPTCHA entirely, and found results are stored in it
+
+    Returns:
+        The SearchResult of the last attempt, with `attempts` set and
+        `case_details` filled in when found
+    """
+    court_url = scraper.base_url
+    search_key = (court_url, court_complex_code, case_type_code, case_number, year)
+    if cache is not None:
+        cino = await cache.get_cino_async(*search_key)
+        if cino:
+            case_details = await get_details_cached(scraper, cino, cache) if fetch_details else None
+            if case_details or not fetch_details:
+                return SearchResult(SearchStatus.FOUND, cino=cino, case_details=case_details, attempts=0)
+
+    result = SearchResult(SearchStatus.CAPTCHA_REJECTED, message="No CAPTCHA could be solved")
+    attempts = 0
+    while attempts < max_attempts:
+        if captcha_value is None:
+            captcha = await prefetcher.take()
+            if not captcha or not captcha.text:
+                # Nothing readable; an unsolved CAPTCHA still counts against the budget
+                attempts += 1
+                continue
+            captcha_value, captcha_backend = captcha.text, captcha.solution.backend
+
+        attempts += 1
+        generation = scraper.generation
+        result = await scraper.submit_search(case_type_code, case_number, year, captcha_value, court_complex_code)
+        if result.status == SearchStatus.SESSION_EXPIRED:
+            # The CAPTCHA belonged to the old session; the prefetcher notices the new scid
+            await scraper.reinitialize(generation)
+        # The code is spent, fetch and solve the next one while we carry on
+        prefetcher.schedule()
+        record_captcha_verdict(solver, captcha_backend, result)
+        log('search_attempt', outcome=result.status, host=scraper.host, attempt=attempts, captcha_backend=captcha_backend)
+
+        if result.status not in RETRYABLE_STATUSES:
+            break
+        captcha_value, captcha_backend = None, None
+
+    result.attempts = attempts
+    if result and cache is not None:
+        await cache.put_cino_async(*search_key, result.cino)
+    if result and fetch_details:
+        result.case_details = await get_details_cached(scraper, result.cino, cache)
+        if result.case_details is None:
+            result.status = SearchStatus.PARSE_ERROR
+            result.message = "Case found but its details could not be retrieved"
+    return result
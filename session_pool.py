@@ -0,0 +1,210 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from scraper import ECourtsScraper
+from telemetry import log
+
+
+class PooledSession:
+    """An initialized scraper together with its bookkeeping in the pool."""
+
+    def __init__(self, scraper: ECourtsScraper):
+        self.scraper = scraper
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.use_count = 0
+
+    def touch(self):
+        self.last_used = time.monotonic()
+        self.use_count += 1
+
+
+class ScraperSessionPool:
+    """
+    Keeps one initialized ECourtsScraper per (client token, court URL).
+
+    Sessions are reused while they are younger than `ttl` seconds of idle
+    time, and the least recently used session is evicted once the pool
+    holds `max_size` entries. Each client also remembers the district it
+    initialized last so endpoints that do not carry the district can find
+    the right scraper.
+    """
+
+    def __init__(self, ttl: float = 900, max_size: int = 256,
+                 scraper_factory: Callable[[str], ECourtsScraper] = ECourtsScraper):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.scraper_factory = scraper_factory
+        self._sessions: "OrderedDict[Tuple[str, str], PooledSession]" = OrderedDict()
+        self._active: dict = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_client_token() -> str:
+        return uuid.uuid4().hex
+
+    def _is_expired(self, entry: PooledSession, now: float) -> bool:
+        return now - entry.last_used > self.ttl
+
+    def _evict_expired(self, now: float):
+        expired = [key for key, entry in self._sessions.items() if self._is_expired(entry, now)]
+        for key in expired:
+            del self._sessions[key]
+        for client_token, key in list(self._active.items()):
+            if key not in self._sessions:
+                del self._active[client_token]
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[PooledSession]:
+        now = time.monotonic()
+        entry = self._sessions.get(key)
+        if entry is None:
+            return None
+        if self._is_expired(entry, now):
+            del self._sessions[key]
+            return None
+        self._sessions.move_to_end(key)
+        entry.touch()
+        return entry
+
+    def _store(self, key: Tuple[str, str], entry: PooledSession):
+        now = time.monotonic()
+        self._evict_expired(now)
+        self._sessions[key] = entry
+        self._sessions.move_to_end(key)
+        while len(self._sessions) > self.max_size:
+            evicted_key, _ = self._sessions.popitem(last=False)
+            if self._active.get(evicted_key[0]) == evicted_key:
+                del self._active[evicted_key[0]]
+
+    def _reuse(self, client_token: str, key: Tuple[str, str]) -> Optional[ECourtsScraper]:
+        with self._lock:
+            entry = self._lookup(key)
+            if entry is None:
+                return None
+            self._active[client_token] = key
+            return entry.scraper
+
+    def _register(self, client_token: str, key: Tuple[str, str], scraper: ECourtsScraper):
+        entry = PooledSession(scraper)
+        entry.touch()
+        with self._lock:
+            self._store(key, entry)
+            self._active[client_token] = key
+
+    def acquire(self, client_token: str, court_url: str, force_refresh: bool = False) -> Optional[ECourtsScraper]:
+        """
+        Returns an initialized scraper for the client and court, reusing a
+        warm one when possible. Returns None if initialization fails.
+        """
+        key = (client_token, court_url)
+        if not force_refresh:
+            scraper = self._reuse(client_token, key)
+            if scraper is not None:
+                return scraper
+
+        # Initialization does network I/O, so it runs outside the lock
+        scraper = self.scraper_factory(court_url)
+        if not scraper.initialize_session():
+            return None
+        self._register(client_token, key, scraper)
+        return scraper
+
+    async def acquire_async(self, client_token: str, court_url: str, force_refresh: bool = False):
+        """Same as acquire() for a pool whose factory builds AsyncECourtsScraper."""
+        key = (client_token, court_url)
+        if not force_refresh:
+            scraper = self._reuse(client_token, key)
+            if scraper is not None:
+                return scraper
+
+        scraper = self.scraper_factory(court_url)
+        if not await scraper.initialize_session():
+            return None
+        self._register(client_token, key, scraper)
+        return scraper
+
+    def get(self, client_token: Optional[str], court_url: Optional[str] = None) -> Optional[ECourtsScraper]:
+        """
+        Returns the client's scraper for `court_url`, or the one it
+        initialized last when no court URL is given. Never initializes.
+        """
+        if not client_token:
+            return None
+        with self._lock:
+            key = (client_token, court_url) if court_url else self._active.get(client_token)
+            if key is None:
+                return None
+            entry = self._lookup(key)
+            return entry.scraper if entry else None
+
+    def release(self, client_token: str, court_url: Optional[str] = None):
+        """Drops one session of a client, or all of them when no court URL is given."""
+        with self._lock:
+            if court_url:
+                self._sessions.pop((client_token, court_url), None)
+                if self._active.get(client_token) == (client_token, court_url):
+                    del self._active[client_token]
+            else:
+                for key in [key for key in self._sessions if key[0] == client_token]:
+                    del self._sessions[key]
+                self._active.pop(client_token, None)
+
+    def aging_sessions(self, max_age: float):
+        """Live scrapers initialized more than `max_age` seconds ago"""
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            return [
+                entry.scraper for entry in self._sessions.values()
+                if (entry.scraper.session_age() or 0) > max_age
+            ]
+
+    async def refresh_aging_async(self, max_age: float) -> int:
+        """
+        Re-initializes pooled async scrapers before the court site expires
+        their session, so in-use sessions never hit a stale token. Returns
+        how many were refreshed.
+        """
+        refreshed = 0
+        for scraper in self.aging_sessions(max_age):
+            try:
+                if await scraper.reinitialize(scraper.generation):
+                    refreshed += 1
+            except Exception as e:
+                log('session_refresh_failed', level='warning', host=scraper.host, error=str(e))
+        return refreshed
+
+    async def close_all_async(self):
+        """
+        Drops every session and closes the async scrapers' clients. Sessions
+        evicted earlier are not closed; their clients hold no connections of
+        their own, so they are simply garbage collected.
+        """
+        with self._lock:
+            scrapers = [entry.scraper for entry in self._sessions.values()]
+            self._sessions.clear()
+            self._active.clear()
+        for scraper in scrapers:
+            if hasattr(scraper, 'aclose'):
+                await scraper.aclose()
+
+    def stats(self):
+        with self._lock:
+            self._evict_expired(time.monotonic())
+            entries = list(self._sessions.values())
+            ages = [entry.scraper.session_age() or 0 for entry in entries]
+            return {
+                'sessions': len(self._sessions),
+                'clients': len(self._active),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'oldest_session_age': max(ages, default=0),
+                'uses': sum(entry.use_count for entry in entries),
+                'reinitializations': sum(entry.scraper.reinit_count for entry in entries)
+            }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
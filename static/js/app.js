@@ -236,6 +236,8 @@ class ECourtsApp {
 
         try {
             const response = await axios.post('/api/case-types', {
+                state: this.selectedState,
+                district: this.selectedDistrict,
                 court_complex_code: this.selectedCourtComplex
             });
 
@@ -346,6 +348,10 @@ class ECourtsApp {
                 this.updateStepStatus(7, 'completed');
             } else {
                 this.displayError(response.data.message);
+                // The server discarded that CAPTCHA (or its session), show the next one
+                if (response.data.status === 'captcha_rejected' || response.data.status === 'session_expired') {
+                    this.loadCaptcha();
+                }
             }
         } catch (error) {
             console.error('Error searching case:', error);
@@ -0,0 +1,293 @@
+"""
+Stage timings and structured events for the scraping pipeline.
+
+Code is instrumented with `span(stage, host)` around each step of a lookup
+(page_load, cookie, case_types, captcha_fetch, captcha_solve, search,
+details, parse) and `log(event, **fields)` for notable events. Both are
+handed to the configured sinks:
+
+    prometheus  per-stage and per-host latency histograms and event
+                counters, rendered for the /metrics endpoint (default)
+    json        one JSON object per span or event, to TELEMETRY_LOG_PATH
+                or stderr
+    logging     events on the standard `logging` module's "ecourts"
+                logger at their level, spans at debug (default)
+
+TELEMETRY_SINKS selects them (comma separated, empty for none) and
+`add_sink()` registers others. Spans opened while handling one lookup
+share a trace id, so its stages can be followed through the JSON log.
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Upper bounds (seconds) of the stage latency histogram buckets
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+LOG_LEVELS = {'debug': logging.DEBUG, 'info': logging.INFO, 'warning': logging.WARNING, 'error': logging.ERROR}
+
+logger = logging.getLogger('ecourts')
+
+_trace_id = contextvars.ContextVar('trace_id', default=None)
+
+
+class Span:
+    """One timed stage; `outcome` is 'ok' unless the caller or an exception changes it"""
+
+    __slots__ = ('stage', 'host', 'fields', 'outcome', 'trace_id', 'started', 'duration')
+
+    def __init__(self, stage: str, host: Optional[str] = None, **fields):
+        self.stage = stage
+        self.host = host or ''
+        self.fields = fields
+        self.outcome = 'ok'
+        self.trace_id = _trace_id.get()
+        self.started = time.time()
+        self.duration = 0.0
+
+    def set(self, outcome: Optional[str] = None, **fields):
+        if outcome is not None:
+            self.outcome = outcome
+        self.fields.update(fields)
+
+
+class JsonLogSink:
+    """Writes spans and events as JSON lines"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+        self._lock = threading.Lock()
+
+    def _write(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+
+    def record_span(self, span: Span):
+        record = {
+            'ts': datetime.utcfromtimestamp(span.started).isoformat(timespec='milliseconds') + 'Z',
+            'span': span.stage,
+            'host': span.host or None,
+            'duration_ms': round(span.duration * 1000, 2),
+            'outcome': span.outcome,
+            'trace_id': span.trace_id
+        }
+        record.update(span.fields)
+        self._write(record)
+
+    def record_event(self, event: str, fields: dict):
+        self._write({
+            'ts': datetime.utcnow().isoformat(timespec='milliseconds') + 'Z',
+            'event': event,
+            'trace_id': _trace_id.get(),
+            **fields
+        })
+
+
+class LoggingSink:
+    """Forwards events to the "ecourts" logger at their level and spans at debug"""
+
+    def record_span(self, span: Span):
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s %s %.1f ms %s", span.stage, span.host or '-', span.duration * 1000, span.outcome)
+
+    def record_event(self, event: str, fields: dict):
+        level = LOG_LEVELS.get(fields.get('level'), logging.INFO)
+        if logger.isEnabledFor(level):
+            logger.log(level, "%s %s", event, ' '.join(f"{key}={value}" for key, value in fields.items() if key != 'level'))
+
+
+class PrometheusSink:
+    """Aggregates spans into histograms and events into counters"""
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        # (stage, host, outcome) -> [bucket counts..., sum]
+        self._histograms: Dict[Tuple[str, str, str], List[float]] = {}
+        # (event, outcome) -> count
+        self._events: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def record_span(self, span: Span):
+        key = (span.stage, span.host, span.outcome)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * len(self.buckets) + [0.0]
+            for i, upper in enumerate(self.buckets):
+                if span.duration <= upper:
+                    histogram[i] += 1
+                    break
+            histogram[-1] += span.duration
+
+    def record_event(self, event: str, fields: dict):
+        if fields.get('level') == 'debug':
+            return
+        key = (event, str(fields.get('outcome', '')))
+        with self._lock:
+            self._events[key] = self._events.get(key, 0) + 1
+
+    def event_count(self, event: str, outcome: str = '') -> int:
+        return self._events.get((event, outcome), 0)
+
+    def collect(self):
+        with self._lock:
+            histograms = {key: list(values) for key, values in sorted(self._histograms.items())}
+            events = sorted(self._events.items())
+
+        samples = []
+        for (stage, host, outcome), values in histograms.items():
+            labels = {'stage': stage, 'host': host, 'outcome': outcome}
+            cumulative = 0
+            for upper, count in zip(self.buckets, values):
+                cumulative += count
+                samples.append(('_bucket', {**labels, 'le': _format_value(upper)}, cumulative))
+            samples.append(('_sum', labels, values[-1]))
+            samples.append(('_count', labels, cumulative))
+        yield ('ecourts_stage_duration_seconds', 'histogram',
+               "Time spent per pipeline stage, court host and outcome", samples)
+        yield ('ecourts_events_total', 'counter', "Structured events logged, by event and outcome",
+               [('', {'event': event, 'outcome': outcome}, count) for (event, outcome), count in events])
+
+
+_sinks: Optional[list] = None
+_sinks_lock = threading.Lock()
+_collectors: List[Callable[[], Iterable]] = []
+
+
+def _build_sinks():
+    sinks = []
+    for name in os.getenv('TELEMETRY_SINKS', 'prometheus,logging').split(','):
+        name = name.strip()
+        if name == 'prometheus':
+            sinks.append(PrometheusSink())
+        elif name == 'logging':
+            sinks.append(LoggingSink())
+        elif name == 'json':
+            path = os.getenv('TELEMETRY_LOG_PATH')
+            sinks.append(JsonLogSink(open(path, 'a', encoding='utf-8') if path else None))
+        elif name:
+            logger.warning("Unknown telemetry sink '%s'", name)
+    return sinks
+
+
+def get_sinks() -> list:
+    """The active sinks, configured from TELEMETRY_SINKS on first use"""
+    global _sinks
+    if _sinks is None:
+        with _sinks_lock:
+            if _sinks is None:
+                _sinks = _build_sinks()
+    return _sinks
+
+
+def add_sink(sink):
+    """Register another sink; it needs record_span(span) and record_event(event, fields)"""
+    get_sinks().append(sink)
+
+
+def get_prometheus_sink() -> Optional[PrometheusSink]:
+    return next((sink for sink in get_sinks() if isinstance(sink, PrometheusSink)), None)
+
+
+@contextmanager
+def span(stage: str, host: Optional[str] = None, **fields):
+    """
+    Time a stage. Works around awaits as well, so one context manager
+    serves the sync and async scrapers.
+
+        with span('details', scraper.host, cino=cino) as s:
+            response = ...
+            if response is None:
+                s.set('error')
+    """
+    sinks = get_sinks()
+    current = Span(stage, host, **fields)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.set('error', error=type(e).__name__)
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        for sink in sinks:
+            sink.record_span(current)
+
+
+def log(event: str, level: str = 'info', **fields):
+    """
+    Record a structured event, e.g. log('search', outcome='found', attempts=2).
+    `level` is one of debug, info, warning and error; debug events are
+    not counted in the metrics.
+    """
+    fields['level'] = level
+    for sink in get_sinks():
+        sink.record_event(event, fields)
+
+
+@contextmanager
+def trace(trace_id: Optional[str] = None):
+    """Give the spans and events inside one trace id (a new one by default)"""
+    token = _trace_id.set(trace_id or uuid.uuid4().hex[:16])
+    try:
+        yield _trace_id.get()
+    finally:
+        _trace_id.reset(token)
+
+
+def register_collector(collector: Callable[[], Iterable]):
+    """
+    Add metrics read at scrape time, e.g. counters other components keep.
+    A collector returns (name, type, help, samples) families where each
+    sample is (name suffix, labels, value).
+    """
+    _collectors.append(collector)
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def render_metrics() -> str:
+    """All sink and collector metrics in the Prometheus text format"""
+    families = []
+    sink = get_prometheus_sink()
+    if sink is not None:
+        families.extend(sink.collect())
+    for collector in _collectors:
+        try:
+            families.extend(collector())
+        except Exception as e:
+            logger.warning("Metrics collector failed: %s", e)
+
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for suffix, labels, value in samples:
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+    return '\n'.join(lines) + '\n'